@@ -0,0 +1,196 @@
+"""
+Benchmarks for how scene generation scales: the rain at 100 to 100,000 drops, the city at different
+numbers of rows and road lengths, and the heli, car and camera animators at different frame rates.
+
+Everything runs headless against MemorySceneBackend (the in-memory stand-in for maya), and each run
+is saved as JSON named after the current git commit, so runs can be compared across commits (the
+results are machine specific, citaFinal/benchmarks/ is kept out of git):
+
+    python benchmarkSceneGeneration.py
+    python benchmarkSceneGeneration.py --quick
+    python benchmarkSceneGeneration.py --compare ../benchmarks/1f485d7.json ../benchmarks/abc1234.json
+
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import mayaFinalCodeNov28 as scene
+
+RAIN_SIZES = [100, 1000, 10000, 100000]
+# (rows of buildings, length of road the city covers)
+CITY_SIZES = [(4, 6000), (12, 6000), (12, 24000), (24, 24000)]
+FRAME_RATES = [24, 60, 120, 240]
+MOVERS = [scene.Helicopter, scene.Car, scene.CarCam, scene.HeliInsideCam, scene.HeliSideCam]
+
+
+# git commit of the scene code being measured, results are saved under this name
+def currentCommit():
+    folder = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=folder,
+                                         stderr=subprocess.STDOUT).decode('utf-8').strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                        cwd=folder).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, bool(dirty)
+
+
+# run setup() then run(*setup()) repeat times, timing only run, then once more under tracemalloc for its memory
+# run returns the KeyframeBuffer it keyed into (or None), keys are counted on that, nodes on the backend
+def measure(benchmark, params, setup, run, repeat):
+    best = None
+    for i in range(repeat):
+        args = setup()
+        backend = args[0]
+        nodes = backend.nodeCount()
+        start = time.perf_counter()
+        keys = run(*args)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best['seconds']:
+            best = {'seconds': seconds, 'nodes': backend.nodeCount() - nodes,
+                    'keys': keys.num_keys_buffered if keys is not None else 0,
+                    'keys_written': keys.num_keys_out if keys is not None else 0}
+
+    args = setup()
+    tracemalloc.start()
+    run(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result = {'benchmark': benchmark, 'params': params, 'seconds': best['seconds'], 'nodes': best['nodes'],
+              'keys': best['keys'], 'keys_written': best['keys_written'],
+              'keys_per_s': best['keys'] / best['seconds'] if best['seconds'] else None,
+              'nodes_per_s': best['nodes'] / best['seconds'] if best['seconds'] else None,
+              'peak_memory_bytes': peak}
+    print('%-10s %-56s %9.3fs %10d keys %8d nodes %9.1f MB' % (
+        benchmark, json.dumps(params, sort_keys=True), result['seconds'], result['keys'], result['nodes'],
+        peak / 1e6))
+    return result
+
+
+# tolerance is the positionTolerance / rotationTolerance keys are simplified with, None keys every frame
+# like main() does by default
+def benchmarkRain(numRaindrops, particles, tolerance, repeat, seed):
+    def setup():
+        backend = scene.MemorySceneBackend()
+        backend.createNode('transform', 'raindrop')
+        animation = scene.FinalAnimation('', 'Mac', backend, scene.SceneRandom(seed), scene.SimulationPool(1))
+        return backend, animation
+
+    def run(backend, animation):
+        keys = scene.KeyframeBuffer(backend, positionTolerance=tolerance, rotationTolerance=tolerance)
+        animation.rainSimulation(numRaindrops, keys, particles)
+        keys.flush()
+        return keys
+
+    return measure('rain', {'drops': numRaindrops, 'particles': particles, 'tolerance': tolerance}, setup, run,
+                   repeat)
+
+
+def benchmarkCity(rows, length, instanced, repeat, seed):
+    # rows split evenly between the two sides of the road, 100 apart like the animation's city
+    roadSides = [-100 * (i + 1) for i in range(rows // 2)] + [100 * (i + 1) for i in range(rows - rows // 2)]
+    zs = range(-2000, -2000 + length, 100)
+
+    def setup():
+        backend = scene.MemorySceneBackend()
+        return backend, scene.City('', 'Mac', backend, scene.SceneRandom(seed))
+
+    def run(backend, city):
+        city.generateBuildings(instanced, roadSides, zs)
+
+    return measure('city', {'rows': rows, 'length': length, 'instanced': instanced}, setup, run, repeat)
+
+
+def benchmarkMover(moverClass, FPS, repeat):
+    def setup():
+        backend = scene.MemorySceneBackend()
+        name = backend.createNode('transform', moverClass.__name__)
+        args = () if moverClass in (scene.Helicopter, scene.Car) else (name,)
+        mover = moverClass(*args, backend=backend)
+        mover.FPS = FPS
+        return backend, name, mover
+
+    def run(backend, name, mover):
+        keys = scene.KeyframeBuffer(backend)
+        scene.keyChannels(name, mover.simulate(), keys, backend)
+        keys.flush()
+        return keys
+
+    return measure('animator', {'mover': moverClass.__name__, 'FPS': FPS}, setup, run, repeat)
+
+
+def runBenchmarks(quick=False, repeat=1, seed=0):
+    results = []
+    for numRaindrops in RAIN_SIZES[:2] if quick else RAIN_SIZES:
+        # the default, simplified curves, and particles (which have no curves to simplify)
+        for particles, tolerance in ((False, None), (False, 0.1), (True, None)):
+            results.append(benchmarkRain(numRaindrops, particles, tolerance, repeat, seed))
+    for rows, length in CITY_SIZES[:2] if quick else CITY_SIZES:
+        for instanced in (False, True):
+            results.append(benchmarkCity(rows, length, instanced, repeat, seed))
+    for moverClass in MOVERS:
+        for FPS in FRAME_RATES[:2] if quick else FRAME_RATES:
+            results.append(benchmarkMover(moverClass, FPS, repeat))
+    return results
+
+
+def saveResults(results, folder):
+    commit, dirty = currentCommit()
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    path = os.path.join(folder, commit + ('-dirty' if dirty else '') + '.json')
+    with open(path, 'w') as f:
+        json.dump({'commit': commit, 'dirty': dirty, 'date': datetime.datetime.now().isoformat(),
+                   'python': sys.version.split()[0], 'platform': platform.platform(),
+                   'results': results}, f, indent=2)
+    print('saved ' + path)
+    return path
+
+
+# print how each benchmark in both files changed (new seconds / old seconds, below 1 is faster)
+def compareResults(oldPath, newPath):
+    with open(oldPath) as f:
+        old = json.load(f)
+    with open(newPath) as f:
+        new = json.load(f)
+    key = lambda result: (result['benchmark'], json.dumps(result['params'], sort_keys=True))
+    old_results = dict((key(result), result) for result in old['results'])
+    print('%-10s %-56s %10s %10s %7s %7s' % ('', '', old['commit'], new['commit'], 'time', 'memory'))
+    for result in new['results']:
+        before = old_results.get(key(result))
+        if before is None:
+            continue
+        print('%-10s %-56s %9.3fs %9.3fs %6.2fx %6.2fx' % (
+            result['benchmark'], key(result)[1], before['seconds'], result['seconds'],
+            result['seconds'] / before['seconds'] if before['seconds'] else float('nan'),
+            float(result['peak_memory_bytes']) / before['peak_memory_bytes'] if before['peak_memory_bytes']
+            else float('nan')))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark headless scene generation')
+    parser.add_argument('--quick', action='store_true', help='only the smaller sizes')
+    parser.add_argument('--repeat', type=int, default=1, help='time each benchmark this many times, keep the best')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=os.path.join(scene.citaFinalDirectory(), 'benchmarks'),
+                        help='folder to save results in')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two saved results')
+    args = parser.parse_args(argv)
+    if args.compare:
+        compareResults(*args.compare)
+        return
+    saveResults(runBenchmarks(args.quick, args.repeat, args.seed), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -21,351 +21,868 @@ application aside from pasting and executing the code.
 
 """
 
-import pymel.core as pm  # use for poly modeling
 import random  # use for random positioning, random velocities
-import maya.cmds as cm
+import numpy as np  # use for batched (vectorized) simulations
+import bisect  # use to look up which keyed segment a frame falls in
+import concurrent.futures  # use to run the simulations in worker processes
+import contextlib
+import multiprocessing
+import fnmatch
+import hashlib  # use to derive independent, reproducible random streams from the scene seed
+import json
+import logging  # use for warnings outside maya
+import math
+import operator
+import os
+import struct  # use to write the header of trajectory cache files
+import tempfile
 import platform  # use to determine current os, filepath structure is dependent on this
+import sys
+import threading
+import time  # use to time each stage of main()
+import tracemalloc  # use to measure each stage's peak memory
+import types
 
+try:
+    import pymel.core as pm  # use for poly modeling
+    import maya.cmds as cm
+    import maya.api.OpenMaya as om  # use to make many connections in one go
+except ImportError:
+    # no maya here (render farm workers, CI boxes), the scene gets built by MemorySceneBackend instead
+    pm = cm = om = None
 
+logger = logging.getLogger(__name__)
+
+
+# frameWindow = (first frame, last frame) only keys the animation inside that window (see main)
 class FinalAnimation:
-    def __init__(self, filePathToCitaFinal, os):
+    def __init__(self, filePathToCitaFinal, os, backend=None, sceneRandom=None, pool=None, cache=None,
+                 frameWindow=None, spatialIndex=None, levelOfDetail=None, materials=None, meshCache=None):
         self.filepath_to_citaFinal = filePathToCitaFinal
         self.os = os
+        self.backend = backend if backend is not None else defaultSceneBackend()
+        self.scene_random = sceneRandom if sceneRandom is not None else SceneRandom()
+        self.pool = pool if pool is not None else SimulationPool(1)
+        self.cache = cache if cache is not None else SimulationCache()
+        self.frame_window = frameWindow
+        self.spatial_index = spatialIndex if spatialIndex is not None else SpatialIndex()
+        self.level_of_detail = levelOfDetail  # LevelOfDetail to switch streetlight detail with, None for full detail
+        self.materials = materials if materials is not None else MaterialLibrary(self.backend)
+        self.mesh_cache = meshCache  # MeshCache to load the .obj files through, None to import them
 
     # NOTE: HELICOPTER MODEL AND AUDI MODEL FOUND AT TURBOSQUID.COM
     # I ONLY ASSIGNED NEW MATERIALS TO THEIR FACES
     # define a method to import your scaled .obj files!
-    def getObjFiles(self):
-
-        if self.os == "Mac":
-            objFilePath = self.filepath_to_citaFinal + "/objFiles/"
-        elif self.os == "Windows":
-            objFilePath = self.filepath_to_citaFinal + "\\objFiles\\"
-
-        fileType = "obj"
-
-        files = cm.getFileList(folder=objFilePath, filespec='*.%s' % fileType)
-        if len(files) == 0:
-            cm.warning("No files found")
+    # paths are the .obj files (default objFilePaths), meshes what loadObjFiles loaded from them, if it already has
+    def getObjFiles(self, paths=None, meshes=None):
+        if paths is None:
+            paths = self.objFilePaths()
+        if len(paths) == 0:
+            self.backend.warning("No files found")
         else:
-            for f in files:
-                cm.file(objFilePath + f, i=True)
+            if meshes is None:
+                meshes = self.loadObjFiles(paths)
+            if meshes is None:
+                for path in paths:
+                    self.backend.importFile(path)
+            else:
+                for fileMeshes in meshes:
+                    for mesh in fileMeshes:
+                        self.backend.createMesh(mesh.name, mesh)
 
+        # .mb files are maya's own binary format already, there's no text to skip parsing
         if self.os == "Mac":
             mbFilePath = self.filepath_to_citaFinal + "/mbFiles/"  # want the mb for audi,heli,ramp
         elif self.os == "Windows":
             mbFilePath = self.filepath_to_citaFinal + "\\mbFiles\\"  # want the mb for audi,heli,ramp
 
         fileType = "mb"
-        files = cm.getFileList(folder=mbFilePath, filespec='*.%s' % fileType)
+        files = self.backend.getFileList(mbFilePath, '*.%s' % fileType)
         if len(files) == 0:
-            cm.warning("No files found")
+            self.backend.warning("No files found")
         else:
             for f in files:
-                cm.file(mbFilePath + f, i=True)
+                self.backend.importFile(mbFilePath + f)
+
+    # the .obj files in objFiles/
+    def objFilePaths(self):
+        if self.os == "Mac":
+            objFilePath = self.filepath_to_citaFinal + "/objFiles/"
+        elif self.os == "Windows":
+            objFilePath = self.filepath_to_citaFinal + "\\objFiles\\"
+
+        fileType = "obj"
+        return [objFilePath + f for f in self.backend.getFileList(objFilePath, '*.%s' % fileType)]
+
+    # the meshes in each of paths, through the mesh cache (None without one, the files get imported instead)
+    # doesn't touch the scene, so it can run on another thread while the scene is built (see StageGraph)
+    def loadObjFiles(self, paths):
+        if self.mesh_cache is None:
+            return None
+        # converted to binary meshes the first time (all the files at once), memory mapped from then on
+        return self.mesh_cache.loadAll(paths)
 
     def centerAllPivots(self):
 
         allObjs = ['heli', 'raindrop', 'car', 'streetlight']
         for name in allObjs:
-            pm.select(name)
-            cm.xform(cp=True)
+            self.backend.centerPivot(name)
             # cm.makeIdentity(name,t=True,a=True)
-            pm.move(name, 0, 0, 0, a=True)
+            self.backend.move(name, 0, 0, 0)
 
     # define method to initialize all object positions (except for raindrops, that's handled by rainSimulation())
-    def initialize_objects(self):
+    # lampSpacing is how far apart the streetlights are along each side of the road, from roadStart to roadEnd
+    def initialize_objects(self, lampSpacing=100, roadStart=-2000, roadEnd=2000):
         # generateBuildings()
-        pm.select('car')
-        pm.move(0, 0, -1900, a=True)
+        self.backend.move('car', 0, 0, -1900)
 
-        pm.select('heli')
-        pm.move(0, 0, 0, a=True)
-        pm.move(0, 400, -1950, a=True)
+        self.backend.move('heli', 0, 0, 0)
+        self.backend.move('heli', 0, 400, -1950)
 
         # generate rows of streetlights along each side of road
         # road goes from -25 -> +25
         # so set street lightrows at -28, +28
         roadSides = [-28, 28]
-        i = 1
-        # first select streetlight and center it at origin
-        pm.select('streetlight')
-        pm.move(0, 0, 0, a=True)
+        # first center streetlight at origin
+        self.backend.move('streetlight', 0, 0, 0)
 
         # create shader of type blinn because blinn extends class lambert
         lampmaterialName = "lampmaterial"  #
-        lampMaterial = pm.nodetypes.Blinn(n=lampmaterialName)  # will be black metal
-        # lamppost is metal -> reflective
-        lampMaterial.setReflectivity(.8)
+        # will be black metal, lamppost is metal -> reflective
         # store each unique value of triple as r,g,b, set material color using them
         r, g, b = 0, 0, 0
-        color = pm.datatypes.Color(r, g, b)
-        lampMaterial.setColor(color)
-        for side in roadSides:
-            for z in range(-2000, 2000, 100):
-                pm.instance('streetlight', n='light' + str(i))
-                pm.select('light' + str(i))
-                cm.hyperShade(assign=lampmaterialName)
-                pm.move(side, 0, z)
-                i += 1
+        lampmaterialName = self.materials.material(lampmaterialName, color=(r, g, b), reflectivity=.8)
+        # light1...lightn, one side of the road then the other
+        zs = np.arange(roadStart, roadEnd, lampSpacing)
+        light_positions = np.stack([np.repeat(roadSides, len(zs)), np.zeros(len(roadSides) * len(zs)),
+                                    np.tile(zs, len(roadSides))], axis=1)
+        light_names = ['light' + str(i + 1) for i in range(len(light_positions))]
+        # every light made at once, and the (shared) lamp material assigned to all of them once
+        if self.level_of_detail is None:
+            light_names = self.backend.instanceArray('streetlight', light_names, light_positions,
+                                                     material=lampmaterialName)
+        else:
+            boxMin, boxMax = MODEL_BOUNDS['streetlight']
+            light_levels = self.level_of_detail.levelsOf(
+                'streetlight', light_positions + np.add(boxMin, boxMax) / 2.0,
+                max(np.subtract(boxMax, boxMin).tolist()))
+            light_names = self.level_of_detail.placeArray('streetlight', 'streetlight', light_names, light_positions,
+                                                          light_levels, material=lampmaterialName)
+        self.spatial_index.addBoxes(light_names, *modelBoxes('streetlight', light_positions), kind='streetlight')
         # after doing this delete the initial streetlight (imported to the origin)
-        pm.select('streetlight')
-        pm.delete()
+        self.backend.delete('streetlight')
+        if self.level_of_detail is not None:
+            self.level_of_detail.deleteLevelMeshes('streetlight')
 
         # set up ramp model i built
-        pm.select('ramp')
-        pm.move(0, 0, 1500)
+        self.backend.move('ramp', 0, 0, 1500)
 
-    def animateCarAndHeli(self):
-        heli = Helicopter()
-        heli.animate()
+    # simulations is what simulateCarAndHeli returned, if it's been called already
+    def animateCarAndHeli(self, keys=None, simulations=None):
+        heli, car = simulations if simulations is not None else self.simulateCarAndHeli()
+        keyArrays('heli', heli, keys, self.backend)
+        keyArrays('car', car, keys, self.backend)
 
-        car = Car()
-        car.animate()
+    # keys of the heli and the car, without touching the scene
+    def simulateCarAndHeli(self):
+        # simulate both at once
+        heli = self.cache.submitMover(self.pool, Helicopter, frameWindow=self.frame_window)
+        car = self.cache.submitMover(self.pool, Car, frameWindow=self.frame_window)
+        return heli.result(), car.result()
 
     # method to create a simulation of (numRaindrops) falling raindrops
-    def rainSimulation(self, numRaindrops):
+    # keys go into the KeyframeBuffer if one is given, otherwise they are written right away
+    # particles=True puts every drop in one particle object instead (see rainParticles)
+    # with cameraPaths (see CameraTeam.cameraPaths) only the drops some camera frames are made at all
+    # plan is what planRain returned for the same drops, if it's been called already
+    def rainSimulation(self, numRaindrops, keys=None, particles=False, cameraPaths=None, plan=None):
 
         # first assign blue water-esque material to raindrop
 
         # create shader of type blinn because blinn extends class lambert
         materialName = "raindropmaterial"  # name each concrete material
-        raindropmaterial = pm.nodetypes.Blinn(n=materialName)
-        # concrete not reflective
-        raindropmaterial.setReflectivity(.6)  # water is a bit reflective
-
+        # water is a bit reflective
         # store each unique value of triple as r,g,b, set material color using them
         r, g, b = 111, 185, 218
-        color = pm.datatypes.Color(r, g, b)
-        raindropmaterial.setColor(color)
-
-        pm.select('raindrop')
-        cm.hyperShade(assign=materialName)
-
-        # init lists of x y z positions and  x, y, z velocities
-        # each index position across all lists reps 1 particle
-        # list to store ith object's x y z position
-        xpos_list = []
-        ypos_list = []
-        zpos_list = []
-        # lists to store ith object's x y z velocity (don't want just a vertical path )
-        xvel_list = []
-        yvel_list = []
-        zvel_list = []
+        materialName = self.materials.material(materialName, color=(r, g, b), reflectivity=.6)
+
+        self.backend.assign('raindrop', materialName)
+
+        if plan is None:
+            plan = self.planRain(numRaindrops, particles, cameraPaths)
+        drops, start_positions, (xaccel, yaccel, zaccel), mins, maxs, trajectories = plan
+
+        if particles:
+            shape = self.rainParticles(start_positions, (xaccel, yaccel, zaccel), frameWindow=self.frame_window)
+            # particles have no transforms, so they go in the index as their components
+            self.spatial_index.addBoxes(['%s.pt[%d]' % (shape, i) for i in range(len(drops))], mins, maxs,
+                                        kind='raindrop')
+            return shape
+
         # list to store object names raindrop1...raindropi...raindrop(numRaindrops)
         raindrop_list = []
-        # frames per second constant
-        FPS = 24
         # initialize the lists such that indices 0-(numRaindrops-1) represent n df particles
-        for i in range(numRaindrops):
-            # only care about area between the two rows of buildings (X)
-            # want the drops to start at / around the height of the tallest buildings (500),
-            # seen above in the generateBuildings method (Y)
-            # only care about area along the road (Z)
-            xpos, ypos, zpos = random.randint(-100, 100), random.randint(300, 600), random.randint(-1500, 4000)
-            xvel, yvel, zvel = 0, 0, 0  # initially all velocities 0
+        for i, drop in enumerate(drops.tolist()):
+            xpos, ypos, zpos = start_positions[i].tolist()
 
             # uniquely name each instance so setKeyframe can be used with obj name, add the name to the raindrop_list
-            objname = 'raindrop' + str(i + 1)
+            objname = 'raindrop' + str(drop + 1)
             raindrop_list.append(objname)
 
-            # add x y z positions to respective lists
-            xpos_list.append(xpos)
-            ypos_list.append(ypos)
-            zpos_list.append(zpos)
-
-            # add x y z velocities to respective lists
-            xvel_list.append(xvel)
-            yvel_list.append(yvel)
-            zvel_list.append(zvel)
-
             # create an instance of the raindrop I already modeled
-            # pm.instance automatically creates 'raindrop1','raindrop2',etc. which is
-            # why i used str(i+1) above to refer to these respective objects
-            pm.instance('raindrop')
+            self.backend.instance('raindrop', objname)
 
-            # move that instance to its initial x y z position by indexing the lists for x y z position
-            # where index i refers to the current object
-            pm.move(xpos_list[i], ypos_list[i], zpos_list[i])
+            # move that instance to its initial x y z position
+            self.backend.move(objname, xpos, ypos, zpos)
+        self.spatial_index.addBoxes(raindrop_list, mins, maxs, kind='raindrop')
 
+        # key each drop up to the frame it hits the ground (or only the frames of the frame window)
+        firstFrame = 1 if self.frame_window is None else self.frame_window[0]
+        buffer = keys if keys is not None else KeyframeBuffer(self.backend)
+        i = 0
+        for values, counts in trajectories:
+            end = 0
+            for count in counts.tolist():
+                start, end = end, end + count
+                frames = np.arange(firstFrame, firstFrame + count)
+                buffer.addKeys(raindrop_list[i], "translateX", frames, values[start:end, 0])
+                buffer.addKeys(raindrop_list[i], "translateY", frames, values[start:end, 1])
+                buffer.addKeys(raindrop_list[i], "translateZ", frames, values[start:end, 2])
+                i += 1
+        if keys is None:
+            buffer.flush()
+
+        # now delete original raindrop located at origin
+        self.backend.delete('raindrop')
+
+    # everything about the drops rainSimulation makes that doesn't touch the scene:
+    # (drops, start positions, acceleration, mins, maxs, trajectories) where drops are the numbers of the drops
+    # kept (all of them without cameraPaths), mins, maxs the boxes they sweep out (see rainBoxes), and trajectories
+    # the (values, counts) of each chunk of them (see RainSolver.window), None for particles
+    def planRain(self, numRaindrops, particles=False, cameraPaths=None):
+        # each row of start_positions reps 1 particle
+        start_positions = self.scene_random.rainStartPositions(numRaindrops)
         # acceleration will be a constant, so define these outside of for loop
         # use x y and z so it looks like wind blowing
-        xaccel, yaccel, zaccel = random.randint(-2, 2), -9.8, random.randint(-2, 2)
-
-        # loop through object names, use enumerate to keep track of index position
-        # (index position i is the identifier of unique object i across all lists)
-        for i, objname in enumerate(raindrop_list):
-            # start with framenumber 1 for each object
-            frameNum = 1
-
-            # keep updating x, y, z position AND velocity of current object and subsequently setting keyframe
-            # until that object hits the ground!
-
-            while ypos_list[i] > 0:
-                # keyframe translate x
-                cm.setKeyframe(objname, time=frameNum, attribute="translateX", value=xpos_list[i])
-                xvel_list[i] = xvel_list[i] + xaccel * 1.0 / FPS
-                xpos_list[i] = xpos_list[i] + xvel_list[i] * 1.0 / FPS
-
-                # keyframe translate y
-                cm.setKeyframe(objname, time=frameNum, attribute="translateY", value=ypos_list[i])
-                yvel_list[i] = yvel_list[i] + yaccel * 1.0 / FPS
-                ypos_list[i] = ypos_list[i] + yvel_list[i] * 1.0 / FPS
-
-                # keyframe translate z
-                cm.setKeyframe(objname, time=frameNum, attribute="translateZ", value=zpos_list[i])
-                zvel_list[i] = zvel_list[i] + zaccel * 1.0 / FPS
-                zpos_list[i] = zpos_list[i] + zvel_list[i] * 1.0 / FPS
-
-                # go to next frame
-                frameNum += 1
-            # now delete original raindrop located at origin
-        pm.select('raindrop')
-        pm.delete()
+        acceleration = self.scene_random.rainAcceleration()
+        mins, maxs = rainBoxes(start_positions, acceleration)
+        # drop i keeps its start position (and name) whichever drops are culled
+        if cameraPaths is None:
+            drops = np.arange(numRaindrops)
+        else:
+            drops = np.flatnonzero(self.framedRaindrops(start_positions, acceleration, mins, maxs, cameraPaths))
+        start_positions, mins, maxs = start_positions[drops], mins[drops], maxs[drops]
+        if particles:
+            return drops, start_positions, acceleration, mins, maxs, None
+
+        # integrate the drops chunk by chunk in the pool
+        chunks = [self.cache.submitRainChunk(self.pool, start_positions[first:first + size], acceleration,
+                                             self.frame_window)
+                  for first, size in self.pool.chunks(len(drops), SimulationPool.MIN_RAIN_CHUNK)]
+        return drops, start_positions, acceleration, mins, maxs, [chunk.result() for chunk in chunks]
+
+    # which drops some cam sees on some frame (see framedPoints), a drop lies where it landed once it has
+    # mins, maxs are the boxes the drops sweep out (see rainBoxes)
+    def framedRaindrops(self, startPositions, acceleration, mins, maxs, cameraPaths):
+        solver = RainSolver(startPositions, acceleration)
+        last_steps = np.maximum(solver.landingFrames() - 1, 0)
+        boxMin, boxMax = MODEL_BOUNDS['raindrop']
+        size = max(np.subtract(boxMax, boxMin).tolist())
+        return framedPoints(lambda frame, drops: solver.positionsAt(np.minimum(frame - 1, last_steps[drops]), drops),
+                            mins, maxs, size, cameraPaths)
+
+    # all the drops as one particle object, instead of a transform + 3 animation curves per drop
+    # each particle's position is worked out from its start position by an expression on every frame
+    # (same gravity + wind model as RainSolver), it dies on the frame it hits the ground
+    # and the raindrop model is drawn at every particle by an instancer at render time
+    # with a frameWindow the particles are born on its first frame, where the drops are by then
+    # (a drop that landed before it is born dead)
+    def rainParticles(self, startPositions, acceleration, FPS=24, frameWindow=None):
+        start_positions = np.asarray(startPositions, dtype=np.float64).reshape(-1, 3)
+        xaccel, yaccel, zaccel = acceleration
+        solver = RainSolver(start_positions, (xaccel, yaccel, zaccel), FPS)
+        landing_frames = solver.landingFrames()
+        if frameWindow is None:
+            positions, lifespans = start_positions, landing_frames
+        else:
+            firstFrame = frameWindow[0]
+            positions = solver.positionsAt(np.minimum(firstFrame - 1, np.maximum(landing_frames - 1, 0)))
+            lifespans = np.maximum(landing_frames - firstFrame + 1, 0)
+
+        shape = self.backend.particles('rainParticles', positions)
+        self.backend.setParticleAttr(shape, 'startPosition', start_positions)
+        # lifespan is in seconds, keyed frames 1...landing frame -> alive for landing frame / FPS
+        self.backend.setParticleAttr(shape, 'lifespanPP', lifespans / float(FPS))
+        self.backend.setAttr(shape + '.lifespanMode', 3)  # lifespanPP only
+        if frameWindow is not None:
+            self.backend.setAttr(shape + '.startFrame', frameWindow[0])
+        # frame 1 is the start position, see RainSolver.heightAt
+        self.backend.particleExpression(shape, (
+            'float $step = frame - 1;\n'
+            'position = startPosition + <<%r, %r, %r>> * ($step * ($step + 1) / %r);'
+        ) % (float(xaccel), float(yaccel), float(zaccel), 2.0 * FPS * FPS))
+        self.backend.particleInstancer(shape, 'raindrop')
+        # keep the original raindrop as the instanced model, just don't render it at the origin
+        self.backend.setAttr('raindrop.visibility', 0)
+        return shape
+
+
+# batched solver for the rain simulation
+# instead of stepping one drop at a time, every drop is integrated at once
+# as (N, 3) arrays of x y z positions and x y z velocities
+class RainSolver:
+    def __init__(self, startPositions, acceleration, FPS=24):
+        self.start_positions = np.array(startPositions, dtype=np.float64).reshape(-1, 3)
+        # acceleration is a constant shared by all the drops (gravity + wind)
+        self.acceleration = np.array(acceleration, dtype=np.float64).reshape(3)
+        self.FPS = FPS  # frames per second constant
+
+    # step all the drops until every one of them has hit the ground
+    # returns (trajectories, landing_frames) where
+    # trajectories[f, i] is the x y z position keyed for drop i on frame f + 1 and
+    # landing_frames[i] is the number of frames drop i is keyed on (frames 1...landing_frames[i])
+    def solve(self):
+        numRaindrops = len(self.start_positions)
+        landing_frames = np.zeros(numRaindrops, dtype=np.int64)
+        frames = []
+        for frameNum, (positions, falling) in enumerate(self.steps(), 1):
+            frames.append(positions)
+            landing_frames[falling] = frameNum
+
+        if frames:
+            trajectories = np.stack(frames)
+        else:
+            trajectories = np.empty((0, numRaindrops, 3))
+        return trajectories, landing_frames
+
+    # step all the drops one frame at a time, without keeping the frames
+    # yields (positions, falling) for frames 1, 2, ... as long as any drop is still falling,
+    # where falling marks the drops that are keyed on that frame
+    def steps(self):
+        positions = self.start_positions.copy()
+        velocities = np.zeros_like(positions)  # initially all velocities 0
+        falling = positions[:, 1] > 0  # a drop is keyed as long as it hasn't hit the ground
+        while falling.any():
+            yield positions, falling.copy()
+            # same explicit euler update as the old per-drop loop, same order of operations
+            # so the keyed values come out identical
+            velocities = velocities + self.acceleration * 1.0 / self.FPS
+            positions = positions + velocities * 1.0 / self.FPS
+            falling &= positions[:, 1] > 0
+
+    # every drop's position after steps frames (array of one step per drop), the euler steps in closed form
+    def positionsAt(self, steps, drops=slice(None)):
+        steps = np.asarray(steps, dtype=np.float64)
+        fall = (steps * (steps + 1)) / (2.0 * self.FPS * self.FPS)
+        return self.start_positions[drops] + self.acceleration * fall[:, None]
+
+    # keys of frames firstFrame...lastFrame only, jumping straight to firstFrame in closed form
+    # returns (values, counts) in the same packed form as solveRainChunk, but starting at firstFrame:
+    # drop i is keyed on frames firstFrame...firstFrame + counts[i] - 1 with the next counts[i] rows of values.
+    # a drop that landed before firstFrame gets one key there, where it was keyed last, so it stays put
+    def window(self, firstFrame, lastFrame):
+        landing_frames = self.landingFrames()
+        lastKeyed = np.minimum(lastFrame, np.maximum(landing_frames, firstFrame))
+        counts = np.where(landing_frames > 0, np.maximum(lastKeyed - firstFrame + 1, 0), 0)
+        drops = np.repeat(np.arange(len(counts)), counts)
+        # position in the run of keys of its drop
+        offsets = np.arange(len(drops)) - np.repeat(np.cumsum(counts) - counts, counts)
+        frames = np.minimum(firstFrame + offsets, landing_frames[drops])
+        return self.positionsAt(frames - 1, drops), counts
+
+    # height of every drop after step frames, the sum of the euler steps in closed form:
+    # velocity(step) = step * a / FPS, so position(step) = start + a * step * (step + 1) / (2 * FPS * FPS)
+    def heightAt(self, step):
+        return self.start_positions[:, 1] + self.acceleration[1] * (step * (step + 1)) / (2.0 * self.FPS * self.FPS)
+
+    # same landing_frames as solve(), without stepping (or storing) any of the frames
+    # the drop is keyed on frames 1...L where L is the first step its height is <= 0
+    def landingFrames(self):
+        falling = self.start_positions[:, 1] > 0
+        if not falling.any():
+            return np.zeros(len(falling), dtype=np.int64)
+        if self.acceleration[1] >= 0:
+            raise ValueError('raindrops only land if the y acceleration is negative')
+        # height <= 0 once step * (step + 1) >= c
+        c = 2.0 * self.FPS * self.FPS * np.maximum(self.start_positions[:, 1], 0) / -self.acceleration[1]
+        steps = np.maximum(np.ceil((np.sqrt(1 + 4 * c) - 1) / 2), 1)
+        # the square root can be off by one step either way right at the ground
+        steps = np.where(self.heightAt(steps) > 0, steps + 1, steps)
+        steps = np.where((steps > 1) & (self.heightAt(steps - 1) <= 0), steps - 1, steps)
+        return np.where(falling, steps, 0).astype(np.int64)
+
+
+# runs the simulations (rain chunks, vehicle and camera motion) in worker processes
+# they're pure arithmetic, so workers only send back arrays of keyframes and all the scene writes stay here
+# with workers=1 (or when the workers couldn't import this file) everything runs right away in this process
+class SimulationPool:
+    # fewer drops than this per chunk isn't worth sending to a worker
+    MIN_RAIN_CHUNK = 512
+    # with workers=None, a job only starts the workers once it has this many minimum sized chunks of items,
+    # starting them (each one imports numpy and this file) takes longer than a smaller job does in process
+    FAN_OUT_CHUNKS = 64
+
+    # workers=None simulates in this process until a job is big enough to be worth one worker per core
+    # (see chunks), a number starts that many workers up front (1 = no worker processes)
+    def __init__(self, workers=None):
+        self.max_workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.fan_out_later = workers is None
+        self.workers = 1
+        self.executor = None
+        if not self.fan_out_later:
+            self.start()
+
+    def start(self):
+        # workers re-import this file by its path, which a script pasted into maya doesn't have
+        if self.executor is None and self.max_workers > 1 and '__file__' in globals():
+            # spawn, forking a running maya isn't safe
+            context = multiprocessing.get_context('spawn')
+            executable = workerExecutable()
+            if executable is not None:
+                context.set_executable(executable)
+            self.executor = concurrent.futures.ProcessPoolExecutor(self.max_workers, mp_context=context)
+            self.workers = self.max_workers
+        self.fan_out_later = False
+
+    def submit(self, function, *args):
+        if self.executor is not None:
+            return self.executor.submit(function, *args)
+        future = concurrent.futures.Future()
+        future.set_result(function(*args))
+        return future
+
+    # (first, size) of the chunks to split numItems into, about one chunk per worker
+    def chunks(self, numItems, minChunk=1):
+        if self.fan_out_later and numItems >= minChunk * self.FAN_OUT_CHUNKS:
+            self.start()
+        size = max(-(-numItems // self.workers), minChunk)
+        return [(first, min(size, numItems - first)) for first in range(0, numItems, size)]
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+# python to start workers with, inside maya sys.executable is the maya app itself so use the mayapy next to it
+def workerExecutable():
+    folder, name = os.path.split(sys.executable)
+    if not name.lower().startswith('maya') or name.lower().startswith('mayapy'):
+        return None
+    for candidate in ('mayapy.exe', 'mayapy'):
+        if os.path.exists(os.path.join(folder, candidate)):
+            return os.path.join(folder, candidate)
+    return None
+
+
+# worker side of rainSimulation: solve a chunk of drops and pack only their keyed frames, drop after drop
+# returns (values, landing_frames), the keys of drop i are the next landing_frames[i] rows of values
+# with a frameWindow only the keys inside it, see RainSolver.window
+def solveRainChunk(startPositions, acceleration, frameWindow=None):
+    if frameWindow is not None:
+        return RainSolver(startPositions, acceleration).window(*frameWindow)
+    trajectories, landing_frames = RainSolver(startPositions, acceleration).solve()
+    keyed = np.arange(len(trajectories))[:, None] < landing_frames[None, :]
+    return trajectories.transpose(1, 0, 2)[keyed.T], landing_frames
+
+
+# worker side of the vehicles and cameras: simulate a fresh moverClass(*args) and return channelKeys
+# the motion doesn't depend on the scene, so the mover gets no backend (simulate never uses one)
+def simulateMover(moverClass, args=(), frameWindow=None):
+    return channelKeys(moverClass(*args).simulate(), frameWindow)
+
+
+# bump this when the way results are stored changes (what they're computed by is in the keys already,
+# see cacheFingerprint)
+SIMULATION_CACHE_VERSION = 2
+
+
+# hash of what a function does (its bytecode, names, constants and nested functions), but not where it is
+# in the file, so editing one class doesn't invalidate the cached results of the others
+def codeFingerprint(function):
+    code = function.__code__ if isinstance(function, types.FunctionType) else function
+    digest = hashlib.sha256(code.co_code)
+    digest.update(repr(code.co_names).encode('utf-8'))
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            digest.update(codeFingerprint(const).encode('utf-8'))
+        else:
+            digest.update(repr(const).encode('utf-8'))
+    if isinstance(function, types.FunctionType):
+        digest.update(repr(function.__defaults__).encode('utf-8'))
+    return digest.hexdigest()
+
+
+# fingerprint of every method of cls and its base classes
+def classFingerprint(cls):
+    parts = []
+    for klass in cls.__mro__:
+        for name, value in sorted(vars(klass).items()):
+            if isinstance(value, types.FunctionType):
+                parts.append(name + ':' + codeFingerprint(value))
+    return hashlib.sha256('/'.join(parts).encode('utf-8')).hexdigest()
+
+
+# code every cached stage goes through besides its own: the phases and channels the movers are simulated with,
+# the checkpoints they can resume from and the random streams the city and rain are drawn from
+def cacheFingerprint():
+    parts = [classFingerprint(KinematicPhase), classFingerprint(ChannelTrajectory), classFingerprint(SceneRandom)]
+    parts.extend(codeFingerprint(function) for function in (runPhases, newChannels, channelKeys, takeCheckpoint,
+                                                            restoreCheckpoint, simulateMover, solveRainChunk))
+    return hashlib.sha256('/'.join(parts).encode('utf-8')).hexdigest()
+
+
+# a result made of dicts, tuples, lists, numpy arrays, numbers and strings as (description, arrays):
+# the arrays, and how they nest with the rest as JSON, so it's stored without pickling
+def packResult(result, arrays):
+    if isinstance(result, np.ndarray):
+        if result.dtype.hasobject:
+            raise TypeError('an array of python objects can not be cached')
+        arrays.append(result)
+        return {'array': len(arrays) - 1}
+    if isinstance(result, dict):
+        return {'dict': [[packResult(key, arrays), packResult(value, arrays)] for key, value in result.items()]}
+    if isinstance(result, (tuple, list)):
+        return {type(result).__name__: [packResult(value, arrays) for value in result]}
+    if isinstance(result, np.generic):
+        result = result.item()
+    if result is None or isinstance(result, (bool, int, float, str)):
+        return {'value': result}
+    raise TypeError('a %s can not be cached' % type(result).__name__)
+
+
+def unpackResult(description, arrays):
+    kind, content = list(description.items())[0]
+    if kind == 'array':
+        return arrays[content]
+    if kind == 'dict':
+        return dict((unpackResult(key, arrays), unpackResult(value, arrays)) for key, value in content)
+    if kind == 'tuple':
+        return tuple(unpackResult(value, arrays) for value in content)
+    if kind == 'list':
+        return [unpackResult(value, arrays) for value in content]
+    return content
+
+
+# what a mover's simulation depends on: every value its __init__ sets (velocities, accelerations...)
+# plus its code, so changing one camera's acceleration only changes that camera's key
+def moverParams(moverClass, *args):
+    state = dict(vars(moverClass(*args)))
+    del state['backend']
+    return args, sorted(state.items()), classFingerprint(moverClass)
+
+
+# content addressed store of simulation results (keyframe arrays, building layouts), one .npz file per result
+# a stage whose parameters (and seed) hash the same as last run is reloaded from disk instead of recomputed
+# with no directory nothing is stored and every stage is computed
+# results are never pickled (see packResult), so reading a cache folder can't run code from it
+class SimulationCache:
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.reloaded = []  # stages loaded from disk this run
+        self.computed = []  # stages that had to be computed
+        self.code_fingerprint = cacheFingerprint()
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, stage, params):
+        return hashlib.sha256(repr((SIMULATION_CACHE_VERSION, self.code_fingerprint, stage, params)).encode(
+            'utf-8')).hexdigest()
+
+    def path(self, stage, key):
+        return os.path.join(self.directory, '%s-%s.npz' % (stage, key))
+
+    def load(self, stage, key):
+        if self.directory is None or not os.path.exists(self.path(stage, key)):
+            return None
+        with np.load(self.path(stage, key), allow_pickle=False) as data:
+            arrays = [data['array%d' % i] for i in range(len(data.files) - 1)]
+            return unpackResult(json.loads(str(data['description'])), arrays)
+
+    def save(self, stage, key, result):
+        if self.directory is None:
+            return
+        # write to a temporary file first, so a run that's killed halfway doesn't leave a broken result
+        # (its own file, whichever process or thread is saving the same result at the same time)
+        arrays = []
+        description = json.dumps(packResult(result, arrays))
+        with tempfile.NamedTemporaryFile(dir=self.directory, prefix=stage + '-', suffix='.tmp', delete=False) as f:
+            try:
+                np.savez(f, description=np.array(description),
+                         **dict(('array%d' % i, array) for i, array in enumerate(arrays)))
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, self.path(stage, key))
+
+    # result of function(*args) as a future, from disk if stage ran with the same params before,
+    # otherwise from the pool (and then saved). the future is only done once the result is saved,
+    # and failing to save it fails the future
+    def submit(self, pool, stage, params, function, *args):
+        key = self.key(stage, params)
+        result = self.load(stage, key)
+        if result is not None:
+            self.reloaded.append(stage)
+            future = concurrent.futures.Future()
+            future.set_result(result)
+            return future
+        self.computed.append(stage)
+        future = concurrent.futures.Future()
+        pool.submit(function, *args).add_done_callback(lambda done: self.saved(future, stage, key, done))
+        return future
+
+    # finish future with done's result once it's saved
+    def saved(self, future, stage, key, done):
+        try:
+            result = done.result()
+            self.save(stage, key, result)
+        except BaseException as exception:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    # same as submit, but computed right here
+    def cached(self, stage, params, function, *args):
+        return self.submit(SimulationPool(1), stage, params, function, *args).result()
+
+    # simulateMover through the cache
+    def submitMover(self, pool, moverClass, args=(), frameWindow=None):
+        params = (moverParams(moverClass, *args), frameWindow)
+        return self.submit(pool, moverClass.__name__, params, simulateMover, moverClass, args, frameWindow)
+
+    # solveRainChunk through the cache, keyed by the start positions themselves
+    def submitRainChunk(self, pool, startPositions, acceleration, frameWindow=None):
+        startPositions = np.ascontiguousarray(startPositions)
+        params = (startPositions.shape, hashlib.sha256(startPositions.tobytes()).hexdigest(), acceleration,
+                  frameWindow, classFingerprint(RainSolver), codeFingerprint(solveRainChunk))
+        return self.submit(pool, 'rain', params, solveRainChunk, startPositions, acceleration, frameWindow)
+
+    def report(self):
+        return 'reloaded %d cached stages, computed %d (%s)' % (
+            len(self.reloaded), len(self.computed), ', '.join(sorted(set(self.computed))) or 'none')
+
+
+# scene-wide seed plus independent random streams for each subsystem (buildings, rain, wind)
+# every stream is seeded from (seed, subsystem, block) alone, so any block of buildings or batch of
+# raindrops comes out bit-identical whether it's generated on its own, in any order or in another process
+class SceneRandom:
+    # raindrops are drawn in fixed size batches, each batch from its own stream
+    RAIN_BATCH_SIZE = 1024
+
+    def __init__(self, seed=None):
+        if seed is None:
+            # still pick (and keep) a seed so the run can be repeated
+            seed = random.SystemRandom().randint(0, 2 ** 32 - 1)
+        self.seed = seed
+
+    def streamSeed(self, subsystem, *block):
+        key = '/'.join(str(part) for part in (self.seed, subsystem) + block)
+        return int(hashlib.sha256(key.encode('utf-8')).hexdigest()[:16], 16)
+
+    # python random stream, e.g. stream('buildings', x, z) for the building at x, z
+    def stream(self, subsystem, *block):
+        return random.Random(self.streamSeed(subsystem, *block))
+
+    # numpy random stream, for drawing whole arrays at once
+    def arrayStream(self, subsystem, *block):
+        return np.random.default_rng(self.streamSeed(subsystem, *block))
+
+    # integer start positions of drops firstDrop...firstDrop + numRaindrops - 1 as a (numRaindrops, 3) array
+    # only care about area between the two rows of buildings (X)
+    # want the drops to start at / around the height of the tallest buildings (500),
+    # seen above in the generateBuildings method (Y)
+    # only care about area along the road (Z)
+    def rainStartPositions(self, numRaindrops, firstDrop=0):
+        low, high = [-100, 300, -1500], [101, 601, 4001]
+        batches = []
+        lastDrop = firstDrop + numRaindrops
+        for batch in range(firstDrop // self.RAIN_BATCH_SIZE, -(-lastDrop // self.RAIN_BATCH_SIZE)):
+            # always draw the whole batch so a drop's position doesn't depend on how many drops there are
+            batches.append(self.arrayStream('rain', batch).integers(low, high, size=(self.RAIN_BATCH_SIZE, 3)))
+        if not batches:
+            return np.empty((0, 3), dtype=np.int64)
+        offset = firstDrop % self.RAIN_BATCH_SIZE
+        return np.concatenate(batches)[offset:offset + numRaindrops]
+
+    # gravity plus a random wind in x and z, shared by all the drops
+    def rainAcceleration(self):
+        wind = self.stream('wind')
+        return wind.randint(-2, 2), -9.8, wind.randint(-2, 2)
+
+
+# builds each distinct shader network once. a material is asked for by its parameters (shader type, colors,
+# reflectivity, transparency, texture file, repeatUV), and asking again with the same ones gets back the
+# shader already made, under whatever name it was first made with. a texture's place2dTexture is shared by every
+# texture repeated the same number of times, and each network's connections are made in one go (connectAttrs)
+class MaterialLibrary:
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else defaultSceneBackend()
+        self.materials = {}  # parameters -> shader
+        self.placements = {}  # repeatUV -> place2dTexture
+        self.num_reused = 0  # requests answered with a shader that was already there
+
+    def __len__(self):
+        return len(self.materials)
+
+    # the shader for these parameters, built (called name) the first time they're asked for
+    # texture is the image file on its color, repeatUV how many times it's repeated across the surface,
+    # shadingGroup=True puts it in a shading group of its own (otherwise assigning it makes one)
+    # textureName and placementName name the file and place2dTexture nodes, they don't change the material
+    def material(self, name, shader='blinn', color=None, specularColor=None, reflectivity=None, transparency=None,
+                 ambientColor=None, texture=None, repeatUV=None, shadingGroup=False, textureName=None,
+                 placementName=None):
+        optional = lambda values: tuple(float(v) for v in values) if values is not None else None
+        key = (shader, optional(color), optional(specularColor), reflectivity, transparency, optional(ambientColor),
+               texture, optional(repeatUV), shadingGroup)
+        if key in self.materials:
+            self.num_reused += 1
+            return self.materials[key]
+
+        material = self.backend.shader(shader, name, color, specularColor, reflectivity, transparency, ambientColor)
+        connections = []
+        if texture is not None:
+            textureName = textureName if textureName is not None else name + 'File'
+            if repeatUV is None:
+                file_node = self.backend.shadingNode('file', textureName, asTexture=True)
+            else:
+                repeat = optional(repeatUV)
+                p2d = Place2DTexture(textureName, self.placements.get(
+                    repeat, placementName if placementName is not None else name + 'p2d'), self.backend)
+                file_node = p2d.createFileTexture(repeatUV[0], repeatUV[1], connections)
+                self.placements[repeat] = p2d.p2dName
+            self.backend.setAttr(file_node + '.fileTextureName', texture, type='string')
+            # file texture node on the shader's color
+            connections.append(('%s.outColor' % file_node, '%s.color' % material))
+        if shadingGroup:
+            # shader on the shading group's surface shader
+            connections.append(('%s.outColor' % material, '%s.surfaceShader' % self.backend.shadingGroup()))
+        self.backend.connectAttrs(connections)
+        self.materials[key] = material
+        return material
 
 
 # class for the road (texture mapping, plane creation)
 class Road:
-    def __init__(self, filePathToCitaFinal, width, length, os):
+    def __init__(self, filePathToCitaFinal, width, length, os, backend=None, materials=None):
         self.filepath_to_citaFinal = filePathToCitaFinal
         self.width = width
         self.length = length
         self.os = os
+        self.backend = backend if backend is not None else defaultSceneBackend()
+        self.materials = materials if materials is not None else MaterialLibrary(self.backend)
 
     def generate(self):
 
         # Create a mesh (plane) with above dims
-        pm.polyPlane(name='road', w=self.width, h=self.length)
-        pm.move(0, .3, 0)
+        self.backend.polyPlane('road', self.width, self.length)
+        self.backend.move('road', 0, .3, 0)
 
         # apply texture map using roadTexture image
-        # create a shader
-        shader = cm.shadingNode("blinn", asShader=True, n='roadTextureColor')
-        # a file texture node
-        file_node = cm.shadingNode("file", asTexture=True, n='roadTextureFile')  # "file" is node type
-        # a shading group
-
         if self.os == "Mac":
             file = self.filepath_to_citaFinal + "/images/roadTexture.jpg"
         elif self.os == "Windows":
             file = self.filepath_to_citaFinal + "\\images\\roadTexture.jpg"
 
-        shading_group = cm.sets(renderable=True, noSurfaceShader=True, empty=True)
-        # connect shader to sg surface shader
-        cm.connectAttr('%s.outColor' % shader, '%s.surfaceShader' % shading_group)
-        # connect file texture node to shader's color
-        cm.connectAttr('%s.outColor' % file_node, '%s.color' % shader)
-        cm.setAttr('roadTextureFile.fileTextureName', file, type='string')
-        cm.select('road')
-        cm.hyperShade(a='roadTextureColor')
+        # a blinn shader with the file texture on its color, in its own shading group
+        shader = self.materials.material('roadTextureColor', texture=file, textureName='roadTextureFile',
+                                         shadingGroup=True)
+        self.backend.assign('road', shader)
 
 
 # class for the ground plane (texture mapping, plane creation)
 class Ground:
-    def __init__(self, filePathToCitaFinal, width, length, os):
+    def __init__(self, filePathToCitaFinal, width, length, os, backend=None, materials=None):
         self.filepath_to_citaFinal = filePathToCitaFinal
         self.width = width
         self.length = length
         self.os = os
+        self.backend = backend if backend is not None else defaultSceneBackend()
+        self.materials = materials if materials is not None else MaterialLibrary(self.backend)
 
     def generate(self):
         # Create a mesh (plane) with above dims
-        pm.polyPlane(name='ground', w=self.width, h=self.length)
-        pm.move(0, -0.3, 0)
-        pm.rotate('0deg', '0deg', '0deg')
+        self.backend.polyPlane('ground', self.width, self.length)
+        self.backend.move('ground', 0, -0.3, 0)
+        self.backend.rotate('ground', 0, 0, 0)
 
         # apply texture map using ground image
-        # create a shader
-        shader = cm.shadingNode("blinn", asShader=True, n='groundTextureColor')
-        # a file texture node
-        file_node = cm.shadingNode("file", asTexture=True, n='groundTextureFile')  # "file" is node type
-        # a shading group
-
         if self.os == "Mac":
             file = self.filepath_to_citaFinal + "/images/cityGround.jpg"
         elif self.os == "Windows":
             file = self.filepath_to_citaFinal + "\\images\\cityGround.jpg"
 
-        shading_group = cm.sets(renderable=True, noSurfaceShader=True, empty=True)
-        # connect shader to sg surface shader
-        cm.connectAttr('%s.outColor' % shader, '%s.surfaceShader' % shading_group)
-        # connect file texture node to shader's color
-        cm.connectAttr('%s.outColor' % file_node, '%s.color' % shader)
-        cm.setAttr('groundTextureFile.fileTextureName', file, type='string')
-        cm.select('ground')
-        cm.hyperShade(a='groundTextureColor')
+        # a blinn shader with the file texture on its color, in its own shading group
+        shader = self.materials.material('groundTextureColor', texture=file, textureName='groundTextureFile',
+                                         shadingGroup=True)
+        self.backend.assign('ground', shader)
 
 
 # create this class to use its createFileTexture method within other classes
 class Place2DTexture:
-
-    def __init__(self, fileTextureName, p2dName):
+    # (place2dTexture attribute, file texture attribute) pairs to connect
+    CONNECTIONS = [('outUV', 'uvCoord'), ('outUvFilterSize', 'uvFilterSize'), ('vertexCameraOne', 'vertexCameraOne'),
+                   ('vertexUvOne', 'vertexUvOne'), ('vertexUvThree', 'vertexUvThree'), ('vertexUvTwo', 'vertexUvTwo'),
+                   ('coverage', 'coverage'), ('mirrorU', 'mirrorU'), ('mirrorV', 'mirrorV'), ('noiseUV', 'noiseUV'),
+                   ('offset', 'offset'), ('repeatUV', 'repeatUV'), ('rotateFrame', 'rotateFrame'),
+                   ('rotateUV', 'rotateUV'), ('stagger', 'stagger'), ('translateFrame', 'translateFrame'),
+                   ('wrapU', 'wrapU'), ('wrapV', 'wrapV')]
+
+    def __init__(self, fileTextureName, p2dName, backend=None):
         self.fileTextureName = fileTextureName
         self.p2dName = p2dName
-
-    def createFileTexture(self, i, j):
-        tex = pm.shadingNode('file', name=self.fileTextureName, asTexture=True, isColorManaged=True)
-        if not pm.objExists(self.p2dName):
-            pm.shadingNode('place2dTexture', name=self.p2dName, asUtility=True)
-        p2d = pm.PyNode(self.p2dName)
-        tex.filterType.set(0)
-        pm.connectAttr(p2d.outUV, tex.uvCoord)
-        pm.connectAttr(p2d.outUvFilterSize, tex.uvFilterSize)
-        pm.connectAttr(p2d.vertexCameraOne, tex.vertexCameraOne)
-        pm.connectAttr(p2d.vertexUvOne, tex.vertexUvOne)
-        pm.connectAttr(p2d.vertexUvThree, tex.vertexUvThree)
-        pm.connectAttr(p2d.vertexUvTwo, tex.vertexUvTwo)
-        pm.connectAttr(p2d.coverage, tex.coverage)
-        pm.connectAttr(p2d.mirrorU, tex.mirrorU)
-        pm.connectAttr(p2d.mirrorV, tex.mirrorV)
-        pm.connectAttr(p2d.noiseUV, tex.noiseUV)
-        pm.connectAttr(p2d.offset, tex.offset)
-        pm.connectAttr(p2d.repeatUV, tex.repeatUV)
+        self.backend = backend if backend is not None else defaultSceneBackend()
+
+    # connections is a list to add the connections to for the caller to make (with the rest of its network),
+    # otherwise they're all made here in one go
+    def createFileTexture(self, i, j, connections=None):
+        tex = self.backend.shadingNode('file', self.fileTextureName, asTexture=True, isColorManaged=True)
+        if not self.backend.objExists(self.p2dName):
+            self.p2dName = self.backend.shadingNode('place2dTexture', self.p2dName, asUtility=True)
+        p2d = self.p2dName
+        self.backend.setAttr(tex + '.filterType', 0)
+        pairs = [(p2d + '.' + p2dAttr, tex + '.' + texAttr) for p2dAttr, texAttr in self.CONNECTIONS]
+        if connections is not None:
+            connections.extend(pairs)
+        else:
+            self.backend.connectAttrs(pairs)
         # need to set place2dtexture's repeatUV to higher value than 1
         # to prevent texture stretching
-        pm.setAttr(p2d.repeatUV, (i, j))  # THIS WORKED!!! WOW I GUESSED HAHAHA
-        pm.connectAttr(p2d.rotateFrame, tex.rotateFrame)
-        pm.connectAttr(p2d.rotateUV, tex.rotateUV)
-        pm.connectAttr(p2d.stagger, tex.stagger)
-        pm.connectAttr(p2d.translateFrame, tex.translateFrame)
-        pm.connectAttr(p2d.wrapU, tex.wrapU)
-        pm.connectAttr(p2d.wrapV, tex.wrapV)
+        self.backend.setAttr(p2d + '.repeatUV', i, j, type='double2')  # THIS WORKED!!! WOW I GUESSED HAHAHA
         return tex
 
 
 # background class (texture mapping, plane creation)
 class Background:
-    def __init__(self, filePathToCitaFinal, width, height, os):
+    def __init__(self, filePathToCitaFinal, width, height, os, backend=None, materials=None):
         self.filepath_to_citaFinal = filePathToCitaFinal
         self.width = width
         self.height = height
         self.os = os
+        self.backend = backend if backend is not None else defaultSceneBackend()
+        self.materials = materials if materials is not None else MaterialLibrary(self.backend)
 
     def generate(self):
         # create mesh (plane) with above dims
-        pm.polyPlane(name='background', w=self.width, h=self.height)
-        pm.move(-20, 280, -2050)
-        pm.rotate('0deg', '90deg', '0deg')
+        self.backend.polyPlane('background', self.width, self.height)
+        self.backend.move('background', -20, 280, -2050)
+        self.backend.rotate('background', 0, 90, 0)
         # apply texture map using lightning  image
-        # create a shader
-        shader = cm.shadingNode("blinn", asShader=True, n='backgroundTextureColor')
-        cm.setAttr('{0}.specularColor'.format(shader), 0, 0, 0, type='double3')
-        # a file texture node
-        file_node = cm.shadingNode("file", asTexture=True, n='backgroundTextureFile')  # "file" is node type
-        # a shading group
         if self.os == "Mac":
             file = self.filepath_to_citaFinal + "/images/lightningstormbackground.jpg"
         elif self.os == "Windows":
             file = self.filepath_to_citaFinal + "\\images\\lightningstormbackground.jpg"
 
-        shading_group = cm.sets(renderable=True, noSurfaceShader=True, empty=True)
-        # connect shader to sg surface shader
-        cm.connectAttr('%s.outColor' % shader, '%s.surfaceShader' % shading_group)
-        # connect file texture node to shader's color
-        cm.connectAttr('%s.outColor' % file_node, '%s.color' % shader)
-        cm.setAttr('backgroundTextureFile.fileTextureName', file, type='string')
-        cm.select('background')
-        cm.hyperShade(a='backgroundTextureColor')
+        # a blinn shader (not shiny) with the file texture on its color, in its own shading group
+        shader = self.materials.material('backgroundTextureColor', specularColor=(0, 0, 0), texture=file,
+                                         textureName='backgroundTextureFile', shadingGroup=True)
+        self.backend.assign('background', shader)
 
 
 # world class, encapsulate the entire scene inside of a sphere
@@ -373,28 +890,21 @@ class Background:
 
 class World:
 
-    def __init__(self, filePathToCitaFinal, os):
+    def __init__(self, filePathToCitaFinal, os, backend=None, materials=None):
         self.filepath_to_citaFinal = filePathToCitaFinal
         self.os = os
+        self.backend = backend if backend is not None else defaultSceneBackend()
+        self.materials = materials if materials is not None else MaterialLibrary(self.backend)
 
     # I want to put the entire scene on the inside of a sphere to make the sky material continuous
 
     def generate(self):
-        worldSphere = pm.polySphere(n='world', r=4000)
-        pm.move(0, 0, 0)
+        worldSphere = self.backend.polySphere('world', 4000)
+        self.backend.move('world', 0, 0, 0)
 
         # since by default the inside of the object will be black due to single side lighting,
         # turn 2 sided lighting on
-        pm.displaySurface(['world'], two=True)
-
-        # now want to assign texture AND set repeat UV to prevent image stretching
-        materialName = "world_material"
-        worldMaterial = pm.nodetypes.Blinn(n=materialName)
-        # use a brick material texture file
-        # create p2d object of class defined above
-        p2d = Place2DTexture("worldTextureFile", "worldp2d")
-        file_node = p2d.createFileTexture(1, 3)
-        # a shading group
+        self.backend.displaySurface('world', twoSided=True)
 
         # get file name
         if self.os == "Mac":
@@ -402,27 +912,29 @@ class World:
         elif self.os == "Windows":
             file = self.filepath_to_citaFinal + "\\images\\lightningstormbackgroundCrop.jpg"
 
-        # connect file texture node to shader's color
-        pm.connectAttr('%s.outColor' % file_node, '%s.color' % worldMaterial)
-        pm.setAttr('worldTextureFile.fileTextureName', file, type='string')
-        specularColor = pm.datatypes.Color(0, 0, 0)
-        worldMaterial.setSpecularColor(specularColor)  # don't want it to be shiny
-        worldMaterial.setReflectivity(0)
-        ambientColor = pm.datatypes.Color(0.57,0.57,0.57) # want it somewhat bright, try to blend with the 
-        # already-positioned background plane
-        worldMaterial.setAmbientColor(ambientColor)
+        # now want to assign texture AND set repeat UV to prevent image stretching
+        # don't want it to be shiny
+        # want it somewhat bright, try to blend with the already-positioned background plane
+        worldMaterial = self.materials.material("world_material", specularColor=(0, 0, 0), reflectivity=0,
+                                                ambientColor=(0.57, 0.57, 0.57), texture=file, repeatUV=(1, 3),
+                                                textureName="worldTextureFile", placementName="worldp2d")
 
         # assign to world
-        pm.select('world')
-        cm.hyperShade(assign=materialName)
+        self.backend.assign('world', worldMaterial)
 
 
 # class to store all the buildings, building materials & whatnot
 class City:
 
-    def __init__(self, filePathToCitaFinal, os):
+    def __init__(self, filePathToCitaFinal, os, backend=None, sceneRandom=None, cache=None, spatialIndex=None,
+                 materials=None):
         self.filepath_to_citaFinal = filePathToCitaFinal
         self.os = os
+        self.backend = backend if backend is not None else defaultSceneBackend()
+        self.scene_random = sceneRandom if sceneRandom is not None else SceneRandom()
+        self.cache = cache if cache is not None else SimulationCache()
+        self.spatial_index = spatialIndex if spatialIndex is not None else SpatialIndex()
+        self.materials = materials if materials is not None else MaterialLibrary(self.backend)
 
     # method found at https://forums.autodesk.com/t5/maya-programming/how-to-create-a-file-node-place2dtexture-in-maya-sdk/td-p/6717342
     # trying to set repeat UV to 20 to keep brick texture from vertically stretching
@@ -446,91 +958,1660 @@ class City:
                 for i, triple in enumerate(concrete_triples):
                     # create shader of type blinn because blinn extends class lambert
                     materialName = "building_material_concrete_" + str(i)  # name each concrete material
-                    buildingMaterial = pm.nodetypes.Blinn(n=materialName)
                     # concrete not reflective
-                    buildingMaterial.setReflectivity(0)
-
                     # store each unique value of triple as r,g,b, set material color using them
                     r, g, b = triple[0], triple[1], triple[2]
-                    color = pm.datatypes.Color(r, g, b)
-                    buildingMaterial.setColor(color)
-                    building_materials_list.append(materialName)
+                    building_materials_list.append(self.materials.material(materialName, color=(r, g, b),
+                                                                           reflectivity=0))
 
             elif el == 'brick':
                 # just need one blinn material
                 # create shader of type blinn because blinn extends class lambert
                 materialName = "building_material_brick"  # name each concrete material
-                buildingMaterial = pm.nodetypes.Blinn(n=materialName)
                 # use a brick material texture file
-                p2d = Place2DTexture("brickTextureFile", "brickp2d")  # create p2d object of class defined above
-                file_node = p2d.createFileTexture(20, 20)
-                # a shading group
 
                 if self.os == "Mac":
                     file = self.filepath_to_citaFinal + "/images/brickTexture.jpg"
                 elif self.os == "Windows":
                     file = self.filepath_to_citaFinal + "\\images\\brickTexture.jpg"
 
-                # connect file texture node to shader's color
-                pm.connectAttr('%s.outColor' % file_node, '%s.color' % buildingMaterial)
-                pm.setAttr('brickTextureFile.fileTextureName', file, type='string')
-                specularColor = pm.datatypes.Color(0, 0, 0)
-                buildingMaterial.setSpecularColor(specularColor)
-                buildingMaterial.setReflectivity(0)
+                # repeat the texture 20 times each way to keep the bricks from stretching
+                buildingMaterial = self.materials.material(materialName, specularColor=(0, 0, 0), reflectivity=0,
+                                                           texture=file, repeatUV=(20, 20),
+                                                           textureName="brickTextureFile", placementName="brickp2d")
 
-                building_materials_list.append(materialName)
-                building_materials_list.append(materialName)  # double chances of brick,
+                building_materials_list.append(buildingMaterial)
+                building_materials_list.append(buildingMaterial)  # double chances of brick,
             # nicer than plane white all over
 
             else:
                 # glass
                 # set color to black with white specular to mimic reflectiveness, little bit of transparency
                 materialName = "building_material_glass"  # name each concrete material
-                buildingMaterial = pm.nodetypes.Blinn(n=materialName)
-                buildingMaterial.setTransparency(0.4)
-                color = pm.datatypes.Color(0, 0, 0)
-                buildingMaterial.setColor(color)
-                specularColor = pm.datatypes.Color(1, 1, 1)
-                buildingMaterial.setSpecularColor(specularColor)
-                buildingMaterial.setReflectivity(.8)
+                materialName = self.materials.material(materialName, color=(0, 0, 0), specularColor=(1, 1, 1),
+                                                       reflectivity=.8, transparency=0.4)
                 building_materials_list.append(materialName)
                 building_materials_list.append(materialName)
                 building_materials_list.append(materialName)
 
         # return list of materials
-        # this will only be called once, we don't need many copies of same materials
+        # the library hands back the same materials if this is called again, so there's only ever one copy
         return building_materials_list
 
     # since the road width is 50 and depth is 2000 and it is centered at the origin, then start at
     # -1000z,-40x, go to 1000z, -40x (do the same for +40x) and make buildings that are at most 15 units wide
 
-    def generateBuildings(self):
+    # random size and material of the building at x, z
+    # each building has its own random stream, so it comes out the same however the city is generated
+    def buildingAt(self, x, z, building_materials_list):
+        rng = self.scene_random.stream('buildings', x, z)
+        # 25 away from left side of road, let buildingx be max of 22
+        depth, height, width = rng.randint(50, 100), rng.randint(100, 500), rng.randint(50, 100)
+        # assign random color (materials) to each building
+        # (just by choosing random index from list of random building materials )
+        random_material_name = building_materials_list[rng.randint(0, len(building_materials_list) - 1)]
+        return depth, height, width, random_material_name
+
+    # x, z, depth, height, width and material of every building as a list of tuples, in building order
+    def layout(self, roadSides, zs, building_materials_list):
+        params = (self.scene_random.seed, list(roadSides), list(zs), list(building_materials_list),
+                  codeFingerprint(City.buildingAt))
+        return self.cache.cached('city', params, self.computeLayout, roadSides, zs, building_materials_list)
+
+    def computeLayout(self, roadSides, zs, building_materials_list):
+        return [(x, z) + self.buildingAt(x, z, building_materials_list) for x in roadSides for z in zs]
+
+    # instanced=True builds one unit cube per material and makes every building a scaled instance of one,
+    # so the city holds a handful of meshes no matter how many buildings it has
+    # roadSides (x of each row) and zs (z of each building in a row) default to the city in the animation
+    # with cameraPaths (see CameraTeam.cameraPaths) only the buildings some camera frames are built
+    def generateBuildings(self, instanced=False, roadSides=None, zs=None, cameraPaths=None):
         # row of randomly sized buildings on left side and right side of 2000 long road
         building_materials_list = self.generate_building_materials()
-        building_materials_list_length = len(building_materials_list)
-        roadSides = [-600, -500, -400, -300, -200, -100, 100, 200, 300, 400, 500,
-                     600]  # instead of just a row of buildings on each side,
-        # have a grid of buildings on each side
-        i = 0
-        for x in roadSides:
-            for z in range(-2000, 4000, 100):
-                # 25 away from left side of road, let buildingx be max of 22
-                depth, height, width = random.randint(50, 100), random.randint(100, 500), random.randint(50, 100)
-                pm.polyCube(name="building" + str(i), depth=depth, height=height, width=width)
-                pm.move(x, height / 2, z)
-
-                # assign random color (materials) to each building
-                # (just by choosing random index from list of random building materials )
-                random_material_name = building_materials_list[random.randint(0, building_materials_list_length - 1)]
-                cm.select('building' + str(i))
-                cm.hyperShade(assign=random_material_name)
-                i += 1
+        self.buildBuildings(*self.planBuildings(building_materials_list, roadSides, zs, cameraPaths),
+                            instanced=instanced)
+
+    # (layout, names) of the buildings generateBuildings builds with building_materials_list, without touching
+    # the scene
+    def planBuildings(self, building_materials_list, roadSides=None, zs=None, cameraPaths=None):
+        if roadSides is None:
+            roadSides = [-600, -500, -400, -300, -200, -100, 100, 200, 300, 400, 500,
+                         600]  # instead of just a row of buildings on each side,
+            # have a grid of buildings on each side
+        if zs is None:
+            zs = range(-2000, 4000, 100)
+        layout = self.layout(roadSides, zs, building_materials_list)
+        if cameraPaths is None:
+            built = np.arange(len(layout))
+        else:
+            built = np.flatnonzero(framedBoxes(*buildingBoxes(layout), cameraPaths=cameraPaths))
+        return [layout[i] for i in built.tolist()], ["building" + str(i) for i in built.tolist()]
+
+    # make a building called names[i] for each of layout[i] (see layout)
+    # instanced buildings share the unit cubes in unitCubes (material name -> cube), adding the ones missing
+    def buildBuildings(self, layout, names, instanced=False, unitCubes=None):
+        buildings_by_material = {}  # material name -> names of the buildings that get it
+        unit_cubes = unitCubes if unitCubes is not None else {}  # material name -> unit cube its buildings instance
+        new_cubes = []
+        self.spatial_index.addBoxes(names, *buildingBoxes(layout), kind='building')
+
+        for buildingName, (x, z, depth, height, width, random_material_name) in zip(names, layout):
+            if instanced:
+                if random_material_name not in unit_cubes:
+                    unit_cubes[random_material_name] = self.backend.polyCube(
+                        "building_unit_" + random_material_name, 1, 1, 1)
+                    new_cubes.append(random_material_name)
+                self.backend.instance(unit_cubes[random_material_name], buildingName)
+                self.backend.scale(buildingName, width, height, depth)
+            else:
+                self.backend.polyCube(buildingName, width, height, depth)
+            self.backend.move(buildingName, x, height / 2, z)
+            buildings_by_material.setdefault(random_material_name, []).append(buildingName)
+
+        # hide the unit cubes themselves (the instances have their own visibility), their material is only
+        # what shows if one is unhidden
+        for materialName in new_cubes:
+            self.backend.assign(unit_cubes[materialName], materialName)
+            self.backend.setAttr(unit_cubes[materialName] + '.visibility', 0)
+        # assign each material once, instead of once per building. instances share their unit cube's shape but
+        # not its shading, that's assigned per instance, so they need it just like separate cubes do
+        for materialName, buildingNames in buildings_by_material.items():
+            self.backend.assign(buildingNames, materialName)
+
+
+# (mins, maxs) of the box of each building in layout (see City.layout), every one stands on the ground
+# centered on its x, z
+def buildingBoxes(layout):
+    x, z, depth, height, width = np.array([building[:5] for building in layout], dtype=np.float64).reshape(-1, 5).T
+    mins = np.stack([x - width / 2, np.zeros(len(x)), z - depth / 2], axis=1)
+    maxs = np.stack([x + width / 2, height, z + depth / 2], axis=1)
+    return mins, maxs
+
+
+# bounding boxes of the imported models around their pivot (min corner, max corner), measured from objFiles/
+# (ObjMesh.bounds of readObj)
+MODEL_BOUNDS = {
+    'raindrop': ((-0.2, -0.2, -0.2), (0.2, 0.678, 0.2)),
+    'streetlight': ((-2.613, -0.044, -7.343), (2.613, 43.044, 7.343)),
+}
+
+
+# (mins, maxs) of the boxes of copies of model moved to each of positions
+def modelBoxes(model, positions):
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    boxMin, boxMax = MODEL_BOUNDS[model]
+    return positions + boxMin, positions + boxMax
+
+
+# (mins, maxs) of the box each raindrop sweeps out while falling
+# it falls from rest under a constant acceleration, so along each axis it only ever moves one way
+# and the box of its start and landing positions holds its whole path
+def rainBoxes(startPositions, acceleration):
+    solver = RainSolver(startPositions, acceleration)
+    landing_positions = solver.positionsAt(np.maximum(solver.landingFrames() - 1, 0))
+    low = modelBoxes('raindrop', np.minimum(solver.start_positions, landing_positions))[0]
+    high = modelBoxes('raindrop', np.maximum(solver.start_positions, landing_positions))[1]
+    return low, high
+
+
+# which of the boxes (centers, half sizes) are at least partly on the inside of every one of planes
+# a box is outside once even its corner furthest along a plane's normal is behind that plane,
+# that corner is center + half size * sign(normal), so for every box and plane at once:
+def boxesInFrustum(centers, halfSizes, planes):
+    normals = planes[:, :3]
+    return (centers.dot(normals.T) + halfSizes.dot(np.abs(normals).T) + planes[:, 3] >= 0).all(axis=1)
+
+
+# where everything is without asking maya: a uniform grid over the ground (x, z) holding the bounding box
+# of each building, streetlight and raindrop, filled in while the scene is generated
+# the city is flat and stretched out along the road, so every cell is a column covering all heights
+# a box goes in every cell it overlaps, and a query (within a radius, inside a frustum, along a ray)
+# only looks at the cells its region covers, then tests those boxes exactly, all at once as arrays
+# kind ('building', 'streetlight', 'raindrop') lets a query look at just some of them
+class SpatialIndex:
+    def __init__(self, cellSize=200):
+        self.cell_size = float(cellSize)
+        self.names = []
+        self.kinds = []  # kind names, a box's kind is stored as its index in here
+        self.new_boxes = []  # (mins, maxs, kind ids) added since the grid was last built
+        self.mins = np.empty((0, 3))
+        self.maxs = np.empty((0, 3))
+        self.kind_ids = np.empty(0, dtype=np.int64)
+        self.name_array = np.empty(0, dtype=object)  # names, to pick out many at once
+        self.cells = {}  # (x cell, z cell) -> indices of the boxes overlapping it
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, boxMin, boxMax, kind=None):
+        self.addBoxes([name], [boxMin], [boxMax], kind)
+
+    # names[i] covers mins[i]...maxs[i]
+    def addBoxes(self, names, mins, maxs, kind=None):
+        if kind not in self.kinds:
+            self.kinds.append(kind)
+        mins = np.asarray(mins, dtype=np.float64).reshape(-1, 3)
+        maxs = np.asarray(maxs, dtype=np.float64).reshape(-1, 3)
+        if len(names) != len(mins) or len(mins) != len(maxs):
+            raise ValueError('%d names for %d min and %d max corners' % (len(names), len(mins), len(maxs)))
+        self.names.extend(names)
+        self.new_boxes.append((mins, maxs, np.full(len(mins), self.kinds.index(kind), dtype=np.int64)))
+
+    # put the boxes added since the last query into the grid
+    def build(self):
+        if not self.new_boxes:
+            return
+        self.mins = np.concatenate([self.mins] + [mins for mins, maxs, kinds in self.new_boxes])
+        self.maxs = np.concatenate([self.maxs] + [maxs for mins, maxs, kinds in self.new_boxes])
+        self.kind_ids = np.concatenate([self.kind_ids] + [kinds for mins, maxs, kinds in self.new_boxes])
+        self.new_boxes = []
+        self.name_array = np.empty(len(self.names), dtype=object)
+        self.name_array[:] = self.names
+        self.centers, self.half_sizes = (self.mins + self.maxs) / 2, (self.maxs - self.mins) / 2
+        self.bounds = self.mins.min(axis=0)[None], self.maxs.max(axis=0)[None]  # box around everything
+
+        # each box's rectangle of cells, flattened into one (cell, box) pair per cell it overlaps
+        low, high = self.cellOf(self.mins), self.cellOf(self.maxs)
+        spans = high - low + 1
+        counts = spans[:, 0] * spans[:, 1]
+        boxes = np.repeat(np.arange(len(counts)), counts)
+        offsets = np.arange(len(boxes)) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells = low[boxes] + np.stack([offsets // spans[boxes, 1], offsets % spans[boxes, 1]], axis=1)
+        order = np.lexsort((cells[:, 1], cells[:, 0]))
+        cells, boxes = cells[order], boxes[order]
+        starts = np.flatnonzero(np.concatenate([[True], np.any(cells[1:] != cells[:-1], axis=1)]))
+        self.cells = dict(zip([tuple(cell) for cell in cells[starts].tolist()], np.split(boxes, starts[1:])))
+
+    # (x cell, z cell) of each point
+    def cellOf(self, points):
+        return np.floor(np.asarray(points, dtype=np.float64)[..., [0, 2]] / self.cell_size).astype(np.int64)
+
+    # indices of the boxes in the cells overlapping the x, z rectangle of low...high (all of them if None)
+    def candidates(self, low=None, high=None, kinds=None):
+        self.build()
+        if low is None:
+            boxes = np.arange(len(self.names))
+        else:
+            (x0, z0), (x1, z1) = self.cellOf(low).tolist(), self.cellOf(high).tolist()
+            if (x1 - x0 + 1) * (z1 - z0 + 1) > len(self.cells):
+                keys = [cell for cell in self.cells if x0 <= cell[0] <= x1 and z0 <= cell[1] <= z1]
+            else:
+                keys = [(x, z) for x in range(x0, x1 + 1) for z in range(z0, z1 + 1) if (x, z) in self.cells]
+            if not keys:
+                return np.empty(0, dtype=np.int64)
+            # a box over several of the cells is only returned once
+            found = np.zeros(len(self.names), dtype=bool)
+            for key in keys:
+                found[self.cells[key]] = True
+            boxes = np.flatnonzero(found)
+        return self.ofKinds(boxes, kinds)
+
+    def ofKinds(self, boxes, kinds):
+        if kinds is None:
+            return boxes
+        if isinstance(kinds, str):
+            kinds = [kinds]
+        ids = [self.kinds.index(kind) for kind in kinds if kind in self.kinds]
+        return boxes[np.isin(self.kind_ids[boxes], ids)]
+
+    # names of everything with some part within radius of point, nearest first
+    def withinRadius(self, point, radius, kinds=None):
+        point = np.asarray(point, dtype=np.float64)
+        boxes = self.candidates(point - radius, point + radius, kinds)
+        # distance from the point to the nearest point of each box
+        gaps = np.maximum(self.mins[boxes] - point, 0) + np.maximum(point - self.maxs[boxes], 0)
+        distances = np.sqrt((gaps * gaps).sum(axis=1))
+        inside = distances <= radius
+        boxes, distances = boxes[inside], distances[inside]
+        return self.name_array[boxes[np.argsort(distances, kind='stable')]].tolist()
+
+    # names of everything at least partly inside the frustum whose planes are the rows (a, b, c, d) of planes,
+    # with a * x + b * y + c * z + d >= 0 on the inside of each
+    # corners (its 8 corner points) narrows down which cells are looked at, otherwise every box is tested
+    def inFrustum(self, planes, corners=None, kinds=None):
+        planes = np.asarray(planes, dtype=np.float64).reshape(-1, 4)
+        if corners is None:
+            boxes = self.candidates(kinds=kinds)
+        else:
+            corners = np.asarray(corners, dtype=np.float64).reshape(-1, 3)
+            boxes = self.candidates(corners.min(axis=0), corners.max(axis=0), kinds)
+        return self.name_array[boxes[boxesInFrustum(self.centers[boxes], self.half_sizes[boxes], planes)]].tolist()
+
+    # distances along the ray at which it enters and leaves each box (enter > leave when it misses)
+    def slabs(self, origin, direction, mins, maxs):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inverse = 1.0 / direction
+            t0, t1 = (mins - origin) * inverse, (maxs - origin) * inverse
+        # nan is a ray parallel to, and right on, a face of the box: that axis doesn't limit it
+        enter = np.where(np.isnan(t0), -np.inf, np.minimum(t0, t1)).max(axis=1)
+        leave = np.where(np.isnan(t0), np.inf, np.maximum(t0, t1)).min(axis=1)
+        return enter, leave
+
+    # (name, distance) of the first thing the ray from origin along direction hits within maxDistance, or None
+    # walks the ray through the grid cell by cell, testing the boxes of RAY_BATCH_SIZE or so at a time,
+    # and stops once the nearest hit is before the cells still to come
+    RAY_BATCH_SIZE = 256
+
+    def raycast(self, origin, direction, maxDistance=np.inf, kinds=None):
+        self.build()
+        if not len(self.names):
+            return None
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+        length = np.linalg.norm(direction)
+        if not length > 0:
+            raise ValueError('a ray needs a direction, got %r' % (direction.tolist(),))
+        direction = direction / length
+        # only walk the part of the ray over the boxes
+        enter, leave = self.slabs(origin, direction, *self.bounds)
+        start, end = max(enter[0], 0.0), min(leave[0], maxDistance)
+        if start > end:
+            return None
+
+        cell = self.cellOf(origin + direction * start).tolist()
+        steps, next_boundary, boundary_spacing = [], [], []
+        for axis, coordinate in ((0, 0), (1, 2)):
+            d = direction[coordinate]
+            if d == 0:
+                steps.append(0)
+                next_boundary.append(np.inf)
+                boundary_spacing.append(np.inf)
+            else:
+                step = 1 if d > 0 else -1
+                steps.append(step)
+                next_boundary.append(((cell[axis] + (step > 0)) * self.cell_size - origin[coordinate]) / d)
+                boundary_spacing.append(self.cell_size / abs(d))
+
+        best, best_distance = None, np.inf
+        batch, batch_size = [], 0
+        while True:
+            boxes = self.cells.get(tuple(cell))
+            if boxes is not None:
+                batch.append(boxes)
+                batch_size += len(boxes)
+            leave_cell = min(next_boundary)
+            done = leave_cell > end
+            if batch and (done or batch_size >= self.RAY_BATCH_SIZE or best_distance <= leave_cell):
+                boxes = self.ofKinds(np.concatenate(batch), kinds)
+                batch, batch_size = [], 0
+                enter, leave = self.slabs(origin, direction, self.mins[boxes], self.maxs[boxes])
+                enter = np.maximum(enter, 0)
+                hits = np.flatnonzero((enter <= leave) & (enter <= end))
+                if len(hits):
+                    nearest = hits[np.argmin(enter[hits])]
+                    if enter[nearest] < best_distance:
+                        best, best_distance = boxes[nearest], enter[nearest]
+            # nothing in a later cell can be nearer than the cell boundary
+            if done or best_distance <= leave_cell:
+                break
+            axis = next_boundary.index(leave_cell)
+            cell[axis] += steps[axis]
+            next_boundary[axis] += boundary_spacing[axis]
+        if best is None:
+            return None
+        return self.names[best], float(best_distance)
+
+
+# what every cam in the scene sees: maya's default 35mm lens on a 36 x 24mm film gate
+# (camera1moveup's 1.41732 x 0.94488 inches), clipped 0.1...10000 away
+# the gate is the widest the render can be, whatever resolution / film fit it's rendered at
+CAMERA_FOCAL_LENGTH = 35.0
+CAMERA_FILM_GATE = (36.0, 24.0)
+CAMERA_CLIPPING = (0.1, 10000.0)
+# width in pixels of the rendered image (maya's default HD 540)
+CAMERA_IMAGE_WIDTH = 960
+# degrees added to the view on every side when culling, so motion blur and the motion between
+# two keyed frames don't bring anything culled into view
+CULL_MARGIN = 5.0
+# a raindrop further away than where it's this many pixels across can't be made out, so it isn't framed
+CULL_MIN_PIXELS = 1.0
+
+
+# rotation matrix of maya's default xyz rotate order (degrees): about x first, then y, then z
+def rotationMatrix(rotation):
+    x, y, z = np.radians(np.asarray(rotation, dtype=np.float64)).tolist()
+    rotate_x = np.array([[1, 0, 0], [0, math.cos(x), -math.sin(x)], [0, math.sin(x), math.cos(x)]])
+    rotate_y = np.array([[math.cos(y), 0, math.sin(y)], [0, 1, 0], [-math.sin(y), 0, math.cos(y)]])
+    rotate_z = np.array([[math.cos(z), -math.sin(z), 0], [math.sin(z), math.cos(z), 0], [0, 0, 1]])
+    return rotate_z.dot(rotate_y).dot(rotate_x)
+
+
+# (planes, corners) of what a cam at position with rotation sees, for SpatialIndex.inFrustum
+# a maya cam looks down its -z axis with +y up, margin widens the view by that many degrees on every side
+def cameraFrustum(position, rotation, focalLength=CAMERA_FOCAL_LENGTH, filmGate=CAMERA_FILM_GATE,
+                  clipping=CAMERA_CLIPPING, margin=0.0):
+    position = np.asarray(position, dtype=np.float64)
+    axes = rotationMatrix(rotation)
+    right, up, forward = axes[:, 0], axes[:, 1], -axes[:, 2]
+    half_width = min(math.atan(filmGate[0] / 2.0 / focalLength) + math.radians(margin), math.radians(89))
+    half_height = min(math.atan(filmGate[1] / 2.0 / focalLength) + math.radians(margin), math.radians(89))
+    near, far = clipping
+
+    # each side plane goes through the cam, tilted in from the view direction by half the view
+    normals = [forward, -forward,
+               math.cos(half_width) * right + math.sin(half_width) * forward,
+               -math.cos(half_width) * right + math.sin(half_width) * forward,
+               math.cos(half_height) * up + math.sin(half_height) * forward,
+               -math.cos(half_height) * up + math.sin(half_height) * forward]
+    points = np.array([position + near * forward, position + far * forward] + [position] * 4)
+    normals = np.array(normals)
+    planes = np.concatenate([normals, -(normals * points).sum(axis=1)[:, None]], axis=1)
+    # the 4 corners of the view at the near clip, then the same 4 at the far clip
+    corner_directions = (forward + np.array([-1, -1, 1, 1])[:, None] * math.tan(half_width) * right +
+                         np.array([-1, 1, -1, 1])[:, None] * math.tan(half_height) * up)
+    corners = position + np.concatenate([near * corner_directions, far * corner_directions])
+    return planes, corners
+
+
+# which of the boxes mins[i]...maxs[i] at least one cam sees on at least one frame
+# cameraPaths is {cam name: (frames, positions, rotations)}, one row per frame (see CameraTeam.cameraPaths)
+def framedBoxes(mins, maxs, cameraPaths, margin=CULL_MARGIN):
+    centers, half_sizes = (mins + maxs) / 2.0, (maxs - mins) / 2.0
+    framed = np.zeros(len(mins), dtype=bool)
+    for frames, positions, rotations in cameraPaths.values():
+        for position, rotation in zip(positions, rotations):
+            # only the boxes no cam has framed yet still need testing
+            boxes = np.flatnonzero(~framed)
+            if not len(boxes):
+                return framed
+            planes, corners = cameraFrustum(position, rotation, margin=margin)
+            framed[boxes[boxesInFrustum(centers[boxes], half_sizes[boxes], planes)]] = True
+    return framed
+
+
+# which of a set of moving points (e.g. raindrops) at least one cam sees on at least one frame,
+# near enough for something size across to cover minPixels of the image
+# pointsAt(frame, points) is where each of points (indices) is on that frame, and point i stays inside
+# the box mins[i]...maxs[i] the whole time, so only the points whose box is near a cam get tested
+def framedPoints(pointsAt, mins, maxs, size, cameraPaths, margin=CULL_MARGIN, minPixels=CULL_MIN_PIXELS):
+    # size * focal length / distance is how much of the film gate it covers
+    far = min(CAMERA_CLIPPING[1], size * CAMERA_FOCAL_LENGTH * CAMERA_IMAGE_WIDTH / (CAMERA_FILM_GATE[0] * minPixels))
+    index = SpatialIndex()
+    index.addBoxes(list(range(len(mins))), mins, maxs)
+    framed = np.zeros(len(mins), dtype=bool)
+    for frames, positions, rotations in cameraPaths.values():
+        for frame, position, rotation in zip(frames.tolist(), positions, rotations):
+            planes, corners = cameraFrustum(position, rotation, clipping=(CAMERA_CLIPPING[0], far), margin=margin)
+            # only the points no cam has framed yet still need testing
+            points = index.candidates(corners.min(axis=0), corners.max(axis=0))
+            points = points[~framed[points]]
+            if len(points):
+                inside = (pointsAt(frame, points).dot(planes[:, :3].T) + planes[:, 3] >= 0).all(axis=1)
+                framed[points[inside]] = True
+    return framed
+
+
+# a city built a block at a time, only where and when a cam first sees it, so a longer road costs nothing
+# until it's framed. the road is cut into blocks blockLength long (every row of buildings on both sides),
+# block b starting at z = start + b * blockLength, numBlocks of them (None for a road that never ends).
+# each building in a block comes from its own random stream (see City.buildingAt), so a block is the same
+# whenever it's built and whichever other blocks are, and the same as that stretch of City.generateBuildings
+class TiledCity:
+    # the largest building City.buildingAt makes (width, height, depth)
+    MAX_BUILDING_SIZE = (100, 500, 100)
+
+    def __init__(self, city, roadSides=None, start=-2000, spacing=100, blockLength=600, numBlocks=None,
+                 instanced=False):
+        self.city = city
+        self.road_sides = roadSides if roadSides is not None else [-600, -500, -400, -300, -200, -100,
+                                                                   100, 200, 300, 400, 500, 600]
+        self.start = start
+        self.spacing = spacing  # z between buildings in a row
+        self.block_length = blockLength
+        self.num_blocks = numBlocks
+        self.instanced = instanced
+        self.building_materials_list = None  # made with the first block
+        self.unit_cubes = {}  # material name -> unit cube, shared by every block when instanced
+        self.blocks = {}  # block -> names of its buildings, for each block built so far
+        self.first_frames = {}  # block -> first frame a cam frames it, see planBlocks
+
+    def blockZs(self, block):
+        first = self.start + block * self.block_length
+        return range(first, first + self.block_length, self.spacing)
+
+    # (mins, maxs) of a box each of blocks is sure to fit in
+    def blockBoxes(self, blocks):
+        blocks = np.asarray(blocks, dtype=np.float64)
+        width, height, depth = self.MAX_BUILDING_SIZE
+        first = self.start + blocks * self.block_length
+        last = first + self.block_length - self.spacing
+        mins = np.stack([np.full(len(blocks), min(self.road_sides) - width / 2.0), np.zeros(len(blocks)),
+                         first - depth / 2.0], axis=1)
+        maxs = np.stack([np.full(len(blocks), max(self.road_sides) + width / 2.0), np.full(len(blocks), height),
+                         last + depth / 2.0], axis=1)
+        return mins, maxs
+
+    # blocks within reach of z low...high
+    def blocksBetween(self, low, high):
+        depth = self.MAX_BUILDING_SIZE[2] / 2.0
+        first = max(int(math.floor((low - depth - self.start) / float(self.block_length))), 0)
+        last = int(math.floor((high + depth - self.start) / float(self.block_length)))
+        if self.num_blocks is not None:
+            last = min(last, self.num_blocks - 1)
+        return np.arange(first, last + 1)
+
+    # find the first frame any cam frames each block on, only looking at the blocks inside each frame's view,
+    # so how long the road is doesn't matter, only how far the cams see (viewDistance)
+    def planBlocks(self, cameraPaths, margin=CULL_MARGIN, viewDistance=CAMERA_CLIPPING[1]):
+        for frames, positions, rotations in cameraPaths.values():
+            for frame, position, rotation in zip(frames.tolist(), positions, rotations):
+                planes, corners = cameraFrustum(position, rotation, clipping=(CAMERA_CLIPPING[0], viewDistance),
+                                                margin=margin)
+                blocks = self.blocksBetween(corners[:, 2].min(), corners[:, 2].max())
+                # a block already seen by this frame needs no testing
+                blocks = blocks[[self.first_frames.get(block, np.inf) > frame for block in blocks.tolist()]]
+                if not len(blocks):
+                    continue
+                mins, maxs = self.blockBoxes(blocks)
+                for block in blocks[boxesInFrustum((mins + maxs) / 2.0, (maxs - mins) / 2.0, planes)].tolist():
+                    self.first_frames[block] = frame
+        return self.first_frames
+
+    # build the blocks planned to be seen by frame (all of them if frame is None) that aren't built yet,
+    # only the buildings in them some cam frames if cameraPaths is given. returns the blocks it built
+    def buildUntil(self, frame=None, cameraPaths=None):
+        blocks = self.blocksUntil(frame)
+        self.buildBlocks(blocks, cameraPaths)
+        return blocks
+
+    # the blocks planned to be seen by frame (all of them if frame is None) that aren't built yet
+    def blocksUntil(self, frame=None):
+        return sorted(block for block, first in self.first_frames.items()
+                      if (frame is None or first <= frame) and block not in self.blocks)
+
+    def buildBlocks(self, blocks, cameraPaths=None):
+        blocks = [block for block in blocks if block not in self.blocks]
+        if not blocks:
+            return
+        self.buildingMaterials()
+        self.buildLayouts(self.layoutBlocks(blocks, cameraPaths))
+
+    # the materials every block's buildings are given, made with the first block
+    def buildingMaterials(self):
+        if self.building_materials_list is None:
+            self.building_materials_list = self.city.generate_building_materials()
+        return self.building_materials_list
+
+    # (block, layout, names) of each of blocks not built yet, the layout (see City.layout) and names of just the
+    # buildings in it some cam frames if cameraPaths is given. doesn't touch the scene, but needs the
+    # buildingMaterials made
+    def layoutBlocks(self, blocks, cameraPaths=None):
+        blocks = [block for block in blocks if block not in self.blocks]
+        layouts = [self.city.layout(self.road_sides, self.blockZs(block), self.building_materials_list)
+                   for block in blocks]
+        # cull every block's buildings in one go, the cams' paths are walked once however many blocks there are
+        layout = [building for block_layout in layouts for building in block_layout]
+        framed = np.ones(len(layout), dtype=bool)
+        if cameraPaths is not None and layout:
+            framed = framedBoxes(*buildingBoxes(layout), cameraPaths=cameraPaths)
+        blockLayouts = []
+        first = 0
+        for block, block_layout in zip(blocks, layouts):
+            built = np.flatnonzero(framed[first:first + len(block_layout)]).tolist()
+            first += len(block_layout)
+            blockLayouts.append((block, [block_layout[i] for i in built],
+                                 ['block%d_building%d' % (block, i) for i in built]))
+        return blockLayouts
+
+    # build what layoutBlocks laid out
+    def buildLayouts(self, blockLayouts):
+        for block, layout, names in blockLayouts:
+            self.city.buildBuildings(layout, names, self.instanced, self.unit_cubes)
+            self.blocks[block] = names
+
+
+# detail levels of each asset, finest first: (how many pixels across an instance has to be on screen to get it,
+# percentage of the full mesh's polygons the level keeps), an instance smaller on screen than the last is hidden
+# only the streetlights switch levels: a building is a box already, the fewest polygons it can have, so its only
+# cheaper level is not drawing it (see framedBoxes), the heli and car stay close to the cams, and an instance
+# per level of every raindrop would add more nodes than it saves
+LOD_LEVELS = {
+    'streetlight': [(40, 100), (10, 30), (0.5, 8)],
+}
+# an instance only switches level once it's this fraction past the threshold between them, so one that sits
+# right on a threshold doesn't flicker between two levels from frame to frame
+LOD_HYSTERESIS = 0.2
+
+
+# switches instances of an asset between its detail levels (LOD_LEVELS) frame by frame, by how big they are
+# on screen from the nearest cam (or just from camera) along the cams' paths (see CameraTeam.cameraPaths)
+# the levels below the full mesh are polyReduce'd copies of it, unless they're given with setLevelMeshes
+# keys go into the KeyframeBuffer if one is given, otherwise they are written right away
+class LevelOfDetail:
+    def __init__(self, cameraPaths, backend=None, keys=None, camera=None, levels=None):
+        self.backend = backend if backend is not None else defaultSceneBackend()
+        self.keys = keys
+        self.levels = levels if levels is not None else LOD_LEVELS  # asset -> [(pixels, percentage)]
+        self.meshes = {}  # asset -> mesh of each of its levels
+        paths = [cameraPaths[camera]] if camera is not None else list(cameraPaths.values())
+        self.frames = paths[0][0]
+        self.camera_positions = np.stack([positions for frames, positions, rotations in paths])  # cam, frame, xyz
+
+    def setLevelMeshes(self, asset, meshes):
+        self.meshes[asset] = list(meshes)
+
+    # mesh of each level of asset, the lower ones are made from source the first time they're needed
+    def levelMeshes(self, asset, source):
+        if asset not in self.meshes:
+            self.meshes[asset] = [source] + [
+                self.backend.reduceMesh(source, '%s_lod%d' % (source, level), percentage)
+                for level, (pixels, percentage) in enumerate(self.levels[asset]) if level > 0]
+        return self.meshes[asset]
+
+    # the generated level meshes are only there to be instanced, like the source they were made from
+    def deleteLevelMeshes(self, asset):
+        for mesh in self.meshes.pop(asset, [])[1:]:
+            self.backend.delete(mesh)
+
+    # level of each instance (columns) on each frame (rows), len(levels) where it's too small to draw
+    # centers is (instances, 3) for things that stay put or (frames, instances, 3) for things that move,
+    # sizes is how big each one is (its largest side). an instance keeps its level from the frame before
+    # until it's hysteresis (a fraction) past a threshold (see LOD_HYSTERESIS)
+    def levelsOf(self, asset, centers, sizes, hysteresis=LOD_HYSTERESIS):
+        centers = np.asarray(centers, dtype=np.float64)
+        if centers.ndim == 2:
+            centers = centers[None]
+        offsets = self.camera_positions[:, :, None, :] - centers[None]
+        distances = np.sqrt((offsets * offsets).sum(axis=-1)).min(axis=0)
+        # size * focal length / distance is how much of the film gate it covers
+        pixels = np.asarray(sizes, dtype=np.float64) * CAMERA_FOCAL_LENGTH * CAMERA_IMAGE_WIDTH / (
+            CAMERA_FILM_GATE[0] * np.maximum(distances, 1e-9))
+        thresholds = np.array([pixels for pixels, percentage in self.levels[asset]])
+        levels = (pixels[..., None] < thresholds).sum(axis=-1)
+        if not hysteresis:
+            return levels
+        # the finest and the coarsest level each instance could be at on each frame
+        finest = (pixels[..., None] < thresholds * (1 - hysteresis)).sum(axis=-1)
+        coarsest = (pixels[..., None] < thresholds * (1 + hysteresis)).sum(axis=-1)
+        for frame in range(1, len(levels)):
+            levels[frame] = np.clip(levels[frame - 1], finest[frame], coarsest[frame])
+        return levels
+
+    # make name an instance of asset (whose full mesh is source) at position, showing on each frame the level
+    # levels (a column of levelsOf) says: a group with an instance of every level it uses, only one of them
+    # visible at a time. one that's at full detail on every frame is just an instance of source, like before
+    def place(self, asset, source, name, position, levels):
+        levels = np.asarray(levels)
+        if (levels == 0).all():
+            name = self.backend.instance(source, name)
+            self.backend.move(name, *position)
+            return name
+        meshes = self.levelMeshes(asset, source)
+        used = np.unique(levels[levels < len(meshes)]).tolist()
+        if not used:
+            # never big enough to make out
+            name = self.backend.instance(source, name)
+            self.backend.move(name, *position)
+            self.backend.setAttr(name + '.visibility', 0)
+            return name
+
+        buffer = self.keys if self.keys is not None else KeyframeBuffer(self.backend)
+        parts = []
+        for level in used:
+            part = self.backend.instance(meshes[level], '%s_lod%d' % (name, level))
+            shown = (levels == level).astype(np.float64)
+            # visibility is stepped, so it only needs keys where it switches
+            switches = np.flatnonzero(np.concatenate([[True], shown[1:] != shown[:-1]]))
+            buffer.addKeys(part, 'visibility', self.frames[switches], shown[switches])
+            parts.append(part)
+        if self.keys is None:
+            buffer.flush()
+        name = self.backend.group(parts, name)
+        self.backend.move(name, *position)
+        return name
+
+    # place (see place) an instance of asset called names[i] at each of positions, showing the levels in
+    # column i of levels, all given material (if there is one) at once. the ones at full detail on every frame
+    # are made together with one instanceArray. returns the names they got
+    def placeArray(self, asset, source, names, positions, levels, material=None):
+        positions = np.asarray(positions).reshape(-1, 3)
+        levels = np.asarray(levels)
+        full = (levels == 0).all(axis=0)
+        placed = list(names)
+        instanced = np.flatnonzero(full).tolist()
+        for i, name in zip(instanced, self.backend.instanceArray(source, [names[i] for i in instanced],
+                                                                  positions[full], material=material)):
+            placed[i] = name
+        rest = np.flatnonzero(~full).tolist()
+        for i in rest:
+            placed[i] = self.place(asset, source, names[i], positions[i].tolist(), levels[:, i])
+        if material is not None and rest:
+            self.backend.assign([placed[i] for i in rest], material)
+        return placed
+
+
+# comparisons used to describe when a phase of motion ends (e.g. heliposy <= 200)
+COMPARISONS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+
+# one axis (a position or a rotation) moving with constant acceleration
+# it is stepped the same way the animation loops step their variables every frame:
+#   vel = vel + accel * 1.0 / FPS
+#   pos = pos + velScale * vel * 1.0 / FPS
+# so the discrete sum has a closed form after n steps:
+#   vel(n) = vel + n * accel / FPS
+#   pos(n) = pos + velScale * (n * vel + accel * n * (n + 1) / 2) / FPS
+# which lets us jump straight to any frame instead of replaying every earlier one
+# (a constant rate of rotation is just a phase with accel 0 and vel = rate)
+class KinematicPhase:
+    def __init__(self, pos, vel=0.0, accel=0.0, FPS=24, velScale=1.0):
+        self.pos = pos
+        self.vel = vel
+        self.accel = accel
+        self.FPS = FPS
+        self.velScale = velScale
+
+    def velocityAt(self, n):
+        return self.vel + n * self.accel * 1.0 / self.FPS
+
+    def positionAt(self, n):
+        return self.pos + self.velScale * (n * self.vel + self.accel * n * (n + 1) / 2.0 / self.FPS) * 1.0 / self.FPS
+
+    # solve for the first step n >= start where (position or velocity) <comparison> threshold,
+    # e.g. firstStepWhere('<=', 200) is the first step where the heli has dropped to 200
+    # returns None if that never happens
+    def firstStepWhere(self, comparison, threshold, start=0, quantity='position'):
+        test = COMPARISONS[comparison]
+        if quantity == 'position':
+            valueAt = self.positionAt
+            # pos(n) - threshold = a2 * n^2 + a1 * n + a0
+            a2 = self.velScale * self.accel / (2.0 * self.FPS * self.FPS)
+            a1 = self.velScale * (self.vel * 1.0 / self.FPS + self.accel / (2.0 * self.FPS * self.FPS))
+        else:
+            valueAt = self.velocityAt
+            a2, a1 = 0.0, self.accel * 1.0 / self.FPS
+        a0 = valueAt(0) - threshold
+
+        roots = []
+        if a2 != 0:
+            discriminant = a1 * a1 - 4 * a2 * a0
+            if discriminant >= 0:
+                root = math.sqrt(discriminant)
+                roots = [(-a1 - root) / (2 * a2), (-a1 + root) / (2 * a2)]
+        elif a1 != 0:
+            roots = [-a0 / a1]
+
+        # the condition can only start holding at the start step or right after a crossing,
+        # so check the integer steps around each root (a step either side covers rounding)
+        candidates = set([start])
+        for root in roots:
+            if abs(root) > 1e12:
+                continue
+            for n in range(int(math.floor(root)) - 1, int(math.floor(root)) + 3):
+                if n >= start:
+                    candidates.add(n)
+        for n in sorted(candidates):
+            if test(valueAt(n), threshold):
+                return n
+        return None
+
+
+# the keys of one attribute (e.g. translateY) of one animated object
+# made of segments, each segment keys a run of consecutive frames with the values of a KinematicPhase
+class ChannelTrajectory:
+    def __init__(self):
+        self.start_frames = []
+        self.segments = []  # (startFrame, numFrames, phase)
+
+    # key frames startFrame...startFrame + numFrames - 1 with phase.positionAt(0...numFrames - 1)
+    def addSegment(self, startFrame, numFrames, phase):
+        if numFrames > 0:
+            self.start_frames.append(startFrame)
+            self.segments.append((startFrame, numFrames, phase))
+
+    # value keyed at (or last keyed before) frameNum, evaluated in O(1) per segment
+    def valueAt(self, frameNum):
+        if not self.segments:
+            return None
+        i = max(bisect.bisect_right(self.start_frames, frameNum) - 1, 0)
+        startFrame, numFrames, phase = self.segments[i]
+        step = min(max(frameNum - startFrame, 0), numFrames - 1)
+        return phase.positionAt(step)
+
+    def lastFrame(self):
+        if not self.segments:
+            return None
+        startFrame, numFrames, phase = self.segments[-1]
+        return startFrame + numFrames - 1
+
+    # all the (frames, values) of this channel, in frame order
+    # with firstFrame / lastFrame only the keys in that window, evaluated straight from their segment, plus a
+    # key at firstFrame holding the value there if the channel isn't keyed on it (so the window plays right)
+    def keys(self, firstFrame=None, lastFrame=None):
+        frames, values = [], []
+        for startFrame, numFrames, phase in self.segments:
+            first = 0 if firstFrame is None else max(firstFrame - startFrame, 0)
+            last = numFrames - 1 if lastFrame is None else min(lastFrame - startFrame, numFrames - 1)
+            for step in range(first, last + 1):
+                frames.append(startFrame + step)
+                values.append(phase.positionAt(step))
+        if firstFrame is not None and self.segments and (not frames or frames[0] != firstFrame):
+            frames.insert(0, firstFrame)
+            values.insert(0, self.valueAt(firstFrame))
+        return frames, values
+
+
+# make an empty ChannelTrajectory for each of the attributes
+def newChannels(attributes):
+    return dict((attribute, ChannelTrajectory()) for attribute in attributes)
+
+
+# value of every channel at frameNum, use this to scrub to any frame without re-simulating
+def channelValuesAt(channels, frameNum):
+    return dict((attribute, channel.valueAt(frameNum)) for attribute, channel in channels.items() if channel.segments)
+
+
+# (frames, values) arrays of every channel, compact enough to send back from a worker process
+# frameWindow = (first frame, last frame) keeps only the keys inside it (see ChannelTrajectory.keys)
+def channelKeys(channels, frameWindow=None):
+    arrays = {}
+    for attribute, channel in channels.items():
+        frames, values = channel.keys(*frameWindow) if frameWindow is not None else channel.keys()
+        arrays[attribute] = (np.array(frames, dtype=np.float64), np.array(values, dtype=np.float64))
+    return arrays
+
+
+# set all the keys of each channel on objname
+# keys go into the KeyframeBuffer if one is given, otherwise they are written right away
+def keyChannels(objname, channels, keys=None, backend=None, frameWindow=None):
+    keyArrays(objname, channelKeys(channels, frameWindow), keys, backend)
+
+
+# same as keyChannels, for channels that were already turned into arrays by channelKeys
+def keyArrays(objname, arrays, keys=None, backend=None):
+    buffer = keys if keys is not None else KeyframeBuffer(backend)
+    for attribute, (frames, values) in arrays.items():
+        buffer.addKeys(objname, attribute, frames, values)
+    if keys is None:
+        buffer.flush()
+
+
+# run a mover's phases (list of (name, method(frameNum, channels) -> next frameNum)) in order
+# if checkpoints is a list, a checkpoint (see takeCheckpoint) is added to it before each phase and after the last,
+# resume is one of those checkpoints to pick up from instead of starting over at frame 1
+def runPhases(mover, phases, attributes, checkpoints=None, resume=None):
+    if resume is None:
+        channels, frameNum, first = newChannels(attributes), 1, 0
+    else:
+        channels, frameNum, first = restoreCheckpoint(mover, phases, resume)
+    for i in range(first, len(phases)):
+        if checkpoints is not None:
+            checkpoints.append(takeCheckpoint(mover, phases, i, frameNum, channels))
+        frameNum = phases[i][1](frameNum, channels)
+    if checkpoints is not None:
+        checkpoints.append(takeCheckpoint(mover, phases, len(phases), frameNum, channels))
+    return channels
+
+
+# snapshot of a mover about to start phase number index on frameNum, as plain data (see saveCheckpoints):
+#   state: every variable of the mover (positions, velocities, accelerations, rotations, phase flags)
+#   channels: the segments keyed so far, each (startFrame, numFrames, pos, vel, accel, FPS, velScale)
+def takeCheckpoint(mover, phases, index, frameNum, channels):
+    state = dict((name, value) for name, value in vars(mover).items() if name != 'backend')
+    return {
+        'mover': type(mover).__name__,
+        'phase': phases[index][0] if index < len(phases) else 'done',
+        'index': index,
+        'frame': frameNum,
+        'state': state,
+        'channels': dict((attribute, [(startFrame, numFrames, phase.pos, phase.vel, phase.accel, phase.FPS,
+                                       phase.velScale) for startFrame, numFrames, phase in channel.segments])
+                         for attribute, channel in channels.items()),
+    }
+
+
+# put mover back in the state of checkpoint, returns (channels, frameNum, index of the phase to run next)
+def restoreCheckpoint(mover, phases, checkpoint):
+    if checkpoint['mover'] != type(mover).__name__:
+        raise ValueError('checkpoint of a %s can not be restored on a %s' % (checkpoint['mover'],
+                                                                            type(mover).__name__))
+    if checkpoint['index'] < len(phases) and phases[checkpoint['index']][0] != checkpoint['phase']:
+        raise ValueError('checkpoint is for phase %s, but phase %d is %s now' % (
+            checkpoint['phase'], checkpoint['index'], phases[checkpoint['index']][0]))
+    for name, value in checkpoint['state'].items():
+        setattr(mover, name, value)
+    channels = newChannels(checkpoint['channels'])
+    for attribute, segments in checkpoint['channels'].items():
+        for startFrame, numFrames, pos, vel, accel, FPS, velScale in segments:
+            channels[attribute].addSegment(startFrame, numFrames, KinematicPhase(pos, vel, accel, FPS, velScale))
+    return channels, checkpoint['frame'], checkpoint['index']
+
+
+# last checkpoint at or before frameNum (or the one starting phase), to pick a simulation up from there
+def findCheckpoint(checkpoints, frameNum=None, phase=None):
+    found = None
+    for checkpoint in checkpoints:
+        if phase is not None and checkpoint['phase'] == phase:
+            return checkpoint
+        if frameNum is not None and checkpoint['frame'] <= frameNum:
+            found = checkpoint
+    return found
+
+
+def saveCheckpoints(path, checkpoints):
+    with open(path, 'w') as f:
+        # numpy numbers (e.g. from a phase boundary search) are written as plain numbers
+        json.dump(checkpoints, f, indent=1, default=lambda value: value.item())
+
+
+def loadCheckpoints(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# drop every key that a straight line between the keys kept around it reproduces within tolerance
+# (ramer-douglas-peucker, measuring the error along the value axis since that's what plays back)
+# times must be sorted, returns the kept (times, values), always including the first and last key
+def simplifyCurve(times, values, tolerance):
+    times, values = np.asarray(times, dtype=np.float64), np.asarray(values, dtype=np.float64)
+    keep = np.zeros(len(times), dtype=bool)
+    keep[[0, -1]] = True
+    spans = [(0, len(times) - 1)]
+    while spans:
+        first, last = spans.pop()
+        if last - first < 2:
+            continue
+        slope = (values[last] - values[first]) / (times[last] - times[first])
+        line = values[first] + slope * (times[first + 1:last] - times[first])
+        error = np.abs(values[first + 1:last] - line)
+        worst = int(np.argmax(error))
+        if error[worst] > tolerance:
+            middle = first + 1 + worst
+            keep[middle] = True
+            spans.append((first, middle))
+            spans.append((middle, last))
+    return times[keep], values[keep]
+
+
+# collects (object, attribute, time, value) keys during simulation and writes each animation curve once,
+# instead of making one cm.setKeyframe call (one trip through the maya command layer) per key
+# with a positionTolerance (scene units) / rotationTolerance (degrees) the translate / rotate curves are
+# thinned out by simplifyCurve first, and written with linear tangents so they stay within that tolerance
+class KeyframeBuffer:
+    # curves with this many keys or fewer are cheaper to key one at a time than to build in bulk
+    MIN_BULK_KEYS = 3
+    # on / off attributes, keyed with stepped tangents so they hold each value until the next key
+    STEPPED_ATTRIBUTES = ('visibility',)
+
+    def __init__(self, backend=None, tangentType='clamped', positionTolerance=None, rotationTolerance=None):
+        self.backend = backend if backend is not None else defaultSceneBackend()
+        self.tangent_type = tangentType
+        self.position_tolerance = positionTolerance
+        self.rotation_tolerance = rotationTolerance
+        self.curves = {}  # (objname, attribute) -> list of (times, values) arrays
+        self.num_keys_buffered = 0  # how many cm.setKeyframe calls the old way would have made
+        self.num_single_keys = 0  # keys written one at a time with backend.setKeyframe...
+        self.num_bulk_curves = 0  # ...and the curves written in one backend.setKeyframes call each
+        self.num_bulk_keys = 0
+        self.num_keys_in = 0  # distinct keys flushed...
+        self.num_keys_out = 0  # ...and how many of them were left after simplifying
+
+    # same arguments as cm.setKeyframe, for keying a single value
+    def setKeyframe(self, objname, time, attribute, value):
+        self.addKeys(objname, attribute, [time], [value])
+
+    def addKeys(self, objname, attribute, times, values):
+        if len(times) == 0:
+            return
+        self.curves.setdefault((objname, attribute), []).append(
+            (np.asarray(times, dtype=np.float64), np.asarray(values, dtype=np.float64)))
+        self.num_keys_buffered += len(times)
+
+    # the buffered keys of one curve sorted by time, a later key on the same time replaces an earlier one
+    def curveKeys(self, objname, attribute):
+        chunks = self.curves.get((objname, attribute), [])
+        if not chunks:
+            return np.empty(0), np.empty(0)
+        times = np.concatenate([chunk[0] for chunk in chunks])
+        values = np.concatenate([chunk[1] for chunk in chunks])
+        order = np.argsort(times, kind='stable')
+        times, values = times[order], values[order]
+        last = np.append(times[1:] != times[:-1], True)
+        return times[last], values[last]
+
+    # how far a simplified curve of this attribute may stray from its keys, None to keep every key
+    def tolerance(self, attribute):
+        if attribute.startswith('translate'):
+            return self.position_tolerance
+        if attribute.startswith('rotate'):
+            return self.rotation_tolerance
+        return None
+
+    # write every buffered curve to the scene, then empty the buffer
+    def flush(self):
+        for objname, attribute in list(self.curves):
+            times, values = self.curveKeys(objname, attribute)
+            self.num_keys_in += len(times)
+            tangent_type = 'step' if attribute in self.STEPPED_ATTRIBUTES else self.tangent_type
+            tolerance = self.tolerance(attribute)
+            if tolerance is not None and len(times) > 2:
+                times, values = simplifyCurve(times, values, tolerance)
+                tangent_type = 'linear'
+            self.num_keys_out += len(times)
+            # single keys get maya's default tangents, so simplified curves always go through in bulk
+            if len(times) <= self.MIN_BULK_KEYS and tangent_type == self.tangent_type:
+                for frame, value in zip(times.tolist(), values.tolist()):
+                    self.backend.setKeyframe(objname, frame, attribute, value)
+                self.num_single_keys += len(times)
+            else:
+                self.backend.setKeyframes(objname, attribute, times, values, tangent_type)
+                self.num_bulk_curves += 1
+                self.num_bulk_keys += len(times)
+        self.curves = {}
+
+    # how the flushed keys were written
+    def writeReport(self):
+        return 'keyed %d values: %d keys one at a time, %d curves (%d keys) in bulk' % (
+            self.num_keys_buffered, self.num_single_keys, self.num_bulk_curves, self.num_bulk_keys)
+
+    # keys in vs keys out of the curve simplification
+    def reductionReport(self):
+        ratio = float(self.num_keys_in) / self.num_keys_out if self.num_keys_out else 1.0
+        return 'keys in %d, keys out %d (%.1fx fewer)' % (self.num_keys_in, self.num_keys_out, ratio)
+
+
+# the channels stored for every object in a trajectory cache, in this order
+TRAJECTORY_CHANNELS = ['translateX', 'translateY', 'translateZ', 'rotateX', 'rotateY', 'rotateZ']
+
+
+# streams per frame positions/rotations of many objects into one binary file that other tools and
+# render nodes can memory map and read any frame range of without loading the rest. the file is
+#   header: TrajectoryCacheWriter.HEADER (little endian, see __init__ for the fields)
+#   object table: for each object a uint16 name length, the utf-8 name and a uint8 mask of the channels
+#                 it animates (bit i = TRAJECTORY_CHANNELS[i]), channels it doesn't animate are stored as nan
+#   data: float32 array of shape (numFrames, numObjects, 6), frame after frame, starting at a 64 byte boundary
+# so frame f starts at dataOffset + (f - firstFrame) * numObjects * 24
+class TrajectoryCacheWriter:
+    MAGIC = b'CITATRAJ'
+    VERSION = 1
+    # magic, version, channels per object, numObjects, numFrames, firstFrame, framesPerChunk, FPS,
+    # objectTableOffset, dataOffset
+    HEADER = struct.Struct('<8sHHIIiIfQQ')
+    ALIGNMENT = 64
+
+    # frames are buffered and written chunkBytes (or one frame) at a time, numFrames (if it's known) keeps the
+    # buffer down to the size of the whole file when that's smaller
+    # the file is written as path + '.tmp' and only moved to path once it's closed, see __exit__
+    def __init__(self, path, objnames, channelMasks=None, firstFrame=1, FPS=24, chunkBytes=1 << 26, numFrames=None):
+        self.path = path
+        self.temporary_path = path + '.tmp'
+        self.objnames = list(objnames)
+        self.channel_masks = list(channelMasks) if channelMasks is not None else [63] * len(self.objnames)
+        self.first_frame = firstFrame
+        self.FPS = FPS
+        frameBytes = len(self.objnames) * len(TRAJECTORY_CHANNELS) * 4
+        self.frames_per_chunk = max(1, chunkBytes // max(frameBytes, 1))
+        if numFrames is not None:
+            self.frames_per_chunk = max(1, min(self.frames_per_chunk, numFrames))
+        self.chunk = np.empty((self.frames_per_chunk, len(self.objnames), len(TRAJECTORY_CHANNELS)), np.float32)
+        self.chunk_frames = 0  # how many frames of chunk are filled
+        self.num_frames = 0  # frames written so far
+
+        object_table = b''.join(struct.pack('<H', len(name.encode('utf-8'))) + name.encode('utf-8') +
+                                struct.pack('<B', mask) for name, mask in zip(self.objnames, self.channel_masks))
+        self.data_offset = -(-(self.HEADER.size + len(object_table)) // self.ALIGNMENT) * self.ALIGNMENT
+        self.file = open(self.temporary_path, 'wb')
+        self.writeHeader()
+        self.file.write(object_table)
+        self.file.write(b'\0' * (self.data_offset - self.HEADER.size - len(object_table)))
+
+    def writeHeader(self):
+        self.file.write(self.HEADER.pack(self.MAGIC, self.VERSION, len(TRAJECTORY_CHANNELS), len(self.objnames),
+                                         self.num_frames, self.first_frame, self.frames_per_chunk, self.FPS,
+                                         self.HEADER.size, self.data_offset))
+
+    # values of the next frames as a (numFrames, numObjects, 6) array (or (numObjects, 6) for one frame)
+    def addFrames(self, values):
+        values = np.asarray(values, dtype=np.float32).reshape(-1, len(self.objnames), len(TRAJECTORY_CHANNELS))
+        while len(values):
+            count = min(len(values), self.frames_per_chunk - self.chunk_frames)
+            self.chunk[self.chunk_frames:self.chunk_frames + count] = values[:count]
+            self.chunk_frames += count
+            values = values[count:]
+            if self.chunk_frames == self.frames_per_chunk:
+                self.flushChunk()
+
+    def flushChunk(self):
+        self.file.write(self.chunk[:self.chunk_frames].astype('<f4').tobytes())
+        self.num_frames += self.chunk_frames
+        self.chunk_frames = 0
+
+    # write what's left, fill in the number of frames in the header and put the file in place
+    def close(self):
+        if self.file is None:
+            return
+        self.flushChunk()
+        self.file.seek(0)
+        self.writeHeader()
+        self.file.close()
+        self.file = None
+        os.replace(self.temporary_path, self.path)
+
+    # give up on the file, whatever was at path before is left as it was
+    def discard(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        os.remove(self.temporary_path)
+
+    def __enter__(self):
+        return self
+
+    # an error while writing leaves no half written cache behind
+    def __exit__(self, excType, *exc):
+        if excType is None:
+            self.close()
+        else:
+            self.discard()
+
+
+# simulate the heli, car, cameras and rain and stream their motion into a trajectory cache at path,
+# chunk by chunk, without building a scene or keeping more than a chunk of frames in memory
+# every object holds its first / last value before / after its keys, like an animation curve does
+def exportTrajectoryCache(path, sceneRandom=None, numRaindrops=100, chunkBytes=1 << 26):
+    scene_random = sceneRandom if sceneRandom is not None else SceneRandom()
+    movers = [('heli', Helicopter()), ('car', Car()), ('car_cam_left', CarCam('car_cam_left')),
+              ('car_cam_right', CarCam('car_cam_right')), ('cam_heli_inside', HeliInsideCam('cam_heli_inside')),
+              ('cam_heli_side', HeliSideCam('cam_heli_side'))]
+    mover_channels = [mover.simulate() for objname, mover in movers]
+    masks = [sum(1 << i for i, attribute in enumerate(TRAJECTORY_CHANNELS) if attribute in channels and
+                 channels[attribute].segments) for channels in mover_channels]
+    solver = RainSolver(scene_random.rainStartPositions(numRaindrops), scene_random.rainAcceleration())
+    objnames = [objname for objname, mover in movers] + ['raindrop' + str(i + 1) for i in range(numRaindrops)]
+    masks += [7] * numRaindrops  # drops only move
+
+    lastFrame = max([max(channel.lastFrame() or 1 for channel in channels.values()) for channels in mover_channels] +
+                    [int(solver.landingFrames().max()) if numRaindrops else 1])
+    with TrajectoryCacheWriter(path, objnames, masks, 1, solver.FPS, chunkBytes, lastFrame) as writer:
+        frame = np.full((len(objnames), len(TRAJECTORY_CHANNELS)), np.nan, dtype=np.float32)
+        drops = frame[len(movers):, :3]
+        drops[:] = solver.start_positions
+        steps = solver.steps()
+        for frameNum in range(1, lastFrame + 1):
+            for i, channels in enumerate(mover_channels):
+                for c, attribute in enumerate(TRAJECTORY_CHANNELS):
+                    if masks[i] & (1 << c):
+                        frame[i, c] = channels[attribute].valueAt(frameNum)
+            # drops that have landed keep the position of their last key
+            positions, falling = next(steps, (None, None))
+            if positions is not None:
+                drops[falling] = positions[falling]
+            writer.addFrames(frame)
+    return path
+
+
+# memory maps a file written by TrajectoryCacheWriter, so a render worker can pull just its frames
+# nothing but the header and object table is read up front, window() hands back numpy views into the file
+class TrajectoryCacheReader:
+    def __init__(self, path):
+        header = TrajectoryCacheWriter.HEADER
+        with open(path, 'rb') as f:
+            (magic, version, numChannels, numObjects, self.num_frames, self.first_frame, self.frames_per_chunk,
+             self.FPS, objectTableOffset, dataOffset) = header.unpack(f.read(header.size))
+            if magic != TrajectoryCacheWriter.MAGIC or version != TrajectoryCacheWriter.VERSION:
+                raise ValueError('%s is not a version %d trajectory cache' % (path, TrajectoryCacheWriter.VERSION))
+            f.seek(objectTableOffset)
+            object_table = f.read(dataOffset - objectTableOffset)
+
+        self.objnames = []
+        self.channel_masks = []
+        offset = 0
+        for i in range(numObjects):
+            length, = struct.unpack_from('<H', object_table, offset)
+            self.objnames.append(object_table[offset + 2:offset + 2 + length].decode('utf-8'))
+            self.channel_masks.append(object_table[offset + 2 + length])
+            offset += 3 + length
+        self.index = dict((objname, i) for i, objname in enumerate(self.objnames))
+        self.channels = TRAJECTORY_CHANNELS[:numChannels]
+        # (frames, objects, channels), only the pages that get read are ever loaded
+        if self.num_frames and numObjects:
+            self.data = np.memmap(path, dtype='<f4', mode='r', offset=dataOffset,
+                                  shape=(self.num_frames, numObjects, numChannels))
+        else:
+            self.data = np.empty((self.num_frames, numObjects, numChannels), dtype='<f4')
+
+    @property
+    def last_frame(self):
+        return self.first_frame + self.num_frames - 1
+
+    # index of objnames along the object axis: a slice when they're evenly spaced (like 'raindrop*'), so
+    # window() can return a view, otherwise an array of indices
+    # objnames can be a list of names, an fnmatch pattern or None for every object
+    def objectSelection(self, objnames=None):
+        if objnames is None:
+            return slice(None)
+        if isinstance(objnames, str):
+            indices = [i for i, objname in enumerate(self.objnames) if fnmatch.fnmatchcase(objname, objnames)]
+        else:
+            indices = [self.index[objname] for objname in objnames]
+        if len(indices) == 0:
+            return slice(0, 0)
+        if len(indices) == 1:
+            return slice(indices[0], indices[0] + 1)
+        step = indices[1] - indices[0]
+        if step > 0 and all(b - a == step for a, b in zip(indices, indices[1:])):
+            return slice(indices[0], indices[-1] + 1, step)
+        return np.array(indices)
+
+    # values of frames firstFrame...lastFrame (clipped to the frames in the file) of objnames,
+    # as a (frames, objects, channels) array that is a zero-copy view of the file unless the objects
+    # can't be described by a slice (then only that window is copied)
+    # channels is a list of channel names (default all 6 of TRAJECTORY_CHANNELS)
+    def window(self, firstFrame=None, lastFrame=None, objnames=None, channels=None):
+        firstFrame = self.first_frame if firstFrame is None else max(firstFrame, self.first_frame)
+        lastFrame = self.last_frame if lastFrame is None else min(lastFrame, self.last_frame)
+        frames = slice(firstFrame - self.first_frame, max(lastFrame - self.first_frame + 1, 0))
+        view = self.data[frames, self.objectSelection(objnames)]
+        if channels is not None:
+            indices = [self.channels.index(channel) for channel in channels]
+            if indices == list(range(indices[0], indices[0] + len(indices))):
+                view = view[:, :, indices[0]:indices[0] + len(indices)]
+            else:
+                view = view[:, :, indices]
+        return view
+
+    # frame numbers of window(firstFrame, lastFrame, ...)
+    def frameNumbers(self, firstFrame=None, lastFrame=None):
+        firstFrame = self.first_frame if firstFrame is None else max(firstFrame, self.first_frame)
+        lastFrame = self.last_frame if lastFrame is None else min(lastFrame, self.last_frame)
+        return np.arange(firstFrame, lastFrame + 1)
+
+    # channels objname animates (the others are nan in the file)
+    def animatedChannels(self, objname):
+        mask = self.channel_masks[self.index[objname]]
+        return [channel for i, channel in enumerate(self.channels) if mask & (1 << i)]
+
+    def close(self):
+        # drop the memory map, views taken from it keep the file mapped until they're gone too
+        self.data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# a polygon mesh read from an .obj file (and the .mtl files it uses), laid out the way maya builds meshes:
+# face_counts[i] vertices in face i, their vertex / uv / normal numbers one face after another in
+# vertex_indices, uv_indices and normal_indices (-1 where the .obj gives none), and materials as
+# (name, diffuse color, first face, number of faces) runs, in face order
+class ObjMesh:
+    def __init__(self, name, vertices, uvs, normals, face_counts, vertex_indices, uv_indices, normal_indices,
+                 materials, dependencies):
+        self.name = name  # group the faces are in, what maya names the mesh when it imports the file
+        self.vertices = vertices  # (V, 3) float32
+        self.uvs = uvs  # (T, 2) float32
+        self.normals = normals  # (N, 3) float32
+        self.face_counts = face_counts  # (F,) int32
+        self.vertex_indices = vertex_indices  # (sum of face_counts,) int32, same for uv_indices and normal_indices
+        self.uv_indices = uv_indices
+        self.normal_indices = normal_indices
+        self.materials = materials
+        self.dependencies = dependencies  # the .obj then its .mtl files, as file names next to the .obj
+
+    # (min corner, max corner) of the vertices, e.g. for MODEL_BOUNDS
+    def bounds(self):
+        return self.vertices.min(axis=0), self.vertices.max(axis=0)
+
+
+# diffuse color of each material in an .mtl file
+def parseMtl(path):
+    colors = {}
+    name = None
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == 'newmtl':
+                name = line.strip()[len('newmtl'):].strip()
+                colors[name] = (0.5, 0.5, 0.5)  # maya's default lambert grey
+            elif fields[0] == 'Kd' and name is not None:
+                colors[name] = tuple(float(value) for value in fields[1:4])
+    return colors
+
+
+# .obj files are read this many bytes at a time
+OBJ_BLOCK_BYTES = 1 << 22
+WHITESPACE = np.zeros(256, dtype=bool)
+WHITESPACE[[ord(' '), ord('\t'), ord('\r'), ord('\n')]] = True
+
+
+# the first columns values of each record, as a (records, columns) array, from all the values of the records
+# one after another (values) and how many each one has (counts), any beyond columns (a w, a vertex color) dropped
+# and any a record leaves out (vt u has no v) 0
+def recordColumns(values, counts, columns):
+    first = np.cumsum(counts) - counts
+    given = np.arange(columns) < counts[:, None]
+    if given.all():
+        return values[first[:, None] + np.arange(columns)]
+    columns_out = np.zeros((len(counts), columns), dtype=values.dtype)
+    columns_out[given] = values[(first[:, None] + np.arange(columns))[given]]
+    return columns_out
+
+
+# every object in an .obj file as an ObjMesh, in the order they first appear. the file is read in blocks of
+# blockBytes, and the v / vt / vn / f records of a block are picked out and converted to numbers all at once
+# with numpy, only the few other records (g, o, usemtl, mtllib) are looked at one by one
+# faces are split into meshes by their g (or o) name like maya's importer does, each keeping only the vertices,
+# uvs and normals its faces use
+def readObj(path, blockBytes=OBJ_BLOCK_BYTES):
+    blocks = []  # what parseObjBlock found in each block
+    counts = np.zeros(3, dtype=np.int64)  # v, vt, vn records read so far, to resolve negative (relative) numbers
+    first_line = 0
+    with open(path, 'rb') as f:
+        rest = b''
+        while True:
+            chunk = f.read(blockBytes)
+            block = rest + chunk
+            if chunk:
+                # only whole lines, the end of the last one waits for the next block
+                end = block.rfind(b'\n') + 1
+                block, rest = block[:end], block[end:]
+            elif block and not block.endswith(b'\n'):
+                block += b'\n'
+            if block:
+                blocks.append(parseObjBlock(block, first_line, counts))
+                first_line += blocks[-1]['lines']
+            if not chunk:
+                break
+
+    vertices, uvs, normals = [np.concatenate([block[kind] for block in blocks]) if blocks else
+                              np.empty((0, columns), dtype=np.float32)
+                              for kind, columns in (('v', 3), ('vt', 2), ('vn', 3))]
+    face_lines = np.concatenate([block['face_lines'] for block in blocks] + [np.empty(0, dtype=np.int64)])
+    face_counts = np.concatenate([block['face_counts'] for block in blocks] + [np.empty(0, dtype=np.int64)])
+    corners = np.concatenate([block['corners'] for block in blocks] + [np.empty((0, 3), dtype=np.int64)])
+    events = [event for block in blocks for event in block['events']]
+
+    # the group and material each face is in is the last g / o and usemtl before it
+    folder = os.path.dirname(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    colors = {}
+    dependencies = [os.path.basename(path)]
+    group_lines, group_names, material_lines, material_names_in_order = [], [], [], []
+    for line, kind, value in events:
+        if kind in ('g', 'o'):
+            group_lines.append(line)
+            group_names.append(value.split()[0] if value else 'default')
+        elif kind == 'usemtl':
+            material_lines.append(line)
+            material_names_in_order.append(value)
+        elif kind == 'mtllib':
+            for library in value.split():
+                if os.path.exists(os.path.join(folder, library)) and library not in dependencies:
+                    dependencies.append(library)
+                    colors.update(parseMtl(os.path.join(folder, library)))
+    face_groups = np.searchsorted(np.array(group_lines, dtype=np.int64), face_lines, side='right') - 1
+    face_materials = np.searchsorted(np.array(material_lines, dtype=np.int64), face_lines, side='right') - 1
+    names = np.array([stem] + group_names, dtype=object)[face_groups + 1]
+    # the same material used again further on is the same material
+    material_names = sorted(set([''] + material_names_in_order))
+    face_materials = np.array([material_names.index(name) for name in [''] + material_names_in_order],
+                              dtype=np.int64)[face_materials + 1]
+
+    face_starts = np.cumsum(face_counts) - face_counts
+    meshes = []
+    for name in sorted(set(names.tolist()), key=names.tolist().index):
+        faces = np.flatnonzero(names == name)
+        # the corners of those faces, in order
+        counts = face_counts[faces]
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        mesh_corners = corners[np.repeat(face_starts[faces], counts) + offsets]
+        arrays = []
+        for column, values in enumerate((vertices, uvs, normals)):
+            # keep only what this mesh uses, renumbered (in file order)
+            used, renumbered = np.unique(mesh_corners[:, column], return_inverse=True)
+            missing = used[0] < 0 if len(used) else False
+            arrays.append(values[used[1:] if missing else used])
+            arrays.append((renumbered - 1 if missing else renumbered).astype(np.int32))
+        # runs of faces with the same material
+        mesh_materials = face_materials[faces]
+        run_starts = np.flatnonzero(np.concatenate([[True], mesh_materials[1:] != mesh_materials[:-1]]))
+        run_ends = np.append(run_starts[1:], len(faces))
+        materials = []
+        for start, end in zip(run_starts.tolist(), run_ends.tolist()):
+            material = material_names[mesh_materials[start]]
+            materials.append((material, colors.get(material, (0.5, 0.5, 0.5)), start, end - start))
+        meshes.append(ObjMesh(name, arrays[0], arrays[2], arrays[4], counts.astype(np.int32),
+                              arrays[1], arrays[3], arrays[5], materials, list(dependencies)))
+    return meshes
+
+
+# the v, vt and vn records (float32 arrays), faces (their line numbers, number of corners and each corner's
+# 0 based vertex, uv and normal numbers, -1 for none) and other records ((line, keyword, rest of the line))
+# of a block of whole lines of an .obj file, starting at line firstLine. counts is how many v, vt and vn
+# records came before the block, and is updated to include it
+def parseObjBlock(block, firstLine, counts):
+    text = np.frombuffer(block, dtype=np.uint8).copy()
+    ends = np.flatnonzero(text == ord('\n'))
+    line_starts = np.concatenate([[0], ends[:-1] + 1])
+    line_of_byte = np.repeat(np.arange(len(line_starts)), ends - line_starts + 1)
+    # a record can be indented, it starts at the first byte of its line that isn't blank (few lines are)
+    starts = line_starts.copy()
+    for line in np.flatnonzero(WHITESPACE[text[line_starts]] & (ends > line_starts)).tolist():
+        starts[line] = ends[line] - len(block[line_starts[line]:ends[line]].lstrip())
+    # the first two bytes of each record (0 past the end of a short one)
+    padded = np.concatenate([text, [0, 0]])
+    first, second = padded[starts], padded[starts + 1]
+    second[starts + 1 > ends] = 0
+    separated = WHITESPACE[second]
+    kinds = {'v': (first == ord('v')) & separated, 'vt': (first == ord('v')) & (second == ord('t')),
+             'vn': (first == ord('v')) & (second == ord('n')), 'f': (first == ord('f')) & separated}
+    numeric = kinds['v'] | kinds['vt'] | kinds['vn'] | kinds['f']
+
+    found = {'lines': len(starts), 'events': []}
+    # the few other records (skipping blank lines and comments) are looked at one by one
+    for line in np.flatnonzero(~numeric & (first != ord('#')) & (ends > starts)).tolist():
+        fields = block[starts[line]:ends[line]].decode('utf-8', 'replace').strip().split(None, 1)
+        if fields and fields[0] in ('g', 'o', 'usemtl', 'mtllib'):
+            found['events'].append((line + firstLine, fields[0], fields[1].strip() if len(fields) > 1 else ''))
+
+    # blank out everything but the numbers of the v, vt, vn and f records, so the whole block splits into them
+    text[~numeric[line_of_byte]] = ord(' ')
+    for kind, lines in kinds.items():
+        for i in range(len(kind)):
+            text[starts[lines] + i] = ord(' ')
+    blank = WHITESPACE[text]
+    value_starts = np.flatnonzero(~blank & np.concatenate([[True], blank[:-1]]))
+    value_lines = line_of_byte[value_starts]
+    per_line = np.bincount(value_lines, minlength=len(starts))
+    # a face corner is v, v/vt, v//vn or v/vt/vn, so its slashes (and whether two are side by side) say which
+    slash = np.flatnonzero(text == ord('/'))
+    slash_values = np.searchsorted(value_starts, slash, side='right') - 1
+    slashes = np.bincount(slash_values, minlength=len(value_starts))
+    double = np.zeros(len(value_starts), dtype=bool)
+    double[slash_values[:-1][np.diff(slash) == 1]] = True
+    text[slash] = ord(' ')
+    numbers = np.array(text.tobytes().split(), dtype=np.float64)
+    per_value = 1 + slashes - double
+    first_number = np.cumsum(per_value) - per_value
+
+    line_kinds = np.zeros(len(starts), dtype=np.int8)
+    for code, kind in enumerate(('v', 'vt', 'vn', 'f')):
+        line_kinds[kinds[kind]] = code + 1
+    value_kinds = line_kinds[value_lines]
+    for code, (kind, columns) in enumerate((('v', 3), ('vt', 2), ('vn', 3))):
+        found[kind] = recordColumns(numbers[first_number[value_kinds == code + 1]], per_line[kinds[kind]],
+                                    columns).astype(np.float32)
+
+    corner = value_kinds == 4
+    per_corner, first_corner_number, corner_slashes = per_value[corner], first_number[corner], slashes[corner]
+    corners = np.zeros((len(per_corner), 3), dtype=np.int64)
+    corners[:, 0] = numbers[first_corner_number]
+    has_uv = (corner_slashes >= 1) & ~double[corner]
+    corners[has_uv, 1] = numbers[first_corner_number[has_uv] + 1]
+    has_normal = corner_slashes == 2
+    corners[has_normal, 2] = numbers[first_corner_number[has_normal] + per_corner[has_normal] - 1]
+    # obj numbers from 1, and negative numbers count back from the last one read before the face
+    face_lines = np.flatnonzero(kinds['f'])
+    for column, kind in enumerate(('v', 'vt', 'vn')):
+        before = counts[column] + np.cumsum(kinds[kind])[value_lines[corner]]
+        corners[:, column] = np.where(corners[:, column] > 0, corners[:, column] - 1,
+                                      np.where(corners[:, column] < 0, before + corners[:, column], -1))
+        counts[column] += kinds[kind].sum()
+    found['face_lines'] = face_lines + firstLine
+    found['face_counts'] = per_line[face_lines]
+    found['corners'] = corners
+    return found
+
+
+# readObj of each of paths, read side by side in the pool's workers
+def readObjFiles(paths, pool=None):
+    pool = pool if pool is not None else SimulationPool(1)
+    futures = [pool.submit(readObj, path) for path in paths]
+    return [future.result() for future in futures]
+
+
+# .obj files converted once into a compact binary file each, so later runs memory map their meshes instead of
+# parsing the text again. a mesh cache file is
+#   header: MeshCache.HEADER (little endian, see header for the fields)
+#   table: the files the meshes were made from, then for each mesh its name, its 6 sizes (uint32 vertices, uvs,
+#          normals, faces, face vertices, materials) and its materials (each the name, float32 r, g, b and
+#          uint32 first face, number of faces), every name a uint16 length and utf-8 bytes
+#   data: the arrays of each ObjMesh in turn, in ARRAYS order, each starting at a 64 byte boundary
+# it's rebuilt when the .obj (or one of its .mtl files) changes: an unchanged modified time and size is
+# trusted, a changed one gets the files hashed and compared with the hash they were converted from
+class MeshCache:
+    MAGIC = b'CITAMESH'
+    VERSION = 2
+    # magic, version, number of meshes, number of source files, newest modified time (ns) and total size of
+    # the source files, their sha256, tableOffset, dataOffset
+    HEADER = struct.Struct('<8sHIIqQ32sQQ')
+    ALIGNMENT = 64
+    # (attribute, dtype, columns), sizes come from the table
+    ARRAYS = [('vertices', '<f4', 3), ('uvs', '<f4', 2), ('normals', '<f4', 3), ('face_counts', '<i4', 1),
+              ('vertex_indices', '<i4', 1), ('uv_indices', '<i4', 1), ('normal_indices', '<i4', 1)]
+
+    def __init__(self, directory, pool=None):
+        self.directory = directory
+        self.pool = pool if pool is not None else SimulationPool(1)  # converts several files side by side
+        self.reloaded = []  # .obj files loaded from their cache this run
+        self.converted = []  # .obj files that had to be (re)converted
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    # cache file of source, named after it and where it is so two assets with the same name don't collide
+    def path(self, source):
+        source = os.path.abspath(source)
+        return os.path.join(self.directory, '%s-%s.mesh' % (
+            os.path.splitext(os.path.basename(source))[0],
+            hashlib.sha256(source.encode('utf-8')).hexdigest()[:12]))
+
+    # (newest modified time, total size, sha256 of the contents) of files, hashing them only if asked
+    @staticmethod
+    def fingerprint(files, hashContents=True):
+        stats = [os.stat(path) for path in files]
+        digest = b'\0' * 32
+        if hashContents:
+            sha = hashlib.sha256()
+            for path in files:
+                with open(path, 'rb') as f:
+                    sha.update(f.read())
+            digest = sha.digest()
+        return max(stat.st_mtime_ns for stat in stats), sum(stat.st_size for stat in stats), digest
+
+    # the meshes in source as ObjMeshes whose arrays are memory mapped from its cache file
+    def load(self, source):
+        return self.loadAll([source])[0]
+
+    # load of each of sources, the ones that need converting read in parallel
+    def loadAll(self, sources):
+        meshes = [self.cached(source) for source in sources]
+        stale = [source for source, cached in zip(sources, meshes) if cached is None]
+        for source, parsed in zip(stale, readObjFiles(stale, self.pool)):
+            self.converted.append(source)
+            files = [os.path.join(os.path.dirname(source), name) for name in parsed[0].dependencies] \
+                if parsed else [source]
+            self.write(self.path(source), parsed, *self.fingerprint(files))
+        return [cached if cached is not None else self.read(self.path(source))[0]
+                for source, cached in zip(sources, meshes)]
+
+    # the meshes in source's cache file if it's still up to date, otherwise None
+    def cached(self, source):
+        path = self.path(source)
+        if not os.path.exists(path):
+            return None
+        try:
+            dependencies, (mtime, size, digest) = self.read(path, mapArrays=False)[1:]
+        except (ValueError, struct.error):
+            return None  # written by another version, or cut short
+        files = [os.path.join(os.path.dirname(source), name) for name in dependencies]
+        if not all(os.path.exists(f) for f in files):
+            return None
+        if self.fingerprint(files, hashContents=False)[:2] != (mtime, size):
+            # touched but maybe not changed (a checkout, a copy), the contents decide
+            fingerprint = self.fingerprint(files)
+            if fingerprint[2] != digest:
+                return None
+            self.restamp(path, fingerprint)
+        # mapped once it's up to date, so nothing maps the file restamp replaces
+        try:
+            meshes = self.read(path)[0]
+        except (ValueError, struct.error):
+            return None  # cut short
+        self.reloaded.append(source)
+        return meshes
+
+    # put fingerprint in the header of the cache file at path, through a temporary file like write, so a run
+    # that's killed halfway or another one reading the file never sees half a header
+    def restamp(self, path, fingerprint):
+        with open(path, 'rb') as f:
+            contents = f.read()
+        header = self.HEADER.unpack_from(contents)
+        temporary = path + '.%d.tmp' % os.getpid()
+        with open(temporary, 'wb') as f:
+            f.write(self.HEADER.pack(*(header[:4] + fingerprint + header[7:])))
+            f.write(contents[self.HEADER.size:])
+        os.replace(temporary, path)
+
+    def write(self, path, meshes, mtime, size, digest):
+        text = lambda value: struct.pack('<H', len(value.encode('utf-8'))) + value.encode('utf-8')
+        dependencies = meshes[0].dependencies if meshes else []
+        table = b''.join(text(name) for name in dependencies)
+        for mesh in meshes:
+            table += text(mesh.name) + struct.pack('<6I', len(mesh.vertices), len(mesh.uvs), len(mesh.normals),
+                                                   len(mesh.face_counts), len(mesh.vertex_indices),
+                                                   len(mesh.materials))
+            table += b''.join(text(name) + struct.pack('<3fII', color[0], color[1], color[2], first, count)
+                              for name, color, first, count in mesh.materials)
+        data_offset = self.aligned(self.HEADER.size + len(table))
+        # write to a temporary file first, so a run that's killed halfway doesn't leave a broken cache
+        temporary = path + '.%d.tmp' % os.getpid()
+        with open(temporary, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, len(meshes), len(dependencies), mtime, size, digest,
+                                     self.HEADER.size, data_offset))
+            f.write(table)
+            for mesh in meshes:
+                for attribute, dtype, columns in self.ARRAYS:
+                    f.write(b'\0' * (self.aligned(f.tell()) - f.tell()))
+                    f.write(np.ascontiguousarray(getattr(mesh, attribute), dtype=dtype).tobytes())
+        os.replace(temporary, path)
+
+    def aligned(self, offset):
+        return -(-offset // self.ALIGNMENT) * self.ALIGNMENT
+
+    # (meshes, source file names, (modified time, size, sha256) of the sources) in the cache file at path,
+    # meshes is None unless mapArrays
+    def read(self, path, mapArrays=True):
+        with open(path, 'rb') as f:
+            (magic, version, numMeshes, numDependencies, mtime, size, digest, tableOffset,
+             dataOffset) = self.HEADER.unpack(f.read(self.HEADER.size))
+            if magic != self.MAGIC or version != self.VERSION:
+                raise ValueError('%s is not a version %d mesh cache' % (path, self.VERSION))
+            f.seek(tableOffset)
+            table = f.read(dataOffset - tableOffset)
+
+        position = [0]  # where the next field of table starts
+
+        def text():
+            length, = struct.unpack_from('<H', table, position[0])
+            position[0] += 2 + length
+            return table[position[0] - length:position[0]].decode('utf-8')
+
+        dependencies = [text() for i in range(numDependencies)]
+        if not mapArrays:
+            return None, dependencies, (mtime, size, digest)
+        meshes = []
+        offset = dataOffset
+        for m in range(numMeshes):
+            name = text()
+            numVertices, numUVs, numNormals, numFaces, numFaceVertices, numMaterials = struct.unpack_from(
+                '<6I', table, position[0])
+            position[0] += 24
+            materials = []
+            for i in range(numMaterials):
+                material = text()
+                r, g, b, first, count = struct.unpack_from('<3fII', table, position[0])
+                position[0] += 20
+                materials.append((material, (r, g, b), first, count))
+
+            arrays = []
+            rows = [numVertices, numUVs, numNormals, numFaces, numFaceVertices, numFaceVertices, numFaceVertices]
+            for (attribute, dtype, columns), count in zip(self.ARRAYS, rows):
+                shape = (count, columns) if columns > 1 else (count,)
+                if count:
+                    arrays.append(np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape))
+                else:
+                    arrays.append(np.empty(shape, dtype=dtype))
+                offset = self.aligned(offset + count * columns * 4)
+            meshes.append(ObjMesh(name, *(arrays + [materials, list(dependencies)])))
+        return meshes, dependencies, (mtime, size, digest)
+
+    def report(self):
+        return 'reloaded %d cached meshes, converted %d (%s)' % (
+            len(self.reloaded), len(self.converted),
+            ', '.join(sorted(set(os.path.basename(source) for source in self.converted))) or 'none')
 
 
 # class for the helicopter, storing positions/accels/vels as vars
 # also contains method for animating it
 class Helicopter:
-    def __init__(self):
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.FPS = 24  # frames per sec constant
 
         # select all the heli elements
         # move them in z dir
@@ -551,109 +2632,131 @@ class Helicopter:
         self.heliposx = 0  
 
     # method to animate heli, to be called in animate_chase()
-    def animate(self):
-
-        do_rotate = False  # when you reach height 200, set this to true to start rotation
-        frameNum = 1  # init framenumber to 1
-        FPS = 24  # frames per sec constant
-        # while heliposy > 110:
-        while self.heliposy > 110 and frameNum < 241:  # now that i know exactly when animation should end
-            if self.heliposy <= 200:
-                do_rotate = True
-                if self.helirotatey <= -180:  # stop rotating after complete 180
-                    do_rotate = False
-            cm.setKeyframe('heli', time=frameNum, attribute="rotateX", value=self.helirotatex)
-            cm.setKeyframe('heli', time=frameNum, attribute="rotateY", value=self.helirotatey)
-            if do_rotate:
-                self.helirotatey = self.helirotatey + (-112) * 1.0 / FPS
-            # keyframe translate y
-            cm.setKeyframe('heli', time=frameNum, attribute="translateY", value=self.heliposy)
-            self.helively = self.helively + self.heliaccy * 1.0 / FPS
-            self.heliposy = self.heliposy + self.helively * 1.0 / FPS
-            # keyframe translate z
-            cm.setKeyframe('heli', time=frameNum, attribute="translateZ", value=self.heliposz)
-            self.helivelz = self.helivelz + self.heliaccz * 1.0 / FPS
-            self.heliposz = self.heliposz + self.helivelz * 1.0 / FPS
-            # go to next frame
-            frameNum += 1
-
-        # dont want to just immediately stop in the air, want to simulate a hovering effect (up,down,up,down)
+    def animate(self, keys=None, frameWindow=None):
+        keyChannels('heli', self.simulate(), keys, self.backend, frameWindow)
+
+    # work out every key of the heli without touching the scene
+    # each phase has constant acceleration, so its keys and the frame it ends on are solved directly
+    # pass a list as checkpoints to collect the heli's state between phases, and one of those as resume
+    # to start from it (e.g. to rerun just the dodge while tuning it)
+    def simulate(self, checkpoints=None, resume=None):
+        return runPhases(self, self.phases(), ['translateX', 'translateY', 'translateZ', 'rotateX', 'rotateY',
+                                               'rotateZ'], checkpoints, resume)
+
+    def phases(self):
+        # now that i know exactly when animation should end
+        return [('descend', lambda frameNum, channels: self.descend(frameNum, channels, frameLimit=241)),
+                ('hover', self.hoverIfLow),
+                ('dodge', self.dodge)]
+
+    # dont want to just immediately stop in the air, want to simulate a hovering effect (up,down,up,down)
+    def hoverIfLow(self, frameNum, channels):
         if self.heliposy <= 110:
-            currentlymoving = 'down'  # initially going down
-            # hover until car collides, approx 80 frames?
-            for i in range(18):  # down up 30 times
-                # move down
-                if currentlymoving == 'down':
-                    print('moving down')
-                    self.heliaccy = 200  # push up on move down
-                else:
-                    self.heliaccy = -1  # push down on move up
-                # keyframe translate y
-                print('frameNum = ', frameNum, 'heliposy =', self.heliposy, 'heliaccely =', self.heliaccy, 'helively=',
-                      self.helively)
-                cm.setKeyframe('heli', time=frameNum, attribute="translateY", value=self.heliposy)
-                self.helively = self.helively + self.heliaccy * 1.0 / FPS
-                self.heliposy = self.heliposy + self.helively * 1.0 / FPS
-                if self.helively > 0:
-                    currentlymoving = 'up'
-                elif self.helively <= 0:
-                    currentlymoving = 'down'
-                frameNum += 1
-
-        # dodge to right!
-        keep_dodging = True  # keep the dodge sequence going while true
-        level_out = False  # use this to determine when to level out the heli
-        start_dodge_framenum = frameNum  # what is the current framenum
-        
-        while keep_dodging:
-
-            # set keyframe on each var that should change in dodge sequence
-            cm.setKeyframe('heli', time=frameNum, attribute="rotateZ", value=self.helirotatez)
-            cm.setKeyframe('heli', time=frameNum, attribute="rotateX", value=self.helirotatex)
-            cm.setKeyframe('heli', time=frameNum, attribute="translateZ", value=self.heliposz)
-            cm.setKeyframe('heli', time=frameNum, attribute="translateY", value=self.heliposy)
-            cm.setKeyframe('heli', time=frameNum, attribute="translateX", value=self.heliposx)
-            if not level_out:
-                print('inside not level out!')
-                # rotate along z axis to right
-                self.helirotatez = self.helirotatez + (-100) * 1.0 / FPS  # 200 picked through t&e
-                # tilt back
-                self.helirotatex = self.helirotatex + (-100) * 1.0 / FPS  # 200 picked through t&e
-
-                # move up a bit (use a constant to rep velocity, no need for acceleration here)
-                self.heliposy = self.heliposy + (60) * 1.0 / FPS
-
-                # move back, use same values already stored
-                self.helivelz = self.helivelz + self.heliaccz * 1.0 / FPS
-                self.heliposz = self.heliposz + self.helivelz * 1.0 / FPS
-
-                # move right
-                self.heliposx = self.heliposx + (60) * 1.0 / FPS
-
-                if self.heliposz >= 2045 and self.heliposx >= 25:
-                    level_out = True
-
-
-            else:  # level out now true, so level back out (i.e. only rotations)
-                while self.helirotatez < 0:  # leveled, stop dodging
-                    cm.setKeyframe('heli', time=frameNum, attribute="rotateZ", value=self.helirotatez)
-                    cm.setKeyframe('heli', time=frameNum, attribute="rotateX", value=self.helirotatex)
-                    # rotate along z axis to left (negative)
-                    self.helirotatez = self.helirotatez + (40) * 1.0 / FPS  # 90 picked through t&e
-                    # tilt back (negative x)
-                    self.helirotatex = self.helirotatex + (40) * 1.0 / FPS  # 90 picked through t&e
-
-                    print("STOP DODGING")
-                    frameNum += 1
-                keep_dodging = False  # done
-
-            frameNum += 1
+            return self.hover(frameNum, channels)
+        return frameNum
+
+    # descend toward the road, turning around (180) once it gets down to 200
+    # returns the frame after the last one keyed
+    def descend(self, frameNum, channels, frameLimit=None):
+        FPS = self.FPS
+        posy = KinematicPhase(self.heliposy, self.helively, self.heliaccy, FPS)
+        posz = KinematicPhase(self.heliposz, self.helivelz, self.heliaccz, FPS)
+
+        # keep descending while heliposy > 110
+        numFrames = posy.firstStepWhere('<=', 110)
+        if frameLimit is not None and (numFrames is None or numFrames > frameLimit - frameNum):
+            numFrames = max(frameLimit - frameNum, 0)
+
+        channels['rotateX'].addSegment(frameNum, numFrames, KinematicPhase(self.helirotatex))
+        channels['translateY'].addSegment(frameNum, numFrames, posy)
+        channels['translateZ'].addSegment(frameNum, numFrames, posz)
+
+        # when you reach height 200, start rotation, stop rotating after complete 180
+        start_rotate = posy.firstStepWhere('<=', 200)
+        if start_rotate is None or start_rotate >= numFrames:
+            channels['rotateY'].addSegment(frameNum, numFrames, KinematicPhase(self.helirotatey))
+        else:
+            rotatey = KinematicPhase(self.helirotatey, -112, 0, FPS)
+            stop_rotate = rotatey.firstStepWhere('<=', -180)
+            rotating_frames = min(stop_rotate + 1, numFrames - start_rotate)
+            channels['rotateY'].addSegment(frameNum, start_rotate, KinematicPhase(self.helirotatey))
+            channels['rotateY'].addSegment(frameNum + start_rotate, rotating_frames, rotatey)
+            channels['rotateY'].addSegment(frameNum + start_rotate + rotating_frames,
+                                           numFrames - start_rotate - rotating_frames,
+                                           KinematicPhase(rotatey.positionAt(stop_rotate)))
+            self.helirotatey = rotatey.positionAt(min(stop_rotate, numFrames - start_rotate))
+
+        self.helively, self.heliposy = posy.velocityAt(numFrames), posy.positionAt(numFrames)
+        self.helivelz, self.heliposz = posz.velocityAt(numFrames), posz.positionAt(numFrames)
+        return frameNum + numFrames
+
+    # bounce up and down for 18 frames, pushing up while moving down and down while moving up
+    def hover(self, frameNum, channels, numFrames=18):
+        FPS = self.FPS
+        currentlymoving = 'down'  # initially going down
+        while numFrames > 0:
+            if currentlymoving == 'down':
+                self.heliaccy = 200  # push up on move down
+            else:
+                self.heliaccy = -1  # push down on move up
+            posy = KinematicPhase(self.heliposy, self.helively, self.heliaccy, FPS)
+            # keep pushing the same way until the heli changes direction
+            if currentlymoving == 'down':
+                turn = posy.firstStepWhere('>', 0, start=1, quantity='velocity')
+            else:
+                turn = posy.firstStepWhere('<=', 0, start=1, quantity='velocity')
+            steps = numFrames if turn is None else min(turn, numFrames)
+
+            channels['translateY'].addSegment(frameNum, steps, posy)
+            self.helively, self.heliposy = posy.velocityAt(steps), posy.positionAt(steps)
+            frameNum += steps
+            numFrames -= steps
+            currentlymoving = 'up' if currentlymoving == 'down' else 'down'
+        return frameNum
+
+    # dodge to right! then level back out
+    def dodge(self, frameNum, channels):
+        FPS = self.FPS
+        # rotate along z axis to right and tilt back, 100 picked through t&e
+        rotatez = KinematicPhase(self.helirotatez, -100, 0, FPS)
+        rotatex = KinematicPhase(self.helirotatex, -100, 0, FPS)
+        # move up a bit (use a constant to rep velocity, no need for acceleration here)
+        posy = KinematicPhase(self.heliposy, 60, 0, FPS)
+        # move back, use same values already stored
+        posz = KinematicPhase(self.heliposz, self.helivelz, self.heliaccz, FPS)
+        # move right
+        posx = KinematicPhase(self.heliposx, 60, 0, FPS)
+
+        # level out once the heli is far enough down the road and right of it
+        dodge_frames = max(posz.firstStepWhere('>=', 2045, start=1), posx.firstStepWhere('>=', 25, start=1))
+
+        channels['translateX'].addSegment(frameNum, dodge_frames + 1, posx)
+        channels['translateY'].addSegment(frameNum, dodge_frames + 1, posy)
+        channels['translateZ'].addSegment(frameNum, dodge_frames + 1, posz)
+        channels['rotateX'].addSegment(frameNum, dodge_frames, rotatex)
+        channels['rotateZ'].addSegment(frameNum, dodge_frames, rotatez)
+
+        self.heliposx, self.heliposy = posx.positionAt(dodge_frames), posy.positionAt(dodge_frames)
+        self.helivelz, self.heliposz = posz.velocityAt(dodge_frames), posz.positionAt(dodge_frames)
+        frameNum += dodge_frames
+
+        # level out now, so level back out (i.e. only rotations), 40 picked through t&e
+        rotatez = KinematicPhase(rotatez.positionAt(dodge_frames), 40, 0, FPS)
+        rotatex = KinematicPhase(rotatex.positionAt(dodge_frames), 40, 0, FPS)
+        level_frames = rotatez.firstStepWhere('>=', 0)  # leveled, stop dodging
+        channels['rotateX'].addSegment(frameNum, max(level_frames, 1), rotatex)
+        channels['rotateZ'].addSegment(frameNum, max(level_frames, 1), rotatez)
+
+        self.helirotatez, self.helirotatex = rotatez.positionAt(level_frames), rotatex.positionAt(level_frames)
+        return frameNum + level_frames
 
 
 # class for the car, storing positions/accels/vels as vars
 # also contains method for animating it
 class Car:
-    def __init__(self):
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.FPS = 24  # frames per sec constant
 
         # init positions, velocities, accels
         self.carposx, self.carposy, self.carposz = 0, 0, -1900
@@ -664,64 +2767,353 @@ class Car:
         self.car_rotatex = 0  # init, not rotated
 
     # method to animate car, to be called in animate_chase()
-    def animate(self):
-        # re-init frame number to 1
-        frameNum = 1
-        FPS = 24  # frames per sec constant
-
-        # car drives along road in straight line under heli as heli moves forward and descends (approaching car)
-        do_rotate_backward = False  # use this to determine rotation along ramp
-        do_rotate_forward = False  # use this to determine nosedive rotation after ramp
-
+    def animate(self, keys=None, frameWindow=None):
+        keyChannels('car', self.simulate(), keys, self.backend, frameWindow)
+
+    # work out every key of the car without touching the scene
+    # car drives along road in straight line under heli as heli moves forward and descends (approaching car),
+    # goes up the ramp, gets airtime, nosedives and lands
+    # checkpoints / resume work like Helicopter.simulate
+    def simulate(self, checkpoints=None, resume=None):
+        return runPhases(self, self.phases(), ['translateY', 'translateZ', 'rotateX'], checkpoints, resume)
+
+    def phases(self):
+        return [('drive', self.drive), ('ramp', self.ramp), ('airborne', self.airborne), ('rotate', self.rotate)]
+
+    # always moving forward, work out on which frames (counted from drive_start) it hits the ramp and the ground
+    def drive(self, frameNum, channels):
+        FPS = self.FPS
         # while carposz < 1965: # just before collision with heli
-        while self.carposz < 4000:
-            # keyframe translate z
-            if self.carposz > 1470 and self.carposz < 1480:
-                do_rotate_backward = True
-            else:
-                do_rotate_backward = False
-            cm.setKeyframe('car', time=frameNum, attribute="rotateX", value=self.car_rotatex)
-            if do_rotate_backward:
-                self.car_rotatex = self.car_rotatex + (-410) * 1.0 / FPS  # rotate backward, -410 found thru T&E
-            # move up along ramp
-            if self.carposz > 1470 and self.carposz < 1480:
-                cm.setKeyframe('car', time=frameNum, attribute="translateY", value=self.carposy)
-                self.carvely = self.carvely + self.gravityaccel * 1.0 / FPS
-                self.carposy = self.carposy + self.carvely * 1.0 / FPS
-            # left ramp,
-            # amplify acceleration after leaving ramp to make car fall faster, also begin partial nosedive
-            if self.carposz >= 1480 and self.carposy >= 0:
-                cm.setKeyframe('car', time=frameNum, attribute="translateY", value=self.carposy)
-                self.carvely = self.carvely + (
-                            self.gravityaccel * 10 * .9) * 1.0 / FPS  # amplify downward acceleration due to gravity (not strong enough otherwise)
-                self.carposy = self.carposy + self.carvely * 1.0 / FPS
+        posz = KinematicPhase(self.carposz, self.carvelz, self.caraccelz, FPS)
+        numFrames = posz.firstStepWhere('>=', 4000)
+        channels['translateZ'].addSegment(frameNum, numFrames, posz)
+        self.drive_start, self.drive_frames = frameNum, numFrames
+
+        # move up along ramp while 1470 < carposz < 1480
+        self.ramp_start = min(posz.firstStepWhere('>', 1470), numFrames)
+        self.ramp_end = max(min(posz.firstStepWhere('>=', 1480), numFrames), self.ramp_start)
+
+        # the ground is reached when 2725 < carposz < 2745, check that after each move forward
+        ground_start = posz.firstStepWhere('>', 2725, start=1)
+        ground_end = posz.firstStepWhere('>=', 2745, start=1)
+        if ground_start is None or ground_start >= ground_end:
+            ground_start = ground_end = numFrames + 1
+        self.ground_start, self.ground_end = ground_start - 1, ground_end - 1
+
+        self.carvelz, self.carposz = posz.velocityAt(numFrames), posz.positionAt(numFrames)
+        return frameNum + self.ramp_start
+
+    def ramp(self, frameNum, channels):
+        FPS = self.FPS
+        posy = KinematicPhase(self.carposy, self.carvely, self.gravityaccel, FPS)
+        steps = self.ramp_end - self.ramp_start
+        channels['translateY'].addSegment(frameNum, steps, posy)
+        self.carvely, self.carposy = posy.velocityAt(steps), posy.positionAt(steps)
+        return frameNum + steps
+
+    # left ramp,
+    # amplify acceleration after leaving ramp to make car fall faster, keep going while carposy >= 0
+    def airborne(self, frameNum, channels):
+        FPS = self.FPS
+        numFrames = self.drive_frames
+        air_start = air_end = self.ramp_end
+        while air_end < numFrames and self.carposy >= 0:
+            # amplify downward acceleration due to gravity (not strong enough otherwise)
+            posy = KinematicPhase(self.carposy, self.carvely, self.gravityaccel * 10 * .9, FPS)
+            # dont wanna just hover due to a vertical offset in kinematic equations,
+            # so find where it drops under 5
+            steps = posy.firstStepWhere('<', 5, start=1)
+            if steps is None or steps > numFrames - air_end:
+                steps = numFrames - air_end
+            channels['translateY'].addSegment(self.drive_start + air_end, steps, posy)
+            self.carvely, self.carposy = posy.velocityAt(steps), posy.positionAt(steps)
+            air_end += steps
+            if 0 < self.carposy < 5:
+                # if it has reached this height then just set it to ground level
+                self.carposy = 0
+        self.air_start, self.air_end = air_start, air_end
+        return self.drive_start + air_end
+
+    # rotation changes rate at each of the ramp / air / ground boundaries, so sweep through them
+    # rotate backward on the ramp (-410 found thru T&E), nosedive once airborne (8) until reaching the ground
+    def rotate(self, frameNum, channels):
+        FPS = self.FPS
+        frameNum, numFrames = self.drive_start, self.drive_frames
+        ramp_start, ramp_end = self.ramp_start, self.ramp_end
+        air_start, air_end = self.air_start, self.air_end
+        ground_start, ground_end = self.ground_start, self.ground_end
+        boundaries = set([0, numFrames, ramp_start, ramp_end, air_start, air_end])
+        boundaries.update(range(ground_start, ground_end + 1))
+        boundaries = sorted(n for n in boundaries if 0 <= n <= numFrames)
+        do_rotate_forward = False  # use this to determine nosedive rotation after ramp
+        for start, end in zip(boundaries[:-1], boundaries[1:]):
+            rate = 0
+            if ramp_start <= start < ramp_end:
+                rate += -410  # rotate backward
+            if air_start <= start < air_end:
                 do_rotate_forward = True  # nosedive,level out
-                if (
-                        self.carposy > 0 and self.carposy < 5):  # dont wanna just hover due to a vertical offset in kinematic equations
-                    # if it has reached this height then just set it to ground level
-                    self.carposy = 0
-
             if do_rotate_forward:
-                self.car_rotatex = self.car_rotatex + (8) * 1.0 / FPS
-
-            # always moving forward
-            cm.setKeyframe('car', time=frameNum, attribute="translateZ", value=self.carposz)
-            self.carvelz = self.carvelz + self.caraccelz * 1.0 / FPS
-            self.carposz = self.carposz + self.carvelz * 1.0 / FPS
-            if self.carposz > 2725 and self.carposz < 2745:  # reached the ground
+                rate += 8
+            rotatex = KinematicPhase(self.car_rotatex, rate, 0, FPS)
+            channels['rotateX'].addSegment(frameNum + start, end - start, rotatex)
+            self.car_rotatex = rotatex.positionAt(end - start)
+            if ground_start <= start < ground_end:  # reached the ground
                 do_rotate_forward = False
                 self.car_rotatex = 0
-            # increment frame number
-            frameNum += 1
+        return frameNum + numFrames
+
+
+# class for the cams "mounted" on the car, storing positions/accels/vels as vars
+# they copy the car's motion, but slow down in the air so the car overtakes them
+class CarCam:
+    def __init__(self, name, backend=None):
+        self.name = name
+        self.backend = backend
+        self.FPS = 24  # frames per sec constant
+        self.velz = 360  # car's init z vel is 360, so copy that for both mounted cams
+        self.accelz = 5  # car init z accel is 5, so copy that for both mounted cams
+
+        self.posz = -1900  # z position
+        self.posy = 2  # y position
+
+        self.vely = 150  # car's init y vel is 150, so copy that for both mounted cams
+        self.gravityaccel = -9.8
+
+    def animate(self, keys=None, frameWindow=None):
+        keyChannels(self.name, self.simulate(), keys, self.backend, frameWindow)
+
+    # work out every key of the cam without touching the scene
+    def simulate(self):
+        channels = newChannels(['translateY', 'translateZ'])
+        FPS = self.FPS
+        frameNum = 1
+
+        # stop while car still moving (carcam posz < 2950)
+        # begin vertical movement along ramp while 1470 < posz < 1480
+        posz = KinematicPhase(self.posz, self.velz, self.accelz, FPS)
+        numFrames = posz.firstStepWhere('>=', 2950)
+        ramp_start = min(posz.firstStepWhere('>', 1470), numFrames)
+        ramp_end = max(min(posz.firstStepWhere('>=', 1480), numFrames), ramp_start)
+        posy = KinematicPhase(self.posy, self.vely, self.gravityaccel, FPS)
+        channels['translateY'].addSegment(frameNum + ramp_start, ramp_end - ramp_start, posy)
+        self.vely, self.posy = posy.velocityAt(ramp_end - ramp_start), posy.positionAt(ramp_end - ramp_start)
+
+        # left ramp, amplify accel while posy > 0
+        # amplify downward acceleration due to gravity (not strong enough otherwise)
+        if self.posy > 0 and ramp_end < numFrames:
+            posy = KinematicPhase(self.posy, self.vely, self.gravityaccel * 10, FPS)
+            air_frames = posy.firstStepWhere('<=', 0, start=1)
+            # also slow down the cameras velz so that car overtakes them in the air,
+            # which also changes when the cam gets to the end of the road
+            air_posz = KinematicPhase(posz.positionAt(ramp_end), posz.velocityAt(ramp_end), 0.1 * self.accelz, FPS)
+            end_in_air = air_posz.firstStepWhere('>=', 2950)
+            if air_frames is None or (end_in_air is not None and end_in_air < air_frames):
+                air_frames = end_in_air
+            channels['translateY'].addSegment(frameNum + ramp_end, air_frames, posy)
+            self.vely, self.posy = posy.velocityAt(air_frames), posy.positionAt(air_frames)
+
+            # dont slow down cams anymore after landing
+            channels['translateZ'].addSegment(frameNum, ramp_end, posz)
+            channels['translateZ'].addSegment(frameNum + ramp_end, air_frames, air_posz)
+            posz = KinematicPhase(air_posz.positionAt(air_frames), air_posz.velocityAt(air_frames), self.accelz, FPS)
+            frameNum += ramp_end + air_frames
+            numFrames = posz.firstStepWhere('>=', 2950)
+
+        channels['translateZ'].addSegment(frameNum, numFrames, posz)
+        self.velz, self.posz = posz.velocityAt(numFrames), posz.positionAt(numFrames)
+        return channels
+
+
+# class for the cam inside the heli looking out (front window)
+# it rides along with the heli, so it descends and turns the same way
+class HeliInsideCam(Helicopter):
+    def __init__(self, name, backend=None):
+        Helicopter.__init__(self, backend)
+        self.name = name
+
+        self.heliposy = 394  # thats where it starts
+        self.heliposz = -1929
+
+        # init rotate of cam1
+        self.helirotatex, self.helirotatey, self.helirotatez = -20, 180, 0
+
+        # continue moving back, left, rotate right after the descent
+        self.heliaccx = -7
+        self.helivelx = -300
+
+    def animate(self, keys=None, frameWindow=None):
+        keyChannels(self.name, self.simulate(), keys, self.backend, frameWindow)
+
+    def simulate(self):
+        channels = newChannels(['translateX', 'translateY', 'translateZ', 'rotateX', 'rotateY'])
+        FPS = self.FPS
+        frameNum = 1  # init framenumber to 1
+        frameNum = self.descend(frameNum, channels)
+
+        # slow down z vel
+        self.helivelz = 0.8 * self.helivelz
+        # another < 1 seconds
+        posz = KinematicPhase(self.heliposz, self.helivelz, self.heliaccz, FPS, velScale=0.5)
+        posx = KinematicPhase(self.heliposx, self.helivelx, self.heliaccx, FPS)
+        rotatey = KinematicPhase(self.helirotatey, -160, 0, FPS)
+        channels['translateZ'].addSegment(frameNum, 5, posz)
+        channels['translateX'].addSegment(frameNum, 5, posx)
+        channels['rotateY'].addSegment(frameNum, 5, rotatey)
+
+        self.helivelz, self.heliposz = posz.velocityAt(5), posz.positionAt(5)
+        self.helivelx, self.heliposx = posx.velocityAt(5), posx.positionAt(5)
+        self.helirotatey = rotatey.positionAt(5)
+        return channels
+
+
+# class for the cam on the side of the heli, angled toward it
+class HeliSideCam:
+    def __init__(self, name, backend=None):
+        self.name = name
+        self.backend = backend
+        self.FPS = 24  # frames per sec constant
+        self.posy = 413  # thats where it starts
+        self.posz = -1964
+        # we want the drop to be slower than the forward motion, so make z magnitude higher than y magnitude
+        self.accz = 8  # init accel z
+        self.accy = -7  # init accel y
+        self.vely = -1.5  # init vel y
+        self.velz = 410  # init vel z
+
+        # init rotate of cam2
+        self.rotatex, self.rotatey, self.rotatez = -51, 166, -17
+
+    def animate(self, keys=None, frameWindow=None):
+        keyChannels(self.name, self.simulate(), keys, self.backend, frameWindow)
+
+    def simulate(self):
+        channels = newChannels(['translateY', 'translateZ', 'rotateX', 'rotateY'])
+        FPS = self.FPS
+        frameNum = 1  # init framenumber to 1
+
+        # first stage: move forward, descend slightly while posz < -1500
+        posz = KinematicPhase(self.posz, self.velz, self.accz, FPS)
+        posy = KinematicPhase(self.posy, self.vely, self.accy, FPS)
+        steps = posz.firstStepWhere('>=', -1500)
+        channels['translateZ'].addSegment(frameNum, steps, posz)
+        channels['translateY'].addSegment(frameNum, steps, posy)
+        # not changing yet
+        channels['rotateX'].addSegment(frameNum, steps, KinematicPhase(self.rotatex))
+        channels['rotateY'].addSegment(frameNum, steps, KinematicPhase(self.rotatey))
+        self.velz, self.posz = posz.velocityAt(steps), posz.positionAt(steps)
+        self.vely, self.posy = posy.velocityAt(steps), posy.positionAt(steps)
+        frameNum += steps
+
+        # now, second stage, speed in front of heli and #lookbackatit
+        # until rotatex <= -30 and rotatey <= 10
+        posz = KinematicPhase(self.posz, 460, 0, FPS)
+        rotatey = KinematicPhase(self.rotatey, -100, 0, FPS)
+        rotatex = KinematicPhase(self.rotatex, -25, 0, FPS)
+        steps = max(rotatex.firstStepWhere('<=', -30), rotatey.firstStepWhere('<=', 10))
+        channels['translateZ'].addSegment(frameNum, steps, posz)
+        channels['rotateX'].addSegment(frameNum, steps, rotatex)
+        channels['rotateY'].addSegment(frameNum, steps, rotatey)
+        self.posz = posz.positionAt(steps)
+        self.rotatex, self.rotatey = rotatex.positionAt(steps), rotatey.positionAt(steps)
+        frameNum += steps
+
+        # stage 3, keep moving along road, rotate slightly up, descend to ground (posy <= 15)
+        posz = KinematicPhase(self.posz, self.velz, 0, FPS)
+        rotatex = KinematicPhase(self.rotatex, 12, 0, FPS)
+        posy = KinematicPhase(self.posy, self.vely, -10, FPS)
+        steps = posy.firstStepWhere('<=', 15)
+        channels['translateY'].addSegment(frameNum, steps, posy)
+        channels['translateZ'].addSegment(frameNum, steps, posz)
+        channels['rotateX'].addSegment(frameNum, steps, rotatex)
+        self.posz = posz.positionAt(steps)
+        self.vely, self.posy = posy.velocityAt(steps), posy.positionAt(steps)
+        self.rotatex = rotatex.positionAt(steps)
+        frameNum += steps
+
+        # stage 4, move backward along road until posz >= 3990
+        posz = KinematicPhase(self.posz, 460, 0, FPS)
+        steps = posz.firstStepWhere('>=', 3990)
+        channels['translateZ'].addSegment(frameNum, steps, posz)
+        self.posz = posz.positionAt(steps)
+        return channels
 
 
 # many cameras involved, create one class to create and animate
 # each of the cams
 class CameraTeam:
-
-    def __init__(self, filePathToCitaFinal, os):
+    # where each cam is put before its keys take over: cam name -> (mover class keying it, translate, rotate)
+    # the car cams get aimed down the road (+z) by their center of interest, camera1moveup is the saved motion path
+    # camera, placed by moving its group
+    CAMERAS = {
+        'camera1moveup': (None, (0, 5, -1700), (0, 0, 0)),
+        'car_cam_left': (CarCam, (-8, 2, -1900), (0, 180, 0)),
+        'car_cam_right': (CarCam, (8, 2, -1900), (0, 180, 0)),
+        'cam_heli_inside': (HeliInsideCam, (0, 394, -1929), (0, 0, 0)),
+        'cam_heli_side': (HeliSideCam, (23, 413, -1964), (0, 0, 0)),
+    }
+    # the movers the cams are simulated with (both car cams share CarCam's simulation)
+    MOVERS = (CarCam, HeliInsideCam, HeliSideCam)
+    # camera1moveup isn't simulated, these are its keys in maFiles/cam1moveup.ma
+    # (its motion path is blended out, so it just rises and tilts down, facing +z)
+    SAVED_CAMERA_KEYS = {
+        'translateY': ([1, 72], [0, 14.848]),
+        'rotateX': ([1, 72], [0, -20]),
+        'rotateY': ([1, 72], [180, 180]),
+    }
+
+    def __init__(self, filePathToCitaFinal, os, backend=None, pool=None, cache=None, frameWindow=None):
         self.filepath_to_citaFinal = filePathToCitaFinal
         self.os = os
+        self.backend = backend if backend is not None else defaultSceneBackend()
+        self.pool = pool if pool is not None else SimulationPool(1)
+        self.cache = cache if cache is not None else SimulationCache()
+        self.frame_window = frameWindow  # (first frame, last frame) to key, None for all of them
+        self.simulations = {}  # mover class -> future of its channelKeys
+        self.lock = threading.Lock()
+
+    # keys of a camera mover, simulated in the pool the first time it's asked for
+    # the cam's motion doesn't depend on its name, so both car cams share one simulation
+    # (stages preparing on different threads can ask for the same one at once, see StageGraph)
+    def simulation(self, moverClass):
+        with self.lock:
+            if moverClass not in self.simulations:
+                self.simulations[moverClass] = self.cache.submitMover(self.pool, moverClass, (moverClass.__name__,),
+                                                                      self.frame_window)
+            return self.simulations[moverClass]
+
+    # keys of every simulated cam, without touching the scene
+    def simulateAll(self):
+        simulations = [self.simulation(moverClass) for moverClass in self.MOVERS]
+        return [simulation.result() for simulation in simulations]
+
+    # (frames, positions, rotations) of every cam on each of frames (default every frame any cam is keyed on,
+    # or the frame window), worked out from the simulations without touching the scene
+    def cameraPaths(self, frames=None):
+        keys = {}
+        for name, (moverClass, translate, rotate) in self.CAMERAS.items():
+            keys[name] = self.SAVED_CAMERA_KEYS if moverClass is None else self.simulation(moverClass).result()
+        if frames is None and self.frame_window is not None:
+            frames = np.arange(self.frame_window[0], self.frame_window[1] + 1)
+        elif frames is None:
+            lastFrame = max(max(times[-1] for times, values in arrays.values() if len(times))
+                            for arrays in keys.values())
+            frames = np.arange(1, int(lastFrame) + 1)
+        frames = np.asarray(frames, dtype=np.float64)
+
+        paths = {}
+        for name, (moverClass, translate, rotate) in self.CAMERAS.items():
+            # a keyed channel holds its first / last key before / after them, like maya's animation curves
+            # (camera1moveup is keyed inside its group, so its keys are on top of the group's translate)
+            channels = []
+            for attribute, value in zip(TRAJECTORY_CHANNELS, list(translate) + list(rotate)):
+                times, values = keys[name].get(attribute, ((), ()))
+                if len(times):
+                    channels.append(np.interp(frames, times, values) + (value if moverClass is None else 0))
+                else:
+                    channels.append(np.full(len(frames), float(value)))
+            channels = np.stack(channels, axis=1)
+            paths[name] = (frames, channels[:, :3], channels[:, 3:])
+        return paths
 
     def addSavedMotionPathCamera(self):
         # saved a camera with motion path as an ma file
@@ -731,357 +3123,1077 @@ class CameraTeam:
             maFilePath = self.filepath_to_citaFinal + "\\maFiles\\"
 
         fileType = "ma"
-        files = cm.getFileList(folder=maFilePath, filespec='*.%s' % fileType)
+        files = self.backend.getFileList(maFilePath, '*.%s' % fileType)
         if len(files) == 0:
-            cm.warning("No files found")
+            self.backend.warning("No files found")
         else:
             for f in files:
-                cm.file(maFilePath + f, i=True)
-        pm.group('curve1', 'camera1moveup', n='cam1group')  # group cam with its motion path
-        pm.select('cam1group')
-        cm.xform(cp=True)
+                self.backend.importFile(maFilePath + f)
+        self.backend.group(['curve1', 'camera1moveup'], 'cam1group')  # group cam with its motion path
+        self.backend.centerPivot('cam1group')
         # cm.makeIdentity(name,t=True,a=True)
-        pm.move('cam1group', 0, 0, 0, a=True)
+        self.backend.move('cam1group', 0, 0, 0)
         # includes upward motion, angling downward as it moves up
-        pm.move(0, 5, -1700)
+        self.backend.move('cam1group', *self.CAMERAS['camera1moveup'][1])
 
-    def addCarCamLeft(self):
+    def addCarCamLeft(self, keys=None):
         # add another cam on car left
-        car_cam_left = pm.nodetypes.Camera(n='car_cam_left')
-
-        car_cam_left.setMotionBlurred(True)
-        pm.select('car_cam_left1')
-        pm.move(-8, 2, -1900, absolute=True)
-        # pm.rotate('180deg','0deg','0deg')
-        centerOfInterest = pm.datatypes.Point(-8, 2, 1500)
+        car_cam_left = self.backend.camera('car_cam_left', motionBlur=True)
 
-        car_cam_left.setCenterOfInterestPoint(centerOfInterest)
+        self.backend.move(car_cam_left, *self.CAMERAS['car_cam_left'][1])
+        # self.backend.rotate(car_cam_left, 180, 0, 0)
+        self.backend.setCenterOfInterest(car_cam_left, (-8, 2, 1500))
 
         # move left cam alongside the car (at same speed/acceleration of car)
-        carcamleft_velz = 360  # car's init z vel is 360, so copy that for both mounted cams
-        carcamleft_accelz = 5  # car init z accel is 5, so copy that for both mounted cams
-
-        carcamleft_posz = -1900  # z position
-        carcamleft_posy = 2  # y position
-
-        carcamleft_vely = 150  # car's init z vel is 360, so copy that for both mounted cams
-        gravityaccel = -9.8
-
-        # copy the while loop used for car motion, change variables
-        frameNum = 1
-        FPS = 24
+        keyArrays(car_cam_left, self.simulation(CarCam).result(), keys, self.backend)
 
-        # stop while car still moving
-        while carcamleft_posz < 2950:
-            # keyframe posz
-            cm.setKeyframe('car_cam_left1', time=frameNum, attribute="translateZ", value=carcamleft_posz)
-
-            # begin vertical movement along ramp
-            if carcamleft_posz > 1470 and carcamleft_posz < 1480:
-                cm.setKeyframe('car_cam_left1', time=frameNum, attribute="translateY", value=carcamleft_posy)
-                carcamleft_vely = carcamleft_vely + gravityaccel * 1.0 / FPS
-                carcamleft_posy = carcamleft_posy + carcamleft_vely * 1.0 / FPS
-
-            # keyframe posz
-            cm.setKeyframe('car_cam_left1', time=frameNum, attribute="translateZ", value=carcamleft_posz)
-
-            # left ramp, amplify accel
-            if carcamleft_posz >= 1480 and carcamleft_posy > 0:
-                cm.setKeyframe('car_cam_left1', time=frameNum, attribute="translateY", value=carcamleft_posy)
-                # amplify downward acceleration due to gravity (not strong enough otherwise)
-                carcamleft_vely = (carcamleft_vely + (gravityaccel * 10) * 1.0 / FPS)
-                carcamleft_posy = carcamleft_posy + carcamleft_vely * 1.0 / FPS
-
-                # also slow down the cameras velz so that car overtakes them in the air
-                carcamleft_velz = carcamleft_velz + (0.1 * carcamleft_accelz) * 1.0 / FPS
-
-            else:  # dont slow down cams yet
-                carcamleft_velz = carcamleft_velz + carcamleft_accelz * 1.0 / FPS
-
-            carcamleft_posz = carcamleft_posz + carcamleft_velz * 1.0 / FPS
-            frameNum += 1
-
-    def addCarCamRight(self):
+    def addCarCamRight(self, keys=None):
         # "mount" a camera to car's right side
 
-        car_cam_right = pm.nodetypes.Camera(n='car_cam_right')
+        car_cam_right = self.backend.camera('car_cam_right', motionBlur=True)
 
-        car_cam_right.setMotionBlurred(True)
-        pm.select('car_cam_right1')
-        pm.move(8, 2, -1900, absolute=True)
-        centerOfInterest = pm.datatypes.Point(8, 2, 1500)
-        car_cam_right.setCenterOfInterestPoint(centerOfInterest)
+        self.backend.move(car_cam_right, *self.CAMERAS['car_cam_right'][1])
+        self.backend.setCenterOfInterest(car_cam_right, (8, 2, 1500))
 
         # move both of these cams alongside the car (at same speed/acceleration of car)
-        carcamright_velz = 360  # car's init z vel is 360, so copy that for both mounted cams
-        carcamright_accelz = 5  # car init z accel is 5, so copy that for both mounted cams
-
-        carcamright_posz = -1900  # z position
-        carcamright_posy = 2  # y position
-
-        carcamright_vely = 150  # car's init z vel is 360, so copy that for both mounted cams
-        gravityaccel = -9.8
-
-        # copy the while loop used for car motion, change variables
-        frameNum = 1
-        FPS = 24
-
-        # stop while car still moving
-        while carcamright_posz < 2950:
-            # keyframe posz
-            cm.setKeyframe('car_cam_right1', time=frameNum, attribute="translateZ", value=carcamright_posz)
-
-            # begin vertical movement along ramp
-            if carcamright_posz > 1470 and carcamright_posz < 1480:
-                cm.setKeyframe('car_cam_right1', time=frameNum, attribute="translateY", value=carcamright_posy)
-                carcamright_vely = carcamright_vely + gravityaccel * 1.0 / FPS
-                carcamright_posy = carcamright_posy + carcamright_vely * 1.0 / FPS
-
-            # key frame posz
-            cm.setKeyframe('car_cam_right1', time=frameNum, attribute="translateZ", value=carcamright_posz)
-
-            # left ramp, amplify accel
-            if carcamright_posz >= 1480 and carcamright_posy > 0:
-                cm.setKeyframe('car_cam_right1', time=frameNum, attribute="translateY", value=carcamright_posy)
-                # amplify downward acceleration due to gravity (not strong enough otherwise)
-                carcamright_vely = (carcamright_vely + (gravityaccel * 10) * 1.0 / FPS)
-                carcamright_posy = carcamright_posy + carcamright_vely * 1.0 / FPS
-
-                # also slow down the cameras velz so that car overtakes them in the air
-                carcamright_velz = carcamright_velz + (0.1 * carcamright_accelz) * 1.0 / FPS
-
-            else:  # dont slow down cams yet
-                carcamright_velz = carcamright_velz + carcamright_accelz * 1.0 / FPS
-
-            carcamright_posz = carcamright_posz + carcamright_velz * 1.0 / FPS
-            frameNum += 1
+        keyArrays(car_cam_right, self.simulation(CarCam).result(), keys, self.backend)
 
     # add cam inside heli looking out (front window)
-    def addHeliInsideCam(self):
+    def addHeliInsideCam(self, keys=None):
 
         # add a cam to side of heli AND inside heli (1 = inside, 2 = top)
 
-        cam_heli1 = pm.nodetypes.Camera(n='cam_heli_inside')
-
-        cam_heli1.setMotionBlurred(True)
-
         # cam inside heli
-        # for some reason it appends a 1 even though it's the only one with this name
-        pm.select('cam_heli_inside1')
-        pm.move(0, 394, -1929)
-
-        cam_heli1posy = 394  # thats where it starts
-        cam_heli1posz = -1929
-        # we want the drop to be slower than the forward motion, so make z magnitude higher than y magnitude
-        cam_heli1accz = 8 # init accel z
-        cam_heli1accy = -7  # init accel y
-        cam_heli1vely = -1.5  # init vel y
-        cam_heli1velz = 410  # init vel z
-
-        # init rotate of cam1
-        cam_heli1rotatex, cam_heli1rotatey, cam_heli1rotatez = -20, 180, 0
-
-        do_rotate = False  # when you reach height 200, set this to true to start rotation
-        frameNum = 1  # init framenumber to 1
-        FPS = 24  # frames per sec constant
-
-        # CAM 1 stuff
-        while cam_heli1posy > 110:
-            # start rotating when inside cam drops to 200
-            if cam_heli1posy <= 200:
-                do_rotate = True
-                if cam_heli1rotatey <= -180:  # stop rotating after complete 180
-                    do_rotate = False
-                # set keyframe on cam1 rotations
-            cm.setKeyframe('cam_heli_inside1', time=frameNum, attribute="rotateX", value=cam_heli1rotatex)
-            cm.setKeyframe('cam_heli_inside1', time=frameNum, attribute="rotateY", value=cam_heli1rotatey)
-            if do_rotate:
-                cam_heli1rotatey = cam_heli1rotatey + (-112) * 1.0 / FPS
-
-            # keyframe translate y cam1
-            cm.setKeyframe('cam_heli_inside1', time=frameNum, attribute="translateY", value=cam_heli1posy)
-            cam_heli1vely = cam_heli1vely + cam_heli1accy * 1.0 / FPS
-            cam_heli1posy = cam_heli1posy + cam_heli1vely * 1.0 / FPS
-            # keyframe translate z cam1
-            cm.setKeyframe('cam_heli_inside1', time=frameNum, attribute="translateZ", value=cam_heli1posz)
-            cam_heli1velz = cam_heli1velz + cam_heli1accz * 1.0 / FPS
-            cam_heli1posz = cam_heli1posz + cam_heli1velz * 1.0 / FPS
-
-            # go to next frame
-            frameNum += 1
-
-        # continue moving back, left, rotate right
-        cam_heli1accx = -7
-        cam_heli1velx = -300
-        cam_heli1posx = 0
-
-        # slow down z vel
-        cam_heli1velz = 0.8 * cam_heli1velz
-        print('just updated cam1 inside vel z to ', cam_heli1velz)
-        for i in range(5):  # another < 1 seconds
-            cm.setKeyframe('cam_heli_inside1', time=frameNum, attribute="translateZ", value=cam_heli1posz)
-            cam_heli1velz = cam_heli1velz + cam_heli1accz * 1.0 / FPS
-            cam_heli1posz = cam_heli1posz + (0.5 * cam_heli1velz) * 1.0 / FPS
-
-            cm.setKeyframe('cam_heli_inside1', time=frameNum, attribute="translateX", value=cam_heli1posx)
-            cam_heli1velx = cam_heli1velx + cam_heli1accx * 1.0 / FPS
-            cam_heli1posx = cam_heli1posx + cam_heli1velx * 1.0 / FPS
+        # for some reason it appends a 1 even though it's the only one with this name (cam_heli_inside1)
+        cam_heli1 = self.backend.camera('cam_heli_inside', motionBlur=True)
 
-            cm.setKeyframe('cam_heli_inside1', time=frameNum, attribute="rotateY", value=cam_heli1rotatey)
-            cam_heli1rotatey = cam_heli1rotatey + (-160) * 1.0 / FPS
+        self.backend.move(cam_heli1, *self.CAMERAS['cam_heli_inside'][1])
 
-            frameNum += 1
+        keyArrays(cam_heli1, self.simulation(HeliInsideCam).result(), keys, self.backend)
 
     # add cam to side of heli
 
-    def addHeliSideCam(self):
+    def addHeliSideCam(self, keys=None):
 
         # add a cam to side of heli AND inside heli (1 = inside, 2 = top)
 
-        cam_heli2 = pm.nodetypes.Camera(n='cam_heli_side')
-
-        cam_heli2.setMotionBlurred(True)
+        cam_heli2 = self.backend.camera('cam_heli_side', motionBlur=True)
 
         # camera on side angled toward heli
-        pm.select('cam_heli_side1')
-        pm.move(23, 413, -1964)
-
-        cam_heli2posy = 413  # thats where it starts
-        cam_heli2posz = -1964
-        # we want the drop to be slower than the forward motion, so make z magnitude higher than y magnitude
-        cam_heli2accz = 8  # init accel z
-        cam_heli2accy = -7  # init accel y
-        cam_heli2vely = -1.5  # init vel y
-        cam_heli2velz = 410  # init vel z
-
-        # init rotate of cam2
-        cam_heli2rotatex, cam_heli2rotatey, cam_heli2rotatez = -51, 166, -17
-
-        do_rotate = False  # when you reach height 200, set this to true to start rotation
-        frameNum = 1  # init framenumber to 1
-        FPS = 24  # frames per sec constant
-
-        cam2_pan_around = False  # when true, pan around heli
-        cam2_pan_around_done = False  # self explanatory, when is it done
-        cam2_begin_descent = False  # after it's done, set to true to begin drop to ground slowly
-
-        # first stage: move forward, descend slightly
-        while cam_heli2posz < -1500:
-            # keep moving cam heli2 along road
-            cm.setKeyframe('cam_heli_side1', time=frameNum, attribute="translateZ", value=cam_heli2posz)
-            cam_heli2velz = cam_heli2velz + cam_heli2accz * 1.0 / FPS
-            cam_heli2posz = cam_heli2posz + cam_heli2velz * 1.0 / FPS
-
-            cm.setKeyframe('cam_heli_side1', time=frameNum, attribute="translateY", value=cam_heli2posy)
-            # if cam heli2 has not reached the ground, keep descending
-            cam_heli2vely = cam_heli2vely + cam_heli2accy * 1.0 / FPS
-            cam_heli2posy = cam_heli2posy + cam_heli2vely * 1.0 / FPS
-
-            # not changing yet
-
-            cm.setKeyframe('cam_heli_side1', time=frameNum, attribute="rotateX", value=cam_heli2rotatex)
-            cm.setKeyframe('cam_heli_side1', time=frameNum, attribute="rotateY", value=cam_heli2rotatey)
+        self.backend.move(cam_heli2, *self.CAMERAS['cam_heli_side'][1])
 
-            frameNum += 1
+        keyArrays(cam_heli2, self.simulation(HeliSideCam).result(), keys, self.backend)
 
-        # now, second stage, speed in front of heli and #lookbackatit
-
-        while cam_heli2rotatex > -30 or cam_heli2rotatey > 10:
-            # print('setting keyframe at rotate x, y, frameNum:', cam_heli2rotatex,cam_heli2rotatey,frameNumCopy)
-            cm.setKeyframe('cam_heli_side1', time=frameNum, attribute="rotateX", value=cam_heli2rotatex)
-            cm.setKeyframe('cam_heli_side1', time=frameNum, attribute="rotateY", value=cam_heli2rotatey)
-            cm.setKeyframe('cam_heli_side1', time=frameNum, attribute="translateZ", value=cam_heli2posz)
-            cam_heli2posz += 460 * 1.0 / FPS
-            cam_heli2rotatey += (-100) * 1.0 / FPS
-            cam_heli2rotatex += (-25) * 1.0 / FPS
-            frameNum += 1
-
-        # end 2nd stage
+        # we want to make this a cinematic experience, so let's bring in the cameras
 
-        # stage 3, keep moving along road, descend to ground
+    # NOTE: DISCOVERED THAT IF YOU ADD OBJECTS AFTER YOU ADD A CAMERA (EVEN IF YOU SPECIFICALLY POSITIONED
+    # THAT CAMERA), THE CAMERA WILL AUTOLOCK ONTO LAST OBJECT ADDED)
+    # SO, ADD CAMERAS AFTER EVERYTHING ELSE HAS BEEN ADDED!
+    def addAllCameras(self, keys=None):
+        # start every cam's simulation before adding any of them, so they run side by side
+        for moverClass in self.MOVERS:
+            self.simulation(moverClass)
+        self.addSavedMotionPathCamera()
+        self.addCarCamLeft(keys)
+        self.addCarCamRight(keys)
+        self.addHeliInsideCam(keys)
+        self.addHeliSideCam(keys)
 
-        while cam_heli2posy > 15:  # while it hasnt hit the ground
-            # key frame those vals to change
-            cm.setKeyframe('cam_heli_side1', time=frameNum, attribute="translateY", value=cam_heli2posy)
-            cm.setKeyframe('cam_heli_side1', time=frameNum, attribute="translateZ", value=cam_heli2posz)
-            cm.setKeyframe('cam_heli_side1', time=frameNum, attribute="rotateX", value=cam_heli2rotatex)
 
-            # change the vals
-            # keep moving along road
-            cam_heli2posz += cam_heli2velz * 1.0 / FPS
-            # rotateslightly up
-            cam_heli2rotatex += (12) * 1.0 / FPS
-            # move down
-            # current cam_heli2accy = -7
-            # current cam_heli2vely = -1.5
-            cam_heli2vely = cam_heli2vely + (-10) * 1.0 / FPS
-            cam_heli2posy = cam_heli2posy + cam_heli2vely * 1.0 / FPS
+# the scene operations this script uses, so the scene can be built either inside maya (MayaSceneBackend)
+# or headless without maya (MemorySceneBackend) for render farm workers, CI boxes and profiling
+# every object, material and attribute is referred to by its name, like maya.cmds does
+class SceneBackend:
+    def polyPlane(self, name, width, height):
+        raise NotImplementedError
 
-            frameNum += 1
+    def polyCube(self, name, width, height, depth):
+        raise NotImplementedError
 
-        # stage 4, move backward along road
-        while cam_heli2posz < 3990:
-            cm.setKeyframe('cam_heli_side1', time=frameNum, attribute="translateZ", value=cam_heli2posz)
+    def polySphere(self, name, radius):
+        raise NotImplementedError
 
-            cam_heli2posz += 460 * 1.0 / FPS
+    # instance source, returns the name of the new instance (maya picks one if name is None)
+    def instance(self, source, name=None):
+        raise NotImplementedError
 
-            frameNum += 1 
+    # an instance of source called names[i] at each of positions (N x 3), with rotations (degrees) and scales
+    # (N x 3 too) if given, all of them given material (if there is one) at once. returns the names they got
+    def instanceArray(self, source, names, positions, rotations=None, scales=None, material=None):
+        placed = []
+        for i, name in enumerate(names):
+            name = self.instance(source, name)
+            self.move(name, *positions[i])
+            if rotations is not None:
+                self.rotate(name, *rotations[i])
+            if scales is not None:
+                self.scale(name, *scales[i])
+            placed.append(name)
+        if material is not None and placed:
+            self.assign(placed, material)
+        return placed
 
-        # we want to make this a cinematic experience, so let's bring in the cameras
+    # copy of mesh source called name, with only percentage % of its polygons
+    def reduceMesh(self, source, name, percentage):
+        raise NotImplementedError
 
-    # NOTE: DISCOVERED THAT IF YOU ADD OBJECTS AFTER YOU ADD A CAMERA (EVEN IF YOU SPECIFICALLY POSITIONED
-    # THAT CAMERA), THE CAMERA WILL AUTOLOCK ONTO LAST OBJECT ADDED)
-    # SO, ADD CAMERAS AFTER EVERYTHING ELSE HAS BEEN ADDED!
-    def addAllCameras(self):
-        self.addSavedMotionPathCamera()
-        self.addCarCamLeft()
-        self.addCarCamRight()
-        self.addHeliInsideCam()
-        self.addHeliSideCam()
+    # absolute move / rotate (degrees)
+    def move(self, objname, x, y, z):
+        raise NotImplementedError
 
+    def rotate(self, objname, x, y, z):
+        raise NotImplementedError
 
+    def scale(self, objname, x, y, z):
+        raise NotImplementedError
+
+    def centerPivot(self, objname):
+        raise NotImplementedError
+
+    def delete(self, objname):
+        raise NotImplementedError
+
+    def group(self, objnames, name):
+        raise NotImplementedError
+
+    def objExists(self, name):
+        raise NotImplementedError
+
+    # how many nodes the scene has, used to count the nodes each stage creates
+    def nodeCount(self):
+        raise NotImplementedError
+
+    # frames the time slider (and a render of the scene) covers
+    def setPlaybackRange(self, firstFrame, lastFrame):
+        raise NotImplementedError
+
+    def setKeyframe(self, objname, time, attribute, value):
+        raise NotImplementedError
+
+    # key a whole animation curve at once, adding to the keys already on it like setKeyframe does
+    def setKeyframes(self, objname, attribute, times, values, tangentType='clamped'):
+        raise NotImplementedError
+
+    def shadingNode(self, nodeType, name, **flags):
+        raise NotImplementedError
+
+    # an empty renderable shading group, returns its name
+    def shadingGroup(self):
+        raise NotImplementedError
+
+    def connectAttr(self, source, destination):
+        raise NotImplementedError
+
+    # make every (source, destination) connection in pairs
+    def connectAttrs(self, pairs):
+        for source, destination in pairs:
+            self.connectAttr(source, destination)
+
+    def setAttr(self, attribute, *values, **flags):
+        raise NotImplementedError
+
+    # assign material to one object or a list of objects (hyperShade assign)
+    def assign(self, objnames, material):
+        raise NotImplementedError
+
+    def displaySurface(self, objname, twoSided=True):
+        raise NotImplementedError
+
+    def importFile(self, path):
+        raise NotImplementedError
+
+    # build an ObjMesh (see MeshCache) as a mesh called name, with its materials on their faces,
+    # returns the name of its transform
+    def createMesh(self, name, mesh):
+        raise NotImplementedError
+
+    def getFileList(self, folder, pattern):
+        raise NotImplementedError
+
+    def warning(self, message):
+        raise NotImplementedError
+
+    # create a camera, returns the name of its transform
+    def camera(self, name, motionBlur=True):
+        raise NotImplementedError
+
+    def setCenterOfInterest(self, cameraName, point):
+        raise NotImplementedError
+
+    # one particle object holding an (N, 3) array of points, returns the name of its shape
+    def particles(self, name, positions):
+        raise NotImplementedError
+
+    # initial value of a per particle attribute (values is (N,) or (N, 3)), adding the attribute if needed
+    def setParticleAttr(self, shape, attribute, values):
+        raise NotImplementedError
+
+    # runtime (before dynamics) expression of a particle shape, in MEL
+    def particleExpression(self, shape, expression):
+        raise NotImplementedError
+
+    # draw source at every particle at render time, returns the name of the instancer
+    def particleInstancer(self, shape, source):
+        raise NotImplementedError
+
+    # create a blinn material (colors are r, g, b triples), returns its name
+    def blinn(self, name, color=None, specularColor=None, reflectivity=None, transparency=None, ambientColor=None):
+        return self.shader('blinn', name, color, specularColor, reflectivity, transparency, ambientColor)
+
+    # create a material of type nodeType (blinn, phong...), the same way as blinn
+    def shader(self, nodeType, name, color=None, specularColor=None, reflectivity=None, transparency=None,
+               ambientColor=None):
+        material = self.shadingNode(nodeType, name, asShader=True)
+        if color is not None:
+            self.setAttr(material + '.color', color[0], color[1], color[2], type='double3')
+        if specularColor is not None:
+            self.setAttr(material + '.specularColor', specularColor[0], specularColor[1], specularColor[2],
+                         type='double3')
+        if ambientColor is not None:
+            self.setAttr(material + '.ambientColor', ambientColor[0], ambientColor[1], ambientColor[2],
+                         type='double3')
+        if reflectivity is not None:
+            self.setAttr(material + '.reflectivity', reflectivity)
+        if transparency is not None:
+            self.setAttr(material + '.transparency', transparency, transparency, transparency, type='double3')
+        return material
+
+
+# builds the scene inside a maya session through pymel / maya.cmds
+class MayaSceneBackend(SceneBackend):
+    def polyPlane(self, name, width, height):
+        return pm.polyPlane(name=name, w=width, h=height)[0].name()
+
+    def polyCube(self, name, width, height, depth):
+        return pm.polyCube(name=name, width=width, height=height, depth=depth)[0].name()
+
+    def polySphere(self, name, radius):
+        return pm.polySphere(name=name, r=radius)[0].name()
+
+    def instance(self, source, name=None):
+        if name is None:
+            return pm.instance(source)[0].name()
+        return pm.instance(source, n=name)[0].name()
+
+    # every instance's transform made by one dag modifier and set through the api, instead of an instance
+    # and a move command (and undo step) each, then the material assigned to all of them in one go
+    def instanceArray(self, source, names, positions, rotations=None, scales=None, material=None):
+        selection = om.MSelectionList()
+        selection.add(source)
+        source_path = selection.getDagPath(0)
+        source_node = om.MFnDagNode(source_path)
+        children = [source_node.child(i) for i in range(source_node.childCount())]
+        # like instance, each copy starts out with source's own rotation and scale
+        transformation = om.MFnTransform(source_path).transformation()
+
+        modifier = om.MDagModifier()
+        transforms = []
+        for name in names:
+            transform = modifier.createNode('transform')
+            modifier.renameNode(transform, name)
+            transforms.append(transform)
+        modifier.doIt()
+
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3).tolist()
+        if rotations is not None:
+            rotations = np.radians(np.asarray(rotations, dtype=np.float64).reshape(-1, 3)).tolist()
+        if scales is not None:
+            scales = np.asarray(scales, dtype=np.float64).reshape(-1, 3).tolist()
+        placed = []
+        for i, transform in enumerate(transforms):
+            node = om.MFnDagNode(transform)
+            # the same shapes under another transform is what an instance is
+            for child in children:
+                node.addChild(child, om.MFnDagNode.kNextPos, True)
+            transform_fn = om.MFnTransform(transform)
+            transform_fn.set(transformation)
+            transform_fn.setTranslation(om.MVector(*positions[i]), om.MSpace.kTransform)
+            if rotations is not None:
+                transform_fn.setRotation(om.MEulerRotation(*rotations[i]), om.MSpace.kTransform)
+            if scales is not None:
+                transform_fn.setScale(scales[i])
+            placed.append(node.partialPathName())
+        if material is not None and placed:
+            self.assign(placed, material)
+        return placed
+
+    def reduceMesh(self, source, name, percentage):
+        mesh = cm.duplicate(source, n=name)[0]
+        # polyReduce's percentage is how much to take away
+        cm.polyReduce(mesh, percentage=100 - percentage, constructionHistory=False)
+        return mesh
+
+    def move(self, objname, x, y, z):
+        cm.move(x, y, z, objname, absolute=True)
+
+    def rotate(self, objname, x, y, z):
+        cm.rotate(x, y, z, objname, absolute=True)
+
+    def scale(self, objname, x, y, z):
+        cm.scale(x, y, z, objname, absolute=True)
+
+    def centerPivot(self, objname):
+        cm.xform(objname, cp=True)
+
+    def delete(self, objname):
+        cm.delete(objname)
+
+    def group(self, objnames, name):
+        return cm.group(objnames, n=name)
+
+    def objExists(self, name):
+        return cm.objExists(name)
+
+    def nodeCount(self):
+        return len(cm.ls())
+
+    def setPlaybackRange(self, firstFrame, lastFrame):
+        cm.playbackOptions(minTime=firstFrame, maxTime=lastFrame, animationStartTime=firstFrame,
+                           animationEndTime=lastFrame)
+
+    def setKeyframe(self, objname, time, attribute, value):
+        cm.setKeyframe(objname, time=time, attribute=attribute, value=value)
+
+    # set all of the times and values at once on the animCurve driving objname.attribute, like cm.setKeyframe
+    # the keys are added to the curve already there (replacing any on the same times), otherwise a new curve
+    # is created and hooked up
+    def setKeyframes(self, objname, attribute, times, values, tangentType='clamped'):
+        if attribute.startswith('rotate'):
+            curveType = 'animCurveTA'
+            values = np.radians(values)  # angular curves store their values in radians
+        elif attribute.startswith('translate'):
+            curveType = 'animCurveTL'
+        else:
+            curveType = 'animCurveTU'
+        plug = '%s.%s' % (objname, attribute)
+        curves = pm.listConnections(plug, source=True, destination=False, type='animCurve')
+        if curves:
+            curve = curves[0]
+        else:
+            curve = pm.createNode(curveType, name='%s_%s' % (objname, attribute))
+            pm.connectAttr(curve.output, plug, force=True)
+        curve.addKeys(np.asarray(times).tolist(), np.asarray(values).tolist(), tangentType, tangentType,
+                      keepExistingKeys=True)
+
+    def shadingNode(self, nodeType, name, **flags):
+        return cm.shadingNode(nodeType, name=name, **flags)
+
+    def shadingGroup(self):
+        return cm.sets(renderable=True, noSurfaceShader=True, empty=True)
+
+    def connectAttr(self, source, destination):
+        cm.connectAttr(source, destination)
+
+    # one dependency graph modifier for all of them, instead of a command (and an undo step) each
+    def connectAttrs(self, pairs):
+        modifier = om.MDGModifier()
+        for source, destination in pairs:
+            plugs = om.MSelectionList()
+            plugs.add(source)
+            plugs.add(destination)
+            modifier.connect(plugs.getPlug(0), plugs.getPlug(1))
+        modifier.doIt()
+
+    def setAttr(self, attribute, *values, **flags):
+        cm.setAttr(attribute, *values, **flags)
+
+    def assign(self, objnames, material):
+        cm.select(objnames)
+        cm.hyperShade(assign=material)
+
+    def displaySurface(self, objname, twoSided=True):
+        cm.displaySurface(objname, two=twoSided)
+
+    def importFile(self, path):
+        cm.file(path, i=True)
+
+    def createMesh(self, name, mesh):
+        mesh_fn = om.MFnMesh()
+        uvs = (mesh.uvs[:, 0].tolist(), mesh.uvs[:, 1].tolist()) if len(mesh.uvs) else ()
+        transform = mesh_fn.create(om.MFloatPointArray(mesh.vertices.tolist()), mesh.face_counts.tolist(),
+                                   mesh.vertex_indices.tolist(), *uvs)
+        if len(mesh.uvs) and (mesh.uv_indices >= 0).all():
+            mesh_fn.assignUVs(mesh.face_counts.tolist(), mesh.uv_indices.tolist())
+        if len(mesh.normals) and (mesh.normal_indices >= 0).all():
+            faces = np.repeat(np.arange(len(mesh.face_counts)), mesh.face_counts)
+            mesh_fn.setFaceVertexNormals(om.MVectorArray(mesh.normals[mesh.normal_indices].tolist()),
+                                         faces.tolist(), mesh.vertex_indices.tolist())
+        name = cm.rename(om.MFnDagNode(transform).fullPathName(), name)
+        for material, color, first, count in mesh.materials:
+            # the same shading groups importing the .obj gives, one lambert per material
+            if material == 'initialShadingGroup' or not material:
+                shading_group = 'initialShadingGroup'
+            elif cm.objExists(material) and cm.nodeType(material) == 'shadingEngine':
+                shading_group = material
+            else:
+                shader = cm.shadingNode('lambert', name=material + 'Lambert', asShader=True)
+                cm.setAttr(shader + '.color', color[0], color[1], color[2], type='double3')
+                shading_group = cm.sets(renderable=True, noSurfaceShader=True, empty=True, name=material)
+                cm.connectAttr(shader + '.outColor', shading_group + '.surfaceShader')
+            cm.sets('%s.f[%d:%d]' % (name, first, first + count - 1), edit=True, forceElement=shading_group)
+        return name
+
+    def getFileList(self, folder, pattern):
+        return cm.getFileList(folder=folder, filespec=pattern) or []
+
+    def warning(self, message):
+        cm.warning(message)
+
+    def camera(self, name, motionBlur=True):
+        camera = pm.nodetypes.Camera(n=name)
+        camera.setMotionBlurred(motionBlur)
+        return camera.getParent().name()
+
+    def setCenterOfInterest(self, cameraName, point):
+        pm.PyNode(cameraName).getShape().setCenterOfInterestPoint(pm.datatypes.Point(*point))
+
+    def particles(self, name, positions):
+        transform, shape = cm.particle(position=[tuple(p) for p in np.asarray(positions).tolist()], name=name)
+        return shape
+
+    def setParticleAttr(self, shape, attribute, values):
+        values = np.asarray(values, dtype=np.float64)
+        dataType = 'vectorArray' if values.ndim == 2 else 'doubleArray'
+        # per particle attributes come in pairs, the attribute and its initial state (attribute + '0')
+        for longName in (attribute, attribute + '0'):
+            if not cm.attributeQuery(longName, node=shape, exists=True):
+                cm.addAttr(shape, longName=longName, dataType=dataType)
+        if dataType == 'vectorArray':
+            cm.setAttr(shape + '.' + attribute + '0', len(values), *[tuple(v) for v in values.tolist()],
+                       type=dataType)
+        else:
+            cm.setAttr(shape + '.' + attribute + '0', values.tolist(), type=dataType)
+
+    def particleExpression(self, shape, expression):
+        cm.dynExpression(shape, string=expression, runtimeBeforeDynamics=True)
+
+    def particleInstancer(self, shape, source):
+        return cm.particleInstancer(shape, addObject=True, object=source)
+
+
+# nodes inside each of the asset files, so MemorySceneBackend can stand in for importing them
+ASSET_NODES = {
+    'audi.mb': ['car'],
+    'heliMoving.mb': ['heli'],
+    'ramp.mb': ['ramp'],
+    'raindrop.obj': ['raindrop'],
+    'streetlight.obj': ['streetlight'],
+    'cam1moveup.ma': ['camera1moveup', 'curve1'],
+}
+
+
+# pure python stand-in for maya that records the scene graph and animation curves in memory,
+# so scene generation can run (and be timed / regression tested) on plain linux
+class MemorySceneBackend(SceneBackend):
+    def __init__(self, assetNodes=None):
+        self.nodes = {}  # name -> dict with the node type, transform, attributes...
+        self.connections = []  # (source, destination) attribute pairs
+        self.materials = {}  # object name -> assigned material name
+        self.curves = {}  # (object name, attribute) -> {time: value}
+        self.curve_tangents = {}  # (object name, attribute) -> tangent type of the keys set in bulk
+        self.playback_range = None
+        self.imported_files = []
+        self.warnings = []
+        self.asset_nodes = assetNodes if assetNodes is not None else ASSET_NODES
+        self.free_suffix = {}  # base name -> lowest number that might still be free, so naming stays O(1)
+
+    # like maya, a name that's already taken gets the next free number put on the end
+    def uniqueName(self, name):
+        if name not in self.nodes:
+            return name
+        base = name.rstrip('0123456789')
+        i = self.free_suffix.get(base, 1)
+        while base + str(i) in self.nodes:
+            i += 1
+        self.free_suffix[base] = i + 1
+        return base + str(i)
+
+    def createNode(self, nodeType, name, **fields):
+        name = self.uniqueName(name)
+        node = {'type': nodeType, 'translate': [0, 0, 0], 'rotate': [0, 0, 0], 'scale': [1, 1, 1], 'attrs': {}}
+        node.update(fields)
+        self.nodes[name] = node
+        return name
+
+    def node(self, name):
+        if name not in self.nodes:
+            raise RuntimeError('No object matches name: %s' % name)
+        return self.nodes[name]
+
+    def polyPlane(self, name, width, height):
+        return self.createNode('mesh', name, geometry=('polyPlane', {'width': width, 'height': height}))
+
+    def polyCube(self, name, width, height, depth):
+        return self.createNode('mesh', name,
+                               geometry=('polyCube', {'width': width, 'height': height, 'depth': depth}))
+
+    def polySphere(self, name, radius):
+        return self.createNode('mesh', name, geometry=('polySphere', {'radius': radius}))
+
+    def instance(self, source, name=None):
+        node = self.node(source)
+        return self.createNode(node['type'], name if name is not None else source,
+                               instanceOf=node.get('instanceOf', source), geometry=node.get('geometry'))
+
+    def instanceArray(self, source, names, positions, rotations=None, scales=None, material=None):
+        node = self.node(source)
+        if material is not None:
+            self.node(material)
+        instance_of = node.get('instanceOf', source)
+        positions = np.asarray(positions).reshape(-1, 3).tolist()
+        rotations = np.asarray(rotations).reshape(-1, 3).tolist() if rotations is not None else None
+        scales = np.asarray(scales).reshape(-1, 3).tolist() if scales is not None else None
+        placed = []
+        for i, name in enumerate(names):
+            name = self.createNode(node['type'], name, instanceOf=instance_of, geometry=node.get('geometry'),
+                                   translate=positions[i])
+            if rotations is not None:
+                self.nodes[name]['rotate'] = rotations[i]
+            if scales is not None:
+                self.nodes[name]['scale'] = scales[i]
+            if material is not None:
+                self.materials[name] = material
+            placed.append(name)
+        return placed
+
+    def reduceMesh(self, source, name, percentage):
+        node = self.node(source)
+        return self.createNode('mesh', name, translate=list(node['translate']),
+                               geometry=('polyReduce', {'source': source, 'percentage': percentage}))
+
+    def move(self, objname, x, y, z):
+        self.node(objname)['translate'] = [x, y, z]
+
+    def rotate(self, objname, x, y, z):
+        self.node(objname)['rotate'] = [x, y, z]
+
+    def scale(self, objname, x, y, z):
+        self.node(objname)['scale'] = [x, y, z]
+
+    def centerPivot(self, objname):
+        self.node(objname)['centeredPivot'] = True
+
+    def delete(self, objname):
+        self.node(objname)
+        del self.nodes[objname]
+        base = objname.rstrip('0123456789')
+        if base != objname and base in self.free_suffix:
+            self.free_suffix[base] = min(self.free_suffix[base], int(objname[len(base):]))
+
+    def group(self, objnames, name):
+        for objname in objnames:
+            self.node(objname)['parent'] = name
+        return self.createNode('transform', name, children=list(objnames))
+
+    def objExists(self, name):
+        return name in self.nodes
+
+    def nodeCount(self):
+        return len(self.nodes)
+
+    def setPlaybackRange(self, firstFrame, lastFrame):
+        self.playback_range = (firstFrame, lastFrame)
+
+    def setKeyframe(self, objname, time, attribute, value):
+        self.node(objname)
+        self.curves.setdefault((objname, attribute), {})[time] = value
+
+    def setKeyframes(self, objname, attribute, times, values, tangentType='clamped'):
+        self.node(objname)
+        self.curves.setdefault((objname, attribute), {}).update(
+            zip(np.asarray(times).tolist(), np.asarray(values).tolist()))
+        self.curve_tangents[(objname, attribute)] = tangentType
+
+    # the (times, values) keyed on objname.attribute, in time order
+    def keyframes(self, objname, attribute):
+        curve = self.curves.get((objname, attribute), {})
+        times = sorted(curve)
+        return times, [curve[time] for time in times]
+
+    def shadingNode(self, nodeType, name, **flags):
+        return self.createNode(nodeType, name, flags=flags)
+
+    def shadingGroup(self):
+        return self.createNode('shadingEngine', 'blinn1SG')
+
+    def connectAttr(self, source, destination):
+        self.node(source.split('.')[0])
+        self.node(destination.split('.')[0])
+        self.connections.append((source, destination))
+
+    def connectAttrs(self, pairs):
+        pairs = list(pairs)
+        for source, destination in pairs:
+            self.node(source.split('.')[0])
+            self.node(destination.split('.')[0])
+        self.connections.extend(pairs)
+
+    def setAttr(self, attribute, *values, **flags):
+        objname, attr = attribute.split('.', 1)
+        self.node(objname)['attrs'][attr] = values[0] if len(values) == 1 else tuple(values)
+
+    def assign(self, objnames, material):
+        self.node(material)
+        if not isinstance(objnames, (list, tuple)):
+            objnames = [objnames]
+        for objname in objnames:
+            self.node(objname)
+            self.materials[objname] = material
+
+    def displaySurface(self, objname, twoSided=True):
+        self.node(objname)['attrs']['doubleSided'] = twoSided
+
+    def createMesh(self, name, mesh):
+        return self.createNode('mesh', name, geometry=('mesh', {
+            'vertices': len(mesh.vertices), 'faces': len(mesh.face_counts),
+            'materials': [(material, first, count) for material, color, first, count in mesh.materials]}))
+
+    def importFile(self, path):
+        self.imported_files.append(path)
+        filename = os.path.basename(path.replace('\\', '/'))
+        for name in self.asset_nodes.get(filename, [os.path.splitext(filename)[0]]):
+            self.createNode('transform', name, source=path)
+
+    def getFileList(self, folder, pattern):
+        folder = folder.replace('\\', '/')
+        if not os.path.isdir(folder):
+            return []
+        return sorted(f for f in os.listdir(folder) if fnmatch.fnmatch(f, pattern))
+
+    def warning(self, message):
+        self.warnings.append(message)
+        logger.warning(message)
+
+    def camera(self, name, motionBlur=True):
+        shape = self.createNode('camera', name, attrs={'motionBlur': motionBlur})
+        return self.createNode('transform', name, shape=shape)
+
+    def setCenterOfInterest(self, cameraName, point):
+        self.node(cameraName)['attrs']['centerOfInterestPoint'] = tuple(point)
+
+    def particles(self, name, positions):
+        positions = np.array(positions, dtype=np.float64).reshape(-1, 3)
+        shape = self.createNode('particle', name + 'Shape', perParticle={'position': positions})
+        self.createNode('transform', name, shape=shape)
+        return shape
+
+    def setParticleAttr(self, shape, attribute, values):
+        self.node(shape)['perParticle'][attribute] = np.array(values, dtype=np.float64)
+
+    def particleExpression(self, shape, expression):
+        self.node(shape)['attrs']['runtimeBeforeDynamicsExpression'] = expression
+
+    def particleInstancer(self, shape, source):
+        self.node(source)
+        self.node(shape)['attrs']['instancer'] = self.createNode('instancer', 'instancer1', source=source,
+                                                                 particles=shape)
+        return self.node(shape)['attrs']['instancer']
+
+
+# the backend every class uses when it isn't handed one: maya when it's available, otherwise the
+# in-memory recorder (all the classes have to share the same one so they build the same scene)
+default_scene_backend = None
+
+
+def defaultSceneBackend():
+    global default_scene_backend
+    if default_scene_backend is None:
+        default_scene_backend = MayaSceneBackend() if cm is not None else MemorySceneBackend()
+    return default_scene_backend
+
+
+def setDefaultSceneBackend(backend):
+    global default_scene_backend
+    default_scene_backend = backend
+
+
+# the citaFinal folder this script lives in (only known when it's run as a file, not pasted into maya)
+def citaFinalDirectory():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# records wall time, peak memory, nodes created and keys set for each stage of main()
+# stages nest (with profiler.stage('city'): inside with profiler.stage('environment'):), and the result can be
+# written as a JSON report and as a chrome trace (chrome://tracing, perfetto, speedscope) to view as a flame graph
+# stages can run on other threads too (see StageGraph), each thread gets its own track in the trace. the peak
+# memory of a stage is the most in use at once while it ran, so with stages side by side it includes theirs
+class StageProfiler:
+    def __init__(self, backend=None, keys=None, traceMemory=True):
+        self.backend = backend if backend is not None else defaultSceneBackend()
+        self.keys = keys  # KeyframeBuffer to count buffered / written keys on
+        self.trace_memory = traceMemory
+        self.stages = []  # one dict per finished stage, in the order they finished
+        self.open_stages = {}  # thread -> its stages open right now, outermost first
+        self.threads = {}  # thread -> its track in the trace, 1 for the first one seen (main()'s)
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+
+    def counters(self):
+        keys_buffered = self.keys.num_keys_buffered if self.keys is not None else 0
+        keys_written = self.keys.num_keys_out if self.keys is not None else 0
+        return self.backend.nodeCount(), keys_buffered, keys_written
+
+    # the peak since the last stage started or ended goes to every stage open now, on any thread,
+    # then the peak restarts. returns the memory in use
+    def updatePeaks(self):
+        current, peak = tracemalloc.get_traced_memory()
+        for stages in self.open_stages.values():
+            for stage in stages:
+                stage['peak'] = max(stage['peak'], peak)
+        tracemalloc.reset_peak()
+        return current
+
+    # scene=False is for stages that don't touch the scene (run on other threads), so the nodes and keys
+    # made meanwhile, on the main thread, aren't put down to them
+    @contextlib.contextmanager
+    def stage(self, name, scene=True):
+        thread = threading.get_ident()
+        with self.lock:
+            if self.trace_memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current = self.updatePeaks() if self.trace_memory else 0
+            open_stages = self.open_stages.setdefault(thread, [])
+            track = self.threads.setdefault(thread, len(self.threads) + 1)
+            path = '/'.join([stage['name'] for stage in open_stages] + [name])
+            stage = {'name': name, 'path': path, 'depth': len(open_stages), 'memory': current, 'peak': current,
+                     'counters': self.counters() if scene else (0, 0, 0), 'start': time.perf_counter()}
+            open_stages.append(stage)
+        try:
+            yield stage
+        finally:
+            with self.lock:
+                end = time.perf_counter()
+                if self.trace_memory:
+                    self.updatePeaks()
+                open_stages.pop()
+                nodes, keys_buffered, keys_written = [after - before for after, before in
+                                                      zip(self.counters() if scene else (0, 0, 0),
+                                                          stage['counters'])]
+                self.stages.append({
+                    'stage': path,
+                    'depth': stage['depth'],
+                    'thread': track,
+                    'start_s': stage['start'] - self.start,
+                    'wall_time_s': end - stage['start'],
+                    # most memory in use at once during the stage, above what was in use when it started
+                    'peak_memory_bytes': stage['peak'] - stage['memory'] if self.trace_memory else None,
+                    'nodes_created': nodes,
+                    'keys_buffered': keys_buffered,
+                    'keys_written': keys_written,
+                })
+
+    # stages in the order they started
+    def report(self):
+        return sorted(self.stages, key=lambda stage: (stage['start_s'], stage['depth']))
+
+    def writeReport(self, path):
+        with open(path, 'w') as f:
+            json.dump({'stages': self.report()}, f, indent=2)
+
+    # chrome trace event format, one complete ('X') event per stage in microseconds
+    def writeTrace(self, path):
+        events = [{'name': stage['stage'].split('/')[-1], 'cat': 'stage', 'ph': 'X', 'pid': 1, 'tid': stage['thread'],
+                   'ts': stage['start_s'] * 1e6, 'dur': stage['wall_time_s'] * 1e6,
+                   'args': dict((field, stage[field]) for field in
+                                ('peak_memory_bytes', 'nodes_created', 'keys_buffered', 'keys_written'))}
+                  for stage in self.report()]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    # report at path, trace next to it (report.json -> report.trace.json)
+    def write(self, path):
+        self.writeReport(path)
+        self.writeTrace(os.path.splitext(path)[0] + '.trace.json')
+
+    def summary(self):
+        lines = ['%-40s %9s %12s %8s %8s' % ('stage', 'seconds', 'peak memory', 'nodes', 'keys')]
+        for stage in self.report():
+            memory = stage['peak_memory_bytes']
+            lines.append('%-40s %9.3f %12s %8d %8d' % (
+                '  ' * stage['depth'] + stage['stage'].split('/')[-1], stage['wall_time_s'],
+                '-' if memory is None else '%.1f MB' % (memory / 1e6), stage['nodes_created'],
+                stage['keys_buffered'] + stage['keys_written']))
+        return '\n'.join(lines)
+
+    def stop(self):
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+# runs the stages of main() in the order their dependencies allow, side by side where they can be.
+# a stage is the pure python work it does (prepare: simulation, layout, parsing, anything that doesn't touch
+# the scene) and the scene calls that use what that work returns (build). each prepare runs on a thread as soon
+# as the stages it comes after are done, and the builds run one at a time on the main thread, the only one maya's
+# scene can be changed from, in the order the stages were added, so the scene comes out the same whichever
+# prepare finishes first
+class StageGraph:
+    def __init__(self, profiler=None, threads=None):
+        self.profiler = profiler  # StageProfiler to profile each build with, None for no profile
+        self.threads = threads  # how many prepares run at once, None for concurrent.futures' default
+        self.stages = []  # one dict per stage, in the order they were added (and are built)
+        self.by_name = {}
+        self.start = None
+
+    # prepare() returns what build(prepared) is called with (build() without a prepare), and either can be None
+    # after is the names of the stages that have to be done before this one starts (its prepare, if it has one),
+    # they have to be added before it. a build always comes after the builds of the stages added before it
+    def add(self, name, build=None, after=(), prepare=None):
+        if name in self.by_name:
+            raise ValueError('stage %s is added twice' % name)
+        for dependency in after:
+            if dependency not in self.by_name:
+                raise ValueError('stage %s comes after %s, which has to be added first' % (name, dependency))
+        stage = {'name': name, 'index': len(self.stages), 'build': build, 'prepare': prepare, 'after': list(after),
+                 'future': None, 'result': None, 'done': False, 'prepare_start': None, 'prepare_end': None,
+                 'build_start': None, 'build_end': None}
+        self.stages.append(stage)
+        self.by_name[name] = stage
+        return stage
+
+    def names(self):
+        return [stage['name'] for stage in self.stages]
+
+    # what a finished stage's build returned (its prepare if it has no build)
+    def result(self, name):
+        return self.by_name[name]['result']
+
+    # whether stage's prepare has finished (or it has none)
+    def prepared(self, stage):
+        return stage['prepare'] is None or stage['future'] is not None and stage['future'].done()
+
+    def prepareStage(self, stage):
+        stage['prepare_start'] = time.perf_counter() - self.start
+        try:
+            if self.profiler is None:
+                return stage['prepare']()
+            # on its thread's track in the trace, next to the builds
+            with self.profiler.stage(stage['name'] + '.prepare', scene=False):
+                return stage['prepare']()
+        finally:
+            stage['prepare_end'] = time.perf_counter() - self.start
+
+    def buildStage(self, stage):
+        stage['build_start'] = time.perf_counter() - self.start
+        prepared = stage['future'].result() if stage['future'] is not None else None
+        if self.profiler is not None:
+            with self.profiler.stage(stage['name']):
+                stage['result'] = stage['build'](prepared) if stage['prepare'] is not None else stage['build']()
+        else:
+            stage['result'] = stage['build'](prepared) if stage['prepare'] is not None else stage['build']()
+        stage['build_end'] = time.perf_counter() - self.start
+        stage['done'] = True
+
+    def run(self):
+        self.start = time.perf_counter()
+        executor = concurrent.futures.ThreadPoolExecutor(self.threads)
+        try:
+            waiting = list(self.stages)
+            while waiting:
+                for stage in waiting:
+                    if stage['prepare'] is not None and stage['future'] is None and \
+                            all(self.by_name[name]['done'] for name in stage['after']):
+                        stage['future'] = executor.submit(self.prepareStage, stage)
+                    # a stage without a build is done as soon as its prepare is
+                    if stage['build'] is None and self.prepared(stage):
+                        stage['result'] = stage['future'].result() if stage['future'] is not None else None
+                        stage['done'] = True
+                waiting = [stage for stage in waiting if not stage['done']]
+                builds = [stage for stage in waiting if stage['build'] is not None]
+                # the builds before the next one are done, but the stages it needs may still be preparing
+                if builds and all(self.by_name[name]['done'] for name in builds[0]['after']) and \
+                        self.prepared(builds[0]):
+                    self.buildStage(builds[0])
+                    continue
+                # nothing to build until another prepare finishes
+                running = [stage['future'] for stage in waiting if stage['future'] is not None and
+                           not stage['future'].done()]
+                concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+        finally:
+            executor.shutdown()
+
+    # when each stage was done
+    def end(self, stage):
+        if stage['build'] is not None:
+            return stage['build_end']
+        return stage['prepare_end'] if stage['prepare'] is not None else 0.0
+
+    # the chain of stages that decided how long run took: the one done last, then whichever stage it was last
+    # waiting for, back to the first. a stage waits for the last of the stages it comes after to be done, and its
+    # build for its prepare and for the main thread, busy with the build before it
+    def criticalPath(self):
+        if not self.stages:
+            return []
+        stage = max(self.stages, key=self.end)
+        path = [stage]
+        while True:
+            before = [self.by_name[name] for name in stage['after']]
+            if stage['build'] is not None:
+                builds = [other for other in self.stages[:stage['index']] if other['build'] is not None]
+                main_thread = builds[-1] if builds else None
+                if main_thread is not None and (stage['prepare'] is None or
+                                                main_thread['build_end'] >= stage['prepare_end']):
+                    before.append(main_thread)
+            if not before:
+                break
+            stage = max(before, key=self.end)
+            path.append(stage)
+        return [stage['name'] for stage in reversed(path)]
+
+    def report(self):
+        critical = self.criticalPath()
+        lines = ['%-24s %9s %9s %9s' % ('stage', 'prepare', 'build', 'done at')]
+        for stage in self.stages:
+            prepare = '-' if stage['prepare_start'] is None else \
+                '%.3f' % (stage['prepare_end'] - stage['prepare_start'])
+            build = '-' if stage['build_start'] is None else '%.3f' % (stage['build_end'] - stage['build_start'])
+            lines.append('%-24s %9s %9s %9.3f%s' % (stage['name'], prepare, build, self.end(stage),
+                                                     ' *' if stage['name'] in critical else ''))
+        lines.append('critical path (*): ' + ' -> '.join(critical))
+        return '\n'.join(lines)
 
 
 # YOU DEFINE THE filepath_to_citaFinal
 # it should be in format 'somedirectory/someotherdirectory/someparentdirectory/citaFinal'
 # where someparentdirectory/ is the parent folder of citaFinal
-def main():
+# workers is how many processes simulate rain/vehicles/cameras (1 = no worker processes), the default simulates
+# in this process unless there's enough rain to be worth one per core (see SimulationPool)
+# positionTolerance / rotationTolerance is how far (scene units / degrees) simplified curves may stray
+# from the simulated keys, None (the default) keys every frame
+# rainParticles=True makes the rain one particle object instead of one animated transform per drop
+# cacheDirectory is a folder to keep simulation results in between runs, so a rerun only recomputes
+# the stages whose parameters changed (None = no cache)
+# profilePath is where to write the per stage timing/memory report (JSON), the chrome trace goes next to it
+# as <profilePath without .json>.trace.json
+# frameWindow = (first frame, last frame) builds the scene for just those frames: every animator jumps
+# straight to the first frame and only keys the window, so render nodes can each build their own slice
+# spatialIndex is filled in with the bounding box of every building, streetlight and raindrop (see SpatialIndex)
+# cullToCameras=True leaves out the buildings and raindrops none of the cams ever frame (see framedBoxes). it's off
+# by default, the cams' frusta come from CAMERA_FOCAL_LENGTH / CAMERA_FILM_GATE and the saved camera's keys rather
+# than the camera nodes themselves, so it can leave out things a render would show
+# tileCity=True builds the city a block at a time, only the blocks the cams reach (see TiledCity), its buildings
+# are then called block<block>_building<i> instead of building<i>
+# levelOfDetail=True switches each streetlight to a lower detail mesh on the frames it's small on screen
+# (off by default, it adds a polyReduce'd copy per level and keys which one shows, see LevelOfDetail)
+# stageThreads is how many stages do their simulation / layout / parsing at once, while the scene is built
+# (None = concurrent.futures' default, see StageGraph)
+def main(filepath_to_citaFinal=None, backend=None, seed=None, workers=None, positionTolerance=None,
+         rotationTolerance=None, rainParticles=False, cacheDirectory=None, profilePath=None, frameWindow=None,
+         spatialIndex=None, cullToCameras=False, levelOfDetail=False, tileCity=False, stageThreads=None):
     os = platform.system()  # get the os, filepaths are formatted differently for Mac OS and Windows
     # simplify
-    if "Darwin" in os:
-        os = "Mac"
-        filepath_to_citaFinal = "Users/austinhunt/Desktop/citaFinal"
-    elif "Windows" in os:
+    if "Windows" in os:
         os = "Windows"
-        filepath_to_citaFinal = "C:\\Users\\huntaj\\Desktop\\citaFinal"  # copy your filepath here, this is an example
-
-    # instantiate road
-    road = Road(filepath_to_citaFinal, 50, 8000, os)
-    road.generate()
-
-    # instantiate ground
-    ground = Ground(filepath_to_citaFinal, 1500, 8000, os)
-    ground.generate()
-
-    # instantiate background
-    background = Background(filepath_to_citaFinal, 1200, 800, os)
-    background.generate()
-
-    #instantiate world
-    world = World(filepath_to_citaFinal,os)
-    world.generate()
-
-    city = City(filepath_to_citaFinal,os)
-    city.generateBuildings()
-
-    animation = FinalAnimation(filepath_to_citaFinal,os)
-    animation.getObjFiles()
-    animation.centerAllPivots()
-    animation.initialize_objects()
-    animation.animateCarAndHeli()
-    animation.rainSimulation(100)
-
-    camTeam = CameraTeam(filepath_to_citaFinal, os)
-    camTeam.addAllCameras() # do this last to prevent cams from autolocking on newly added objects
-
-main()
\ No newline at end of file
+        if filepath_to_citaFinal is None:
+            filepath_to_citaFinal = "C:\\Users\\huntaj\\Desktop\\citaFinal"  # copy your filepath here, this is an example
+    elif "Darwin" in os:
+        os = "Mac"
+        if filepath_to_citaFinal is None:
+            filepath_to_citaFinal = "Users/austinhunt/Desktop/citaFinal"
+    else:
+        # linux (render farm workers, CI boxes) uses the same / separated filepaths as Mac
+        os = "Mac"
+        if filepath_to_citaFinal is None:
+            filepath_to_citaFinal = citaFinalDirectory()
+
+    # maya when it's available, otherwise an in-memory scene
+    if backend is None:
+        backend = defaultSceneBackend()
+    # same seed -> same city and rain
+    scene_random = SceneRandom(seed)
+    print('scene seed: %d' % scene_random.seed)
+    pool = SimulationPool(workers)
+    cache = SimulationCache(cacheDirectory)
+    # the .obj assets are cached (as binary meshes) alongside the simulations
+    mesh_cache = MeshCache(cacheDirectory, pool) if cacheDirectory is not None else None
+    if spatialIndex is None:
+        spatialIndex = SpatialIndex()
+    # collect every key while simulating, then write each animation curve once at the end
+    keys = KeyframeBuffer(backend, positionTolerance=positionTolerance, rotationTolerance=rotationTolerance)
+    # memory tracing slows everything down, so only when a report was asked for
+    profiler = StageProfiler(backend, keys, traceMemory=profilePath is not None)
+    # every class gets its materials from the same library, so none is built twice
+    materials = MaterialLibrary(backend)
+
+    # every stage's pure python work runs on its own thread as soon as what it needs is done, and its scene calls
+    # on this one, in the order the stages are added here (see StageGraph)
+    graph = StageGraph(profiler, stageThreads)
+
+    # the cams' paths are simulated up front, so whatever none of them frames is never built
+    # and the detail of what they do frame can follow them (the cams are still added last, see addAllCameras)
+    camTeam = CameraTeam(filepath_to_citaFinal, os, backend, pool, cache, frameWindow)
+    camera_paths = lambda: graph.result('cameraPaths')
+    if cullToCameras or levelOfDetail or tileCity:
+        graph.add('cameraPaths', prepare=camTeam.cameraPaths)
+
+    # the environment's pieces don't depend on each other
+    road = Road(filepath_to_citaFinal, 50, 8000, os, backend, materials)
+    graph.add('road', road.generate)
+    ground = Ground(filepath_to_citaFinal, 1500, 8000, os, backend, materials)
+    graph.add('ground', ground.generate)
+    background = Background(filepath_to_citaFinal, 1200, 800, os, backend, materials)
+    graph.add('background', background.generate)
+    world = World(filepath_to_citaFinal, os, backend, materials)
+    graph.add('world', world.generate)
+
+    # the city is laid out (and culled) while the rest is built, its buildings then all made in one go
+    city = City(filepath_to_citaFinal, os, backend, scene_random, cache, spatialIndex, materials)
+    if tileCity:
+        # the same 6000 of road as generateBuildings, but only the blocks the cams see get made
+        tiles = TiledCity(city, numBlocks=10)
+        graph.add('cityMaterials', tiles.buildingMaterials)
+        graph.add('cityPlan', after=['cameraPaths'], prepare=lambda: tiles.planBlocks(camera_paths()))
+        graph.add('city', tiles.buildLayouts, after=['cityMaterials', 'cityPlan'],
+                  prepare=lambda: tiles.layoutBlocks(tiles.blocksUntil(), camera_paths() if cullToCameras else None))
+    else:
+        graph.add('cityMaterials', city.generate_building_materials)
+        graph.add('city', lambda plan: city.buildBuildings(*plan),
+                  after=['cityMaterials'] + (['cameraPaths'] if cullToCameras else []),
+                  prepare=lambda: city.planBuildings(graph.result('cityMaterials'),
+                                                     cameraPaths=camera_paths() if cullToCameras else None))
+
+    animation = FinalAnimation(filepath_to_citaFinal, os, backend, scene_random, pool, cache, frameWindow,
+                               spatialIndex, None, materials, mesh_cache)
+    # the .obj files are parsed (or loaded from the mesh cache) while the environment is built
+    obj_paths = animation.objFilePaths()
+    graph.add('getObjFiles', lambda meshes: animation.getObjFiles(obj_paths, meshes),
+              prepare=lambda: animation.loadObjFiles(obj_paths))
+    graph.add('centerAllPivots', animation.centerAllPivots, after=['getObjFiles'])
+    if levelOfDetail:
+        graph.add('levelOfDetail', lambda lod: setattr(animation, 'level_of_detail', lod), after=['cameraPaths'],
+                  prepare=lambda: LevelOfDetail(camera_paths(), backend, keys))
+    graph.add('initialize_objects', animation.initialize_objects, after=['centerAllPivots'])
+
+    # the simulations don't need any geometry, only keying them does (so they're built after the models are)
+    graph.add('vehicles', lambda simulations: animation.animateCarAndHeli(keys, simulations),
+              prepare=animation.simulateCarAndHeli)
+    graph.add('rain', lambda plan: animation.rainSimulation(100, keys, rainParticles, plan=plan),
+              after=['cameraPaths'] if cullToCameras else [],
+              prepare=lambda: animation.planRain(100, rainParticles, camera_paths() if cullToCameras else None))
+
+    # added last, so built last, to prevent cams from autolocking on newly added objects
+    graph.add('cameras', lambda simulations: camTeam.addAllCameras(keys), prepare=camTeam.simulateAll)
+    try:
+        graph.run()
+    finally:
+        pool.shutdown()
+
+    with profiler.stage('keyframes'):
+        keys.flush()
+    if frameWindow is not None:
+        backend.setPlaybackRange(*frameWindow)
+    profiler.stop()
+    print(keys.writeReport())
+    print(keys.reductionReport())
+    print(cache.report())
+    if mesh_cache is not None:
+        print(mesh_cache.report())
+    print('critical path: ' + ' -> '.join(graph.criticalPath()))
+    if profilePath is not None:
+        print(profiler.summary())
+        print(graph.report())
+        profiler.write(profilePath)
+    return backend
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the scene script isn't a package, it's imported from the folder it's pasted from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+
+import mayaFinalCodeNov28 as scene
+
+CITA_FINAL = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def generatedCity(seed=5, **flags):
+    backend = scene.MemorySceneBackend()
+    city = scene.City(CITA_FINAL, 'Mac', backend, scene.SceneRandom(seed))
+    city.generateBuildings(**flags)
+    return backend, city
+
+
+def buildingNames(backend):
+    return sorted(name for name in backend.nodes if name.startswith('building') and name[8:].isdigit())
+
+
+# every building gets the material it was laid out with, instanced or not
+def test_every_building_gets_its_material():
+    city = generatedCity()[1]
+    layout, names = city.planBuildings(city.generate_building_materials())
+    for instanced in (False, True):
+        backend = generatedCity(instanced=instanced)[0]
+        assert buildingNames(backend) == sorted(names)
+        assert [backend.materials.get(name) for name in names] == [building[5] for building in layout]
+
+
+# an instanced city is the same city, its buildings scaled unit cubes instead of cubes of their own size
+def test_instanced_buildings_match_separate_cubes():
+    separate = generatedCity()[0]
+    instanced = generatedCity(instanced=True)[0]
+    names = buildingNames(separate)
+    assert buildingNames(instanced) == names
+    for name in names:
+        cube, instance = separate.nodes[name], instanced.nodes[name]
+        size = cube['geometry'][1]
+        assert instance['translate'] == cube['translate']
+        assert instance['scale'] == [size['width'], size['height'], size['depth']]
+        assert instanced.materials[name] == separate.materials[name]
+        source = instanced.nodes[instance['instanceOf']]
+        assert source['geometry'][1] == {'width': 1, 'height': 1, 'depth': 1}
+        assert source['attrs']['visibility'] == 0
+
+
+# a cam looking down the road from z=-2000 only reaches the first blocks, the ones past its far clip are never
+# laid out, let alone built
+def test_blocks_no_cam_reaches_are_never_laid_out():
+    backend = scene.MemorySceneBackend()
+    city = scene.City(CITA_FINAL, 'Mac', backend, scene.SceneRandom(5))
+    laidOut = []
+    layout = city.layout
+    city.layout = lambda roadSides, zs, materials: laidOut.append(list(zs)) or layout(roadSides, zs, materials)
+    tiles = scene.TiledCity(city, numBlocks=100)
+    paths = {'cam': (np.array([1.0, 2.0]), np.array([[0, 5, -2000], [0, 5, -1000]], dtype=np.float64),
+                     np.array([[0, 180, 0], [0, 180, 0]], dtype=np.float64))}
+    # the view reaches 10000 past the cam, so up to z=8000 on the first frame and 9000 on the second: the
+    # blocks starting (less the building depth) before then
+    assert tiles.planBlocks(paths) == dict([(block, 1.0) for block in range(17)] + [(17, 2.0), (18, 2.0)])
+    assert tiles.buildUntil(1) == list(range(17))
+    assert tiles.buildUntil() == [17, 18]
+    assert laidOut == [list(tiles.blockZs(block)) for block in range(19)]
+    assert tiles.buildUntil() == [] and len(laidOut) == 19
+    assert sorted(name for name in backend.nodes if name.startswith('block')) == sorted(
+        'block%d_building%d' % (block, i) for block in range(19) for i in range(72))
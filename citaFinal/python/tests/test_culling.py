@@ -0,0 +1,112 @@
+import math
+import os
+import re
+
+import numpy as np
+
+import mayaFinalCodeNov28 as scene
+
+CITA_FINAL = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SAVED_CAMERA = os.path.join(CITA_FINAL, 'maFiles', 'cam1moveup.ma')
+
+
+# one cam standing still at position with rotation on frames 1...numFrames
+def stillCamera(position, rotation, numFrames=2):
+    frames = np.arange(1, numFrames + 1, dtype=np.float64)
+    return {'cam': (frames, np.tile(np.asarray(position, dtype=np.float64), (numFrames, 1)),
+                    np.tile(np.asarray(rotation, dtype=np.float64), (numFrames, 1)))}
+
+
+def inside(planes, point):
+    return (planes[:, :3].dot(point) + planes[:, 3] >= 0).all()
+
+
+# a maya cam looks down its -z axis, as wide as the 36mm gate is on a 35mm lens
+def test_frustum_is_the_lens_view():
+    planes, corners = scene.cameraFrustum((0, 0, 0), (0, 0, 0))
+    edge = 100 * 18.0 / 35
+    assert inside(planes, (0, 0, -100))
+    assert not inside(planes, (0, 0, 100))
+    assert inside(planes, (edge - 0.01, 0, -100)) and not inside(planes, (edge + 0.01, 0, -100))
+    assert inside(planes, (0, 100 * 12.0 / 35 - 0.01, -100)) and not inside(planes, (0, 100 * 12.0 / 35 + 0.01, -100))
+    assert not inside(planes, (0, 0, -10001)) and not inside(planes, (0, 0, -0.05))
+    np.testing.assert_allclose(corners[-1], (10000 * 18.0 / 35, 10000 * 12.0 / 35, -10000))
+    # turned about y by 180, it looks down +z like the cams in the scene do
+    planes, corners = scene.cameraFrustum((0, 0, 0), (0, 180, 0))
+    assert inside(planes, (0, 0, 100)) and not inside(planes, (0, 0, -100))
+
+
+def test_boxes_on_a_cam_path_are_kept_and_boxes_behind_are_culled():
+    paths = scene.CameraTeam(CITA_FINAL, 'Mac', scene.MemorySceneBackend()).cameraPaths()
+    # just ahead of camera1moveup, and further along the road the car cams drive down; behind where
+    # every cam starts, and further than any of them sees
+    mins = np.array([[-5, 0, -1650], [-10, 0, 2900], [-5, 0, -20000]], dtype=np.float64)
+    maxs = mins + 10
+    assert scene.framedBoxes(mins, maxs, paths).tolist() == [True, True, False]
+    # right behind a cam, near enough to be in view if it turned round
+    cam = stillCamera((0, 5, 0), (0, 180, 0))
+    mins = np.array([[-5, 0, 20], [-5, 0, -30]], dtype=np.float64)
+    assert scene.framedBoxes(mins, mins + 10, cam).tolist() == [True, False]
+    # the margin takes in boxes just outside the view
+    edge = 100 * 18.0 / 35
+    mins = np.array([[edge + 1, 0, 99]], dtype=np.float64)
+    assert scene.framedBoxes(mins, mins + 0.1, stillCamera((0, 0, 0), (0, 180, 0)), margin=0).tolist() == [False]
+    assert scene.framedBoxes(mins, mins + 0.1, stillCamera((0, 0, 0), (0, 180, 0))).tolist() == [True]
+
+
+# a point is framed out to where something size across is CULL_MIN_PIXELS wide on a CAMERA_IMAGE_WIDTH image,
+# through the 35mm lens on the 36mm gate
+def test_points_are_framed_until_they_are_a_pixel_across():
+    size = 0.5
+    cutoff = size * 35 * 960 / (36 * 1.0)
+    assert math.isclose(cutoff, size * scene.CAMERA_FOCAL_LENGTH * scene.CAMERA_IMAGE_WIDTH /
+                        (scene.CAMERA_FILM_GATE[0] * scene.CULL_MIN_PIXELS))
+    positions = np.array([[0, 0, 10], [0, 0, cutoff - 0.1], [0, 0, cutoff + 0.1], [0, 0, -10]], dtype=np.float64)
+    seen = []
+
+    def pointsAt(frame, points):
+        seen.append(frame)
+        return positions[points]
+    framed = scene.framedPoints(pointsAt, positions - size, positions + size, size,
+                                stillCamera((0, 0, 0), (0, 180, 0)))
+    assert framed.tolist() == [True, True, False, False]
+    assert set(seen) <= {1.0, 2.0}
+    # twice the pixels, half as far
+    framed = scene.framedPoints(pointsAt, positions - size, positions + size, size,
+                                stillCamera((0, 0, 0), (0, 180, 0)), minPixels=2)
+    assert framed.tolist() == [True, False, False, False]
+
+
+# {attribute: (frames, values)} of the curves driving camera1moveup through its pairBlends in the .ma
+def savedCameraKeys(path):
+    with open(path) as f:
+        text = f.read()
+    keys = {}
+    for attribute, curve in (('translateX', 'pairBlend1_inTranslateX1'), ('translateY', 'pairBlend1_inTranslateY1'),
+                             ('translateZ', 'pairBlend1_inTranslateZ1'), ('rotateX', 'pairBlend2_inRotateX1'),
+                             ('rotateY', 'pairBlend2_inRotateY1'), ('rotateZ', 'pairBlend2_inRotateZ1')):
+        node = re.search(r'createNode animCurveT[LA] -n "%s";(.*?)(?=createNode)' % curve, text, re.S).group(1)
+        values = [float(value) for value in re.search(r'"\.ktv\[0:1\]"\s+([^;]*);', node).group(1).split()]
+        keys[attribute] = (values[0::2], values[1::2])
+    return text, keys
+
+
+def test_saved_camera_keys_are_the_ones_in_its_file():
+    text, keys = savedCameraKeys(SAVED_CAMERA)
+    # the curves only drive the cam with the motion path blended out
+    assert 'connectAttr "pairBlend1.oty" "camera1moveup.ty";' in text
+    assert 'connectAttr "pairBlend2.orx" "camera1moveup.rx";' in text
+    assert 'setAttr ".ktv[0]"  72 0;' in re.search(r'"camera1_blendMotionPath1";(.*?)createNode', text, re.S).group(1)
+    saved = scene.CameraTeam.SAVED_CAMERA_KEYS
+    for attribute, (frames, values) in keys.items():
+        if attribute in saved:
+            assert frames == saved[attribute][0], attribute
+            np.testing.assert_allclose(values, saved[attribute][1], rtol=0, atol=1e-3, err_msg=attribute)
+        else:
+            # the channels left out are keyed to 0 the whole time
+            assert values == [0, 0], attribute
+    # the gate is in inches in the file, and no focal length is set so it's maya's default
+    shape = re.search(r'createNode camera -n "camera1moveupShape"(.*?)createNode', text, re.S).group(1)
+    gate = re.search(r'"\.cap" -type "double2" (\S+) (\S+) ;', shape).groups()
+    np.testing.assert_allclose([float(inches) * 25.4 for inches in gate], scene.CAMERA_FILM_GATE, rtol=1e-4)
+    assert '".fl"' not in shape and scene.CAMERA_FOCAL_LENGTH == 35.0
@@ -0,0 +1,130 @@
+import numpy as np
+
+import mayaFinalCodeNov28 as scene
+
+
+# every dropped key is within tolerance of the straight line between the keys kept around it
+def test_simplified_curve_stays_within_tolerance():
+    rng = np.random.default_rng(8)
+    times = np.arange(1, 301, dtype=np.float64)
+    values = np.cumsum(rng.normal(size=300)) + np.where(times > 150, 0.002 * (times - 150) ** 2, 0)
+    for tolerance in (0.0, 0.1, 1.0, 10.0):
+        kept_times, kept_values = scene.simplifyCurve(times, values, tolerance)
+        assert (kept_times[0], kept_times[-1]) == (1, 300)
+        assert np.all(np.isin(kept_times, times))
+        np.testing.assert_array_equal(kept_values, values[np.isin(times, kept_times)])
+        assert np.abs(np.interp(times, kept_times, kept_values) - values).max() <= tolerance + 1e-9
+    # a straight line needs only its ends
+    assert scene.simplifyCurve(times, 3 * times - 2, 1e-9)[0].tolist() == [1, 300]
+
+
+# with tolerances only the translate / rotate curves are simplified, and they're written with linear tangents
+def test_buffer_simplifies_only_with_a_tolerance():
+    times = np.arange(1, 101, dtype=np.float64)
+    for tolerances, simplified in (((None, None), False), ((0.1, 0.1), True)):
+        backend = scene.MemorySceneBackend()
+        backend.createNode('transform', 'heli')
+        keys = scene.KeyframeBuffer(backend, positionTolerance=tolerances[0], rotationTolerance=tolerances[1])
+        keys.addKeys('heli', 'translateZ', times, 5 * times)
+        keys.addKeys('heli', 'rotateX', times, np.sin(times / 10))
+        keys.addKeys('heli', 'visibility', times, times % 2)
+        keys.flush()
+        for attribute, values in (('translateZ', 5 * times), ('rotateX', np.sin(times / 10))):
+            kept_times, kept_values = backend.keyframes('heli', attribute)
+            assert (len(kept_times) < 100) == simplified
+            assert backend.curve_tangents['heli', attribute] == ('linear' if simplified else 'clamped')
+            assert np.abs(np.interp(times, kept_times, kept_values) - values).max() <= 0.1
+        assert backend.keyframes('heli', 'visibility')[0] == times.tolist()
+        assert keys.reductionReport().startswith('keys in 300')
+
+
+# a MemorySceneBackend that records which of its keying calls were made
+class RecordingBackend(scene.MemorySceneBackend):
+    def __init__(self):
+        scene.MemorySceneBackend.__init__(self)
+        self.calls = []
+
+    def setKeyframe(self, objname, time, attribute, value):
+        self.calls.append(('setKeyframe', attribute))
+        scene.MemorySceneBackend.setKeyframe(self, objname, time, attribute, value)
+
+    def setKeyframes(self, objname, attribute, times, values, tangentType='clamped'):
+        self.calls.append(('setKeyframes', attribute))
+        scene.MemorySceneBackend.setKeyframes(self, objname, attribute, times, values, tangentType)
+
+
+# curves of up to MIN_BULK_KEYS keys are keyed one key at a time, longer ones and ones that need other tangents
+# (stepped, or linear once simplified) in one call each
+def test_buffer_keys_short_curves_one_at_a_time():
+    few = scene.KeyframeBuffer.MIN_BULK_KEYS
+    backend = RecordingBackend()
+    backend.createNode('transform', 'car')
+    keys = scene.KeyframeBuffer(backend, rotationTolerance=0.1)
+    keys.addKeys('car', 'translateX', np.arange(few), np.arange(few))
+    keys.addKeys('car', 'translateY', np.arange(few + 1), np.arange(few + 1))
+    keys.addKeys('car', 'visibility', [1, 5], [1, 0])
+    keys.addKeys('car', 'rotateY', np.arange(50), np.zeros(50))
+    keys.flush()
+    assert sorted(backend.calls) == sorted([('setKeyframe', 'translateX')] * few + [
+        ('setKeyframes', 'translateY'), ('setKeyframes', 'visibility'), ('setKeyframes', 'rotateY')])
+    assert backend.curve_tangents == {('car', 'translateY'): 'clamped', ('car', 'visibility'): 'step',
+                                      ('car', 'rotateY'): 'linear'}
+    assert backend.keyframes('car', 'rotateY') == ([0, 49], [0, 0])
+    assert (keys.num_single_keys, keys.num_bulk_curves, keys.num_bulk_keys) == (few, 3, few + 1 + 2 + 2)
+    assert keys.writeReport() == 'keyed %d values: %d keys one at a time, 3 curves (%d keys) in bulk' % (
+        2 * few + 1 + 2 + 50, few, few + 5)
+
+
+# keys flushed later are added to the curve, like more cm.setKeyframe calls would be
+def test_flushes_add_to_the_keys_already_keyed():
+    backend = scene.MemorySceneBackend()
+    backend.createNode('transform', 'heli')
+    keys = scene.KeyframeBuffer(backend)
+    keys.addKeys('heli', 'translateY', np.arange(1, 11), np.arange(1, 11))
+    keys.flush()
+    keys.addKeys('heli', 'translateY', np.arange(10, 21), -np.arange(10, 21))
+    keys.setKeyframe('heli', 30, 'translateY', 7)
+    keys.flush()
+    assert backend.keyframes('heli', 'translateY') == (list(range(1, 21)) + [30], list(range(1, 10)) + list(
+        range(-10, -21, -1)) + [7])
+
+
+# stands in for pymel: animCurves only record the keys added to them
+class FakeCurve:
+    def __init__(self, name):
+        self.name = name
+        self.output = name + '.output'
+        self.keys = {}
+
+    def addKeys(self, times, values, tangentInType, tangentOutType, keepExistingKeys=False):
+        if not keepExistingKeys:
+            self.keys = {}
+        self.keys.update(zip(times, values))
+
+
+class FakePymel:
+    def __init__(self):
+        self.created = []
+        self.curves = {}  # plug -> the FakeCurve connected to it
+
+    def listConnections(self, plug, source=True, destination=True, type=None):
+        return [self.curves[plug]] if plug in self.curves else []
+
+    def createNode(self, nodeType, name):
+        self.created.append(FakeCurve(name))
+        return self.created[-1]
+
+    def connectAttr(self, source, destination, force=False):
+        self.curves[destination] = [curve for curve in self.created if curve.output == source][0]
+
+
+def test_maya_backend_adds_keys_to_the_existing_curve(monkeypatch):
+    pymel = FakePymel()
+    monkeypatch.setattr(scene, 'pm', pymel, raising=False)
+    backend = scene.MayaSceneBackend()
+    backend.setKeyframes('heli', 'translateY', [1, 2, 3, 4], [0, 1, 2, 3])
+    backend.setKeyframes('heli', 'translateY', [4, 5], [9, 10])
+    backend.setKeyframes('heli', 'rotateY', [1, 2], [0, 180])
+    assert [curve.name for curve in pymel.created] == ['heli_translateY', 'heli_rotateY']
+    assert pymel.curves['heli.translateY'].keys == {1: 0, 2: 1, 3: 2, 4: 9, 5: 10}
+    np.testing.assert_allclose(sorted(pymel.curves['heli.rotateY'].keys.items()), [(1, 0), (2, np.pi)])
@@ -0,0 +1,60 @@
+import numpy as np
+
+import mayaFinalCodeNov28 as scene
+
+LEVELS = {'lamp': [(40, 100), (10, 30), (0.5, 8)]}
+SIZE = 36.0 / (35 * 960)  # one pixel across for every unit away
+
+
+# a cam at each of distances along z from the origin, one a frame
+def cameraAt(distances):
+    distances = np.asarray(distances, dtype=np.float64)
+    positions = np.stack([np.zeros(len(distances)), np.zeros(len(distances)), distances], axis=1)
+    return {'cam': (np.arange(1, len(distances) + 1, dtype=np.float64), positions, np.zeros((len(distances), 3)))}
+
+
+def levelsAt(pixels, hysteresis=scene.LOD_HYSTERESIS):
+    lod = scene.LevelOfDetail(cameraAt(np.divide(1.0, pixels)), scene.MemorySceneBackend(), levels=LEVELS)
+    return lod.levelsOf('lamp', [(0, 0, 0)], SIZE, hysteresis)[:, 0].tolist()
+
+
+def test_levels_follow_the_pixels_on_screen():
+    assert levelsAt([100, 40, 39, 10, 9, 0.5, 0.4], hysteresis=0) == [0, 0, 1, 1, 2, 2, 3]
+    # going smaller, each level holds until the instance is a fifth smaller than its threshold
+    assert levelsAt([100, 40, 33, 31, 9, 7, 0.45, 0.39]) == [0, 0, 0, 1, 1, 2, 2, 3]
+    # and going bigger, until it's a fifth bigger
+    assert levelsAt([0.1, 0.55, 0.61, 11, 13, 47, 49]) == [3, 3, 2, 2, 1, 1, 0]
+
+
+# an instance hovering around a threshold keeps its level, instead of switching on every frame
+def test_levels_do_not_flicker_at_a_threshold():
+    pixels = [45, 38, 41, 37, 42, 36, 43]
+    assert levelsAt(pixels, hysteresis=0) == [0, 1, 0, 1, 0, 1, 0]
+    assert levelsAt(pixels) == [0] * 7
+    assert levelsAt([30] + pixels) == [1] * 8
+
+
+def test_place_keys_stepped_visibility_where_the_level_switches():
+    backend = scene.MemorySceneBackend()
+    backend.createNode('mesh', 'lamp')
+    lod = scene.LevelOfDetail(cameraAt(np.ones(8)), backend, levels=LEVELS)
+    name = lod.place('lamp', 'lamp', 'lamp1', (1, 2, 3), [0, 0, 1, 1, 1, 0, 3, 3])
+    assert name == 'lamp1' and backend.nodes[name]['translate'] == [1, 2, 3]
+    assert backend.nodes[name]['children'] == ['lamp1_lod0', 'lamp1_lod1']
+    assert backend.nodes['lamp1_lod1']['instanceOf'] == 'lamp_lod1'
+    assert backend.nodes['lamp_lod1']['geometry'] == ('polyReduce', {'source': 'lamp', 'percentage': 30})
+    assert backend.keyframes('lamp1_lod0', 'visibility') == ([1.0, 3.0, 6.0, 7.0], [1.0, 0.0, 1.0, 0.0])
+    assert backend.keyframes('lamp1_lod1', 'visibility') == ([1.0, 3.0, 6.0], [0.0, 1.0, 0.0])
+    assert backend.curve_tangents[('lamp1_lod0', 'visibility')] == 'step'
+    assert backend.curve_tangents[('lamp1_lod1', 'visibility')] == 'step'
+
+
+def test_place_skips_the_group_when_it_can():
+    backend = scene.MemorySceneBackend()
+    backend.createNode('mesh', 'lamp')
+    lod = scene.LevelOfDetail(cameraAt(np.ones(3)), backend, levels=LEVELS)
+    assert lod.place('lamp', 'lamp', 'near', (0, 0, 0), [0, 0, 0]) == 'near'
+    assert lod.place('lamp', 'lamp', 'far', (0, 0, 0), [3, 3, 3]) == 'far'
+    for name in ('near', 'far'):
+        assert backend.nodes[name]['instanceOf'] == 'lamp' and 'children' not in backend.nodes[name]
+    assert backend.nodes['far']['attrs'] == {'visibility': 0} and not backend.curves
@@ -0,0 +1,56 @@
+import mayaFinalCodeNov28 as scene
+
+
+def nodeTypes(backend):
+    types = {}
+    for node in backend.nodes.values():
+        types[node['type']] = types.get(node['type'], 0) + 1
+    return types
+
+
+# asking for the same parameters again, under any name, hands back the first shader without building another
+def test_same_parameters_share_one_shader():
+    backend = scene.MemorySceneBackend()
+    materials = scene.MaterialLibrary(backend)
+    first = materials.material('glass', color=(0, 0, 0), specularColor=(1, 1, 1), reflectivity=.8, transparency=0.4)
+    built = (dict(backend.nodes), list(backend.connections))
+    assert materials.material('glass', color=(0, 0, 0), specularColor=(1, 1, 1), reflectivity=.8,
+                              transparency=0.4) == first
+    # colors are compared by value, whatever sequence they come in
+    assert materials.material('glass2', color=[0.0, 0.0, 0.0], specularColor=(1, 1, 1), reflectivity=.8,
+                              transparency=0.4) == first
+    assert (backend.nodes, backend.connections) == built
+    assert (len(materials), materials.num_reused) == (1, 2)
+    assert materials.material('glass', color=(0, 0, 0), reflectivity=.8, transparency=0.4) != first
+    assert len(materials) == 2
+
+
+def test_same_texture_shares_one_network():
+    backend = scene.MemorySceneBackend()
+    materials = scene.MaterialLibrary(backend)
+    first = materials.material('road', texture='road.jpg', repeatUV=(4, 40), shadingGroup=True)
+    # the file and place2dTexture names don't make it another material
+    again = materials.material('road', texture='road.jpg', repeatUV=[4.0, 40.0], shadingGroup=True,
+                               textureName='other', placementName='other')
+    assert again == first
+    assert nodeTypes(backend) == {'blinn': 1, 'file': 1, 'place2dTexture': 1, 'shadingEngine': 1}
+
+
+# another texture or repeat is another shader network, the placements with the same repeat shared between them
+def test_texture_or_repeat_differences_build_their_own_network():
+    backend = scene.MemorySceneBackend()
+    materials = scene.MaterialLibrary(backend)
+    road = materials.material('road', texture='road.jpg', repeatUV=(4, 40))
+    grass = materials.material('grass', texture='grass.jpg', repeatUV=(4, 40))
+    stretched = materials.material('stretched', texture='road.jpg', repeatUV=(1, 1))
+    plain = materials.material('plain', texture='road.jpg')
+    assert len(set([road, grass, stretched, plain])) == 4 and len(materials) == 4
+    assert nodeTypes(backend) == {'blinn': 4, 'file': 4, 'place2dTexture': 2}
+    files = dict((destination.split('.')[0], source.split('.')[0]) for source, destination in backend.connections
+                 if destination.endswith('.color'))
+    assert [backend.nodes[files[shader]]['attrs']['fileTextureName'] for shader in (road, grass, stretched, plain)] == [
+        'road.jpg', 'grass.jpg', 'road.jpg', 'road.jpg']
+    placements = dict((destination.split('.')[0], source.split('.')[0]) for source, destination in backend.connections
+                      if destination.endswith('.uvCoord'))
+    assert placements[files[road]] == placements[files[grass]] != placements[files[stretched]]
+    assert files[plain] not in placements
@@ -0,0 +1,152 @@
+import math
+
+import numpy as np
+
+import mayaFinalCodeNov28 as scene
+
+
+# stands in for maya.api.OpenMaya: dag nodes with children and a transform, made through a dag modifier
+class FakeNode:
+    def __init__(self, nodeType, name, children=()):
+        self.type = nodeType
+        self.name = name
+        self.children = list(children)
+        self.translate, self.rotate, self.scale = (0, 0, 0), (0, 0, 0), (1, 1, 1)
+
+
+class FakeOpenMaya:
+    kTransform = 'kTransform'
+
+    def __init__(self, nodes):
+        self.nodes = dict((node.name, node) for node in nodes)  # name -> FakeNode, only once they're made
+        self.modifiers = []
+        om = self
+
+        class MSelectionList:
+            def __init__(self):
+                self.names = []
+
+            def add(self, name):
+                self.names.append(name)
+
+            def getDagPath(self, i):
+                return om.nodes[self.names[i]]
+
+        class MFnDagNode:
+            kNextPos = -1
+
+            def __init__(self, node):
+                self.node = node
+
+            def childCount(self):
+                return len(self.node.children)
+
+            def child(self, i):
+                return self.node.children[i]
+
+            def addChild(self, child, index, keepExistingParents):
+                assert index == MFnDagNode.kNextPos and keepExistingParents
+                self.node.children.append(child)
+
+            def partialPathName(self):
+                return self.node.name
+
+        class MFnTransform:
+            def __init__(self, node):
+                self.node = node
+
+            def transformation(self):
+                return self.node.translate, self.node.rotate, self.node.scale
+
+            def set(self, transformation):
+                self.node.translate, self.node.rotate, self.node.scale = transformation
+
+            def setTranslation(self, vector, space):
+                assert space == om.MSpace.kTransform
+                self.node.translate = vector
+
+            def setRotation(self, rotation, space):
+                assert space == om.MSpace.kTransform
+                self.node.rotate = rotation
+
+            def setScale(self, scale):
+                self.node.scale = tuple(scale)
+
+        class MDagModifier:
+            def __init__(self):
+                self.created = []
+                om.modifiers.append(self)
+
+            def createNode(self, nodeType):
+                self.created.append(FakeNode(nodeType, None))
+                return self.created[-1]
+
+            def renameNode(self, node, name):
+                node.name = name
+
+            def doIt(self):
+                for node in self.created:
+                    om.nodes[node.name] = node
+
+        self.MSelectionList = MSelectionList
+        self.MFnDagNode = MFnDagNode
+        self.MFnTransform = MFnTransform
+        self.MDagModifier = MDagModifier
+        self.MVector = lambda x, y, z: (x, y, z)
+        self.MEulerRotation = lambda x, y, z: (x, y, z)
+        self.MSpace = self
+
+
+class FakeCmds:
+    def __init__(self):
+        self.selection = []
+        self.assigned = []  # (objects, material) of each hyperShade assign
+
+    def select(self, objnames):
+        self.selection = list(objnames)
+
+    def hyperShade(self, assign):
+        self.assigned.append((self.selection, assign))
+
+
+def mayaScene(monkeypatch):
+    shape = FakeNode('mesh', 'streetlightShape')
+    source = FakeNode('transform', 'streetlight', [shape])
+    source.rotate, source.scale = (0, math.pi / 2, 0), (2, 2, 2)
+    om, cmds = FakeOpenMaya([source, shape]), FakeCmds()
+    monkeypatch.setattr(scene, 'om', om, raising=False)
+    monkeypatch.setattr(scene, 'cm', cmds, raising=False)
+    return om, cmds, shape
+
+
+# one transform per name, all made by one dag modifier, each over source's shape at its own position, and the
+# material assigned to all of them at once
+def test_instance_array_makes_a_transform_per_name(monkeypatch):
+    om, cmds, shape = mayaScene(monkeypatch)
+    names = ['light1', 'light2', 'light3']
+    positions = np.array([[-60, 0, -2000], [60, 0, -1900], [0, 1.5, 10]])
+    placed = scene.MayaSceneBackend().instanceArray('streetlight', names, positions, material='lampmaterial')
+    assert placed == names and len(om.modifiers) == 1
+    for name, position in zip(names, positions.tolist()):
+        node = om.nodes[name]
+        assert node.type == 'transform' and node.children == [shape]
+        assert node.translate == tuple(position)
+        # like instance, the rotation and scale are source's
+        assert (node.rotate, node.scale) == ((0, math.pi / 2, 0), (2, 2, 2))
+    assert cmds.assigned == [(names, 'lampmaterial')]
+
+
+def test_instance_array_sets_rotations_and_scales(monkeypatch):
+    om, cmds, shape = mayaScene(monkeypatch)
+    placed = scene.MayaSceneBackend().instanceArray('streetlight', ['a', 'b'], [0, 0, 0, 1, 2, 3],
+                                                    rotations=[[0, 90, 0], [180, 0, 45]],
+                                                    scales=[[1, 2, 3], [4, 5, 6]])
+    assert placed == ['a', 'b']
+    assert [om.nodes[name].translate for name in placed] == [(0, 0, 0), (1, 2, 3)]
+    np.testing.assert_allclose([om.nodes[name].rotate for name in placed],
+                               [[0, math.pi / 2, 0], [math.pi, 0, math.pi / 4]])
+    assert [om.nodes[name].scale for name in placed] == [(1, 2, 3), (4, 5, 6)]
+    # without a material nothing is assigned, and nothing is made for no names
+    assert cmds.assigned == []
+    assert scene.MayaSceneBackend().instanceArray('streetlight', [], [], material='lampmaterial') == []
+    assert cmds.assigned == [] and len(om.modifiers) == 2
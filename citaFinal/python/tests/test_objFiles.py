@@ -0,0 +1,205 @@
+import os
+
+import numpy as np
+
+import mayaFinalCodeNov28 as scene
+
+
+def writeObj(tmp_path, text, name='mesh.obj'):
+    path = tmp_path / name
+    path.write_bytes(text.encode('utf-8'))
+    return str(path)
+
+
+# vt u and vt u v w are valid too, the missing v is 0 and w is dropped
+def test_short_uv_records(tmp_path):
+    path = writeObj(tmp_path, 'v 0 0 0\nv 1 0 0\nv 0 1 0\n'
+                              'vt 0.5\nvt 0.25 0.75\nvt 0.1 0.2 0.3\n  vt 0.9\n'
+                              'f 1/1 2/2 3/4\nf 1/3 2/2 3/1\n')
+    for blockBytes in (scene.OBJ_BLOCK_BYTES, 30):
+        mesh, = scene.readObj(path, blockBytes)
+        np.testing.assert_allclose(mesh.uvs[mesh.uv_indices], [[0.5, 0], [0.25, 0.75], [0.9, 0],
+                                                               [0.1, 0.2], [0.25, 0.75], [0.5, 0]])
+
+
+def test_record_columns_pads_missing_values():
+    values = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+    np.testing.assert_array_equal(scene.recordColumns(values, np.array([1, 2, 3]), 2),
+                                  [[1, 0], [2, 3], [4, 5]])
+
+
+# a random .obj with every kind of face corner, relative numbers, groups coming back, materials, comments,
+# indenting and tabs, plus the .mtl it uses
+def randomObj(rng, numFaces=300):
+    lines = ['# made up', 'mtllib mesh.mtl', '']
+    counts = [0, 0, 0]
+    groups = ['wall', 'roof', 'door']
+    for f in range(numFaces):
+        for column, (keyword, size) in enumerate((('v', 3), ('vt', 2), ('vn', 3))):
+            for i in range(int(rng.integers(0, 3)) if counts[column] >= 4 else 4):
+                values = ' '.join('%.6g' % value for value in rng.uniform(-10, 10, size + int(rng.integers(0, 2))))
+                lines.append(('\t' if rng.random() < 0.1 else '') + keyword + ' ' + values)
+                counts[column] += 1
+        if rng.random() < 0.05:
+            lines.append('g ' + groups[int(rng.integers(0, 3))])
+        if rng.random() < 0.05:
+            lines.append('usemtl ' + ['brick', 'glass'][int(rng.integers(0, 2))])
+        corners = []
+        form = int(rng.integers(0, 4))
+        for corner in range(int(rng.integers(3, 6))):
+            numbers = []
+            for column in range(3):
+                number = int(rng.integers(1, counts[column] + 1))
+                numbers.append(str(number if rng.random() < 0.7 else number - counts[column] - 1))
+            corners.append([numbers[0], numbers[0] + '/' + numbers[1], numbers[0] + '//' + numbers[2],
+                            '/'.join(numbers)][form])
+        lines.append('f ' + ('  ' if rng.random() < 0.1 else ' ').join(corners))
+        if rng.random() < 0.02:
+            lines.append('')
+    return '\n'.join(lines) + '\n', 'newmtl brick\nKd 0.5 0.2 0.1\nnewmtl glass\nKd 0.1 0.2 0.9\n'
+
+
+# the .obj read one line at a time: {group: [(material, [(vertex, uv or None, normal or None) per corner])]}
+def readObjLines(path):
+    records = {'v': [], 'vt': [], 'vn': []}
+    group, material, faces = os.path.splitext(os.path.basename(path))[0], '', {}
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            if fields[0] in records:
+                records[fields[0]].append([float(value) for value in fields[1:]])
+            elif fields[0] in ('g', 'o'):
+                group = fields[1]
+            elif fields[0] == 'usemtl':
+                material = fields[1]
+            elif fields[0] == 'f':
+                face = []
+                for corner in fields[1:]:
+                    resolved = []
+                    for number, kind in zip((corner.split('/') + ['', ''])[:3], ('v', 'vt', 'vn')):
+                        if not number:
+                            resolved.append(None)
+                            continue
+                        number = int(number)
+                        resolved.append(records[kind][number - 1 if number > 0 else number])
+                    face.append(resolved)
+                faces.setdefault(group, []).append((material, face))
+    return faces
+
+
+def test_read_obj_matches_reading_line_by_line(tmp_path):
+    rng = np.random.default_rng(4)
+    text, mtl = randomObj(rng)
+    path = writeObj(tmp_path, text)
+    writeObj(tmp_path, mtl, 'mesh.mtl')
+    expected = readObjLines(path)
+    colors = {'brick': (0.5, 0.2, 0.1), 'glass': (0.1, 0.2, 0.9), '': (0.5, 0.5, 0.5)}
+    for blockBytes in (scene.OBJ_BLOCK_BYTES, 1000, 64):
+        meshes = scene.readObj(path, blockBytes)
+        assert [mesh.name for mesh in meshes] == list(expected)
+        for mesh in meshes:
+            faces = expected[mesh.name]
+            assert mesh.dependencies == ['mesh.obj', 'mesh.mtl']
+            np.testing.assert_array_equal(mesh.face_counts, [len(face) for material, face in faces])
+            corners = [corner for material, face in faces for corner in face]
+            for column, (values, indices, size) in enumerate(((mesh.vertices, mesh.vertex_indices, 3),
+                                                              (mesh.uvs, mesh.uv_indices, 2),
+                                                              (mesh.normals, mesh.normal_indices, 3))):
+                given = [corner[column] is not None for corner in corners]
+                np.testing.assert_array_equal(indices >= 0, given)
+                given_values = [corner[column][:size] for corner in corners if corner[column] is not None]
+                np.testing.assert_allclose(values[indices[indices >= 0]], given_values, rtol=1e-6)
+                # only what the mesh's faces use is kept
+                assert len(np.unique(indices[indices >= 0])) == len(values)
+            materials = []
+            for name, color, first, count in mesh.materials:
+                materials.extend([name] * count)
+            assert materials == [material for material, face in faces]
+            for name, color, first, count in mesh.materials:
+                np.testing.assert_allclose(color, colors[name])
+
+
+def assertMeshesEqual(meshes, expected):
+    assert [mesh.name for mesh in meshes] == [mesh.name for mesh in expected]
+    for mesh, other in zip(meshes, expected):
+        for attribute, dtype, columns in scene.MeshCache.ARRAYS:
+            np.testing.assert_array_equal(getattr(mesh, attribute), getattr(other, attribute))
+        assert mesh.dependencies == other.dependencies
+        assert [(name, first, count) for name, color, first, count in mesh.materials] == \
+            [(name, first, count) for name, color, first, count in other.materials]
+        np.testing.assert_allclose([color for name, color, first, count in mesh.materials],
+                                   [color for name, color, first, count in other.materials], rtol=1e-6)
+
+
+def test_mesh_cache_round_trip(tmp_path):
+    rng = np.random.default_rng(6)
+    text, mtl = randomObj(rng, 100)
+    path = writeObj(tmp_path, text)
+    mtl_path = writeObj(tmp_path, mtl, 'mesh.mtl')
+    empty = writeObj(tmp_path, '# nothing here\n', 'empty.obj')
+    cache = scene.MeshCache(str(tmp_path / 'cache'))
+    converted = cache.loadAll([path, empty])
+    assertMeshesEqual(converted[0], scene.readObj(path))
+    assert converted[1] == []
+    assert cache.converted == [path, empty]
+
+    # a later run maps the converted meshes
+    cache = scene.MeshCache(str(tmp_path / 'cache'))
+    assertMeshesEqual(cache.load(path), scene.readObj(path))
+    assert (cache.reloaded, cache.converted) == ([path], [])
+
+    # touched but the same, it's still reloaded
+    os.utime(mtl_path, ns=(0, 0))
+    cache = scene.MeshCache(str(tmp_path / 'cache'))
+    cache.load(path)
+    assert (cache.reloaded, cache.converted) == ([path], [])
+
+    # a changed .mtl converts it again
+    writeObj(tmp_path, mtl.replace('0.5 0.2 0.1', '1 0 0'), 'mesh.mtl')
+    cache = scene.MeshCache(str(tmp_path / 'cache'))
+    meshes = cache.load(path)
+    assert (cache.reloaded, cache.converted) == ([], [path])
+    bricks = [color for mesh in meshes for name, color, first, count in mesh.materials if name == 'brick']
+    assert bricks and all(color == (1, 0, 0) for color in bricks)
+
+
+# a cache file cut short is converted again instead of read
+def test_mesh_cache_ignores_broken_files(tmp_path):
+    path = writeObj(tmp_path, 'v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 3\n')
+    cache = scene.MeshCache(str(tmp_path / 'cache'))
+    cache.load(path)
+    with open(cache.path(path), 'r+b') as f:
+        f.truncate(10)
+    cache = scene.MeshCache(str(tmp_path / 'cache'))
+    mesh, = cache.load(path)
+    assert cache.converted == [path]
+    np.testing.assert_array_equal(mesh.vertex_indices, [0, 1, 2])
+
+
+# a source touched but not changed gets its cache file's times updated, by replacing the whole file: meshes
+# mapped from the old one keep their data and no temporary file is left behind
+def test_mesh_cache_restamps_through_a_new_file(tmp_path):
+    rng = np.random.default_rng(7)
+    text, mtl = randomObj(rng, 20)
+    path = writeObj(tmp_path, text)
+    mtl_path = writeObj(tmp_path, mtl, 'mesh.mtl')
+    cache = scene.MeshCache(str(tmp_path / 'cache'))
+    mapped = cache.load(path)
+    cache_path = cache.path(path)
+    before = os.stat(cache_path)
+    os.utime(mtl_path, ns=(0, 0))
+    cache = scene.MeshCache(str(tmp_path / 'cache'))
+    assertMeshesEqual(cache.load(path), scene.readObj(path))
+    assert (cache.reloaded, cache.converted) == ([path], [])
+    restamped = os.stat(cache_path)
+    assert restamped.st_ino != before.st_ino
+    assert os.listdir(str(tmp_path / 'cache')) == [os.path.basename(cache_path)]
+    header = cache.read(cache_path, mapArrays=False)[2]
+    assert header == scene.MeshCache.fingerprint([path, mtl_path])
+    assertMeshesEqual(mapped, scene.readObj(path))
+    # now up to date, it's left alone
+    cache = scene.MeshCache(str(tmp_path / 'cache'))
+    cache.load(path)
+    assert os.stat(cache_path).st_ino == restamped.st_ino and cache.reloaded == [path]
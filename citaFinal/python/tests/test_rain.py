@@ -0,0 +1,173 @@
+import re
+
+import numpy as np
+
+import mayaFinalCodeNov28 as scene
+
+
+# the per drop loop rainSimulation used to run, keys of each drop as a list of (x, y, z), frame 1 first
+def steppedKeys(startPositions, acceleration, FPS=24):
+    xaccel, yaccel, zaccel = acceleration
+    drops = []
+    for xpos, ypos, zpos in startPositions:
+        xvel, yvel, zvel = 0, 0, 0
+        keys = []
+        while ypos > 0:
+            keys.append((xpos, ypos, zpos))
+            xvel = xvel + xaccel * 1.0 / FPS
+            xpos = xpos + xvel * 1.0 / FPS
+            yvel = yvel + yaccel * 1.0 / FPS
+            ypos = ypos + yvel * 1.0 / FPS
+            zvel = zvel + zaccel * 1.0 / FPS
+            zpos = zpos + zvel * 1.0 / FPS
+        drops.append(keys)
+    return drops
+
+
+# drops drawn the way rainSimulation draws them, plus a few right at, or under, the ground
+def rain(numRaindrops=300, seed=7):
+    rng = np.random.default_rng(seed)
+    start_positions = rng.integers([-100, 300, -1500], [101, 601, 4001], size=(numRaindrops, 3))
+    start_positions[:3, 1] = [0, -5, 1]
+    return start_positions, (int(rng.integers(-2, 3)), -9.8, int(rng.integers(-2, 3)))
+
+
+def test_solver_keys_match_stepping_each_drop():
+    start_positions, acceleration = rain()
+    trajectories, landing_frames = scene.RainSolver(start_positions, acceleration).solve()
+    for i, keys in enumerate(steppedKeys(start_positions.tolist(), acceleration)):
+        assert landing_frames[i] == len(keys)
+        np.testing.assert_array_equal(trajectories[:len(keys), i], np.array(keys).reshape(-1, 3))
+
+
+def test_solver_without_falling_drops():
+    trajectories, landing_frames = scene.RainSolver([[0, 0, 0], [5, -1, 5]], (0, -9.8, 0)).solve()
+    assert trajectories.shape == (0, 2, 3)
+    np.testing.assert_array_equal(landing_frames, [0, 0])
+
+
+# drops don't depend on how many are drawn or where the drawing starts
+def test_start_positions_are_drawn_per_batch():
+    scene_random = scene.SceneRandom(11)
+    every = scene_random.rainStartPositions(3000)
+    np.testing.assert_array_equal(scene_random.rainStartPositions(500, 1000), every[1000:1500])
+    np.testing.assert_array_equal(scene.SceneRandom(11).rainStartPositions(10), every[:10])
+    assert not np.array_equal(scene.SceneRandom(12).rainStartPositions(10), every[:10])
+
+
+# a chunk packs the keys of its drops one drop after another
+def test_chunks_pack_every_keyed_frame():
+    start_positions, acceleration = rain()
+    values, counts = scene.solveRainChunk(start_positions, acceleration)
+    keys = steppedKeys(start_positions.tolist(), acceleration)
+    np.testing.assert_array_equal(counts, [len(drop) for drop in keys])
+    np.testing.assert_array_equal(values, np.array([key for drop in keys for key in drop]).reshape(-1, 3))
+
+
+def test_landing_frames_without_stepping():
+    for seed in range(5):
+        start_positions, acceleration = rain(seed=seed)
+        solver = scene.RainSolver(start_positions, acceleration)
+        np.testing.assert_array_equal(solver.landingFrames(), solver.solve()[1])
+    try:
+        scene.RainSolver([[0, 10, 0]], (0, 9.8, 0)).landingFrames()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('drops accelerating up never land')
+
+
+def test_positions_at_are_the_stepped_positions():
+    start_positions, acceleration = rain()
+    solver = scene.RainSolver(start_positions, acceleration)
+    keys = steppedKeys(start_positions.tolist(), acceleration)
+    for step in (0, 1, 10, 50):
+        drops = np.array([i for i, drop in enumerate(keys) if len(drop) > step])
+        np.testing.assert_allclose(solver.positionsAt(np.full(len(drops), step), drops),
+                                   [keys[i][step] for i in drops], rtol=0, atol=1e-9)
+
+
+# window jumps to its first frame in closed form, so it only agrees with stepping to rounding
+def test_window_is_the_stepped_keys_in_the_window():
+    start_positions, acceleration = rain()
+    keys = steppedKeys(start_positions.tolist(), acceleration)
+    for firstFrame, lastFrame in ((1, 1000), (20, 60), (150, 400)):
+        values, counts = scene.solveRainChunk(start_positions, acceleration, (firstFrame, lastFrame))
+        expected = []
+        for drop in keys:
+            if not drop:
+                expected.append([])
+                continue
+            # a drop that landed before the window is held where it landed
+            last = min(lastFrame, max(len(drop), firstFrame))
+            expected.append([drop[min(frame, len(drop)) - 1] for frame in range(firstFrame, last + 1)])
+        np.testing.assert_array_equal(counts, [len(drop) for drop in expected])
+        np.testing.assert_allclose(values, np.array([key for drop in expected for key in drop]).reshape(-1, 3),
+                                   rtol=0, atol=1e-9)
+
+
+# stands in for maya.cmds, keeps what's set on the particle shape
+class FakeCmds:
+    def __init__(self):
+        self.added = set()
+        self.attrs = {}
+        self.expression = None
+
+    def particle(self, position, name):
+        self.attrs['position'] = np.array(position)
+        return [name, name + 'Shape']
+
+    def attributeQuery(self, longName, node, exists):
+        return longName in self.added
+
+    def addAttr(self, shape, longName, dataType):
+        self.added.add(longName)
+
+    def setAttr(self, attribute, *values, **flags):
+        if flags.get('type') == 'vectorArray':
+            values = np.array(values[1:])  # the count, then the vectors
+        elif flags.get('type') == 'doubleArray':
+            values = np.array(values[0])
+        self.attrs[attribute.split('.', 1)[1]] = values if len(values) != 1 else values[0]
+
+    def dynExpression(self, shape, string, runtimeBeforeDynamics):
+        self.expression = string
+
+    def particleInstancer(self, shape, addObject, object):
+        return 'instancer1'
+
+
+# positions the particle expression gives each particle on frame, its MEL run as python
+def particlePositions(expression, frame, startPosition):
+    code = re.sub(r'<<(.*?)>>', r'np.array([\1])', expression.replace('float $step', 'step').replace('$step', 'step'))
+    names = {'np': np, 'frame': frame, 'startPosition': startPosition}
+    exec(code, names)
+    return names['position']
+
+
+# the particles the maya backend makes are where RainSolver keys the drops, on every frame each drop is keyed
+# (inside the window if there is one), and only then: each starts from its startPosition0 and lives lifespanPP
+def test_particle_expression_matches_the_solver(monkeypatch):
+    start_positions, acceleration = rain()
+    solver = scene.RainSolver(start_positions, acceleration)
+    landing_frames = solver.landingFrames()
+    for frameWindow in (None, (20, 60), (150, 400)):
+        cmds = FakeCmds()
+        monkeypatch.setattr(scene, 'cm', cmds, raising=False)
+        animation = scene.FinalAnimation('', 'Mac', scene.MayaSceneBackend(), scene.SceneRandom(1),
+                                         scene.SimulationPool(1))
+        animation.rainParticles(start_positions, acceleration, frameWindow=frameWindow)
+        first_frame = cmds.attrs.get('startFrame', 1)
+        assert first_frame == (1 if frameWindow is None else frameWindow[0])
+        start = cmds.attrs['startPosition0']
+        np.testing.assert_array_equal(start, start_positions)
+        # born where the expression puts them on the first frame
+        alive = landing_frames >= first_frame
+        np.testing.assert_allclose(cmds.attrs['position'][alive],
+                                   particlePositions(cmds.expression, first_frame, start)[alive], atol=1e-9)
+        for frame in range(first_frame, 420):
+            # a particle dies once its age (seconds since the first frame) reaches its lifespan
+            alive = (frame - first_frame) / 24.0 < cmds.attrs['lifespanPP0'] - 1e-9
+            np.testing.assert_array_equal(alive, frame <= landing_frames)
+            np.testing.assert_allclose(particlePositions(cmds.expression, frame, start)[alive],
+                                       solver.positionsAt(np.full(alive.sum(), frame - 1), alive), atol=1e-9)
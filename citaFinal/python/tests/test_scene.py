@@ -0,0 +1,73 @@
+import json
+import os
+import re
+
+import numpy as np
+
+import mayaFinalCodeNov28 as scene
+
+CITA_FINAL = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BASELINE_KEYS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'baselineMoverKeys.json')
+
+
+def stockScene(**flags):
+    backend = scene.MemorySceneBackend()
+    scene.main(CITA_FINAL, backend=backend, **flags)
+    return backend
+
+
+# main() with its defaults builds the scene the original script built: the same objects and, for the heli,
+# car and cams, the same keys
+def test_stock_scene():
+    backend = stockScene()
+    with open(BASELINE_KEYS) as f:
+        baseline = json.load(f)
+    for objname, attribute, keys in baseline:
+        frames, values = zip(*sorted(backend.curves[objname, attribute].items()))
+        expected_frames, expected_values = zip(*keys)
+        assert frames == expected_frames, (objname, attribute)
+        np.testing.assert_allclose(values, expected_values, rtol=0, atol=1e-6, err_msg=objname + '.' + attribute)
+    drops = [name for name in backend.nodes if name.startswith('raindrop') and name != 'raindropmaterial']
+    buildings = [name for name in backend.nodes if name.startswith('building') and 'unit' not in name]
+    assert (len(backend.nodes), len(backend.curves), len(buildings), len(drops)) == (939, 322, 725, 100)
+    assert set(backend.curves) == set((objname, attribute) for objname, attribute, keys in baseline) | set(
+        (drop, attribute) for drop in drops for attribute in ('translateX', 'translateY', 'translateZ'))
+
+
+# the same seed builds the same buildings and rain
+def test_seed_repeats_the_scene():
+    first, again, other = stockScene(seed=5), stockScene(seed=5), stockScene(seed=6)
+    assert first.nodes == again.nodes
+    assert first.curves == again.curves
+    assert first.curves != other.curves
+
+
+# the index main() is given ends up with a box for every building, streetlight and raindrop it made
+def test_scene_fills_the_spatial_index():
+    index = scene.SpatialIndex()
+    backend = stockScene(spatialIndex=index)
+    assert sorted(index.inFrustum([], kinds='building')) == sorted(
+        name for name in backend.nodes if re.match(r'building\d+$', name))
+    assert sorted(index.inFrustum([], kinds='raindrop')) == sorted(
+        name for name in backend.nodes if re.match(r'raindrop\d+$', name))
+    assert sorted(index.inFrustum([], kinds='streetlight')) == sorted(
+        name for name in backend.nodes if re.match(r'light\d+$', name))
+
+
+# the tiled city covers the same road: every building generateBuildings makes, in the block its z is in,
+# with the same box and material, as block<block>_building<i in the block> instead of building<i>
+def test_tiled_city_is_the_same_city():
+    backend, tiled = stockScene(seed=5), stockScene(seed=5, tileCity=True)
+    rows, perBlock = 60, 600 // 100
+    renamed = {}
+    for name in tiled.nodes:
+        match = re.match(r'block(\d+)_building(\d+)$', name)
+        if match:
+            block, i = int(match.group(1)), int(match.group(2))
+            renamed['building%d' % (i // perBlock * rows + block * perBlock + i % perBlock)] = name
+    buildings = [name for name in backend.nodes if re.match(r'building\d+$', name)]
+    assert sorted(renamed) == sorted(buildings) and len(buildings) == 720
+    for name in buildings:
+        for field in ('geometry', 'translate', 'scale'):
+            assert tiled.nodes[renamed[name]][field] == backend.nodes[name][field], (name, field)
+        assert tiled.materials[renamed[name]] == backend.materials[name]
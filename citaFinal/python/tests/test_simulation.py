@@ -0,0 +1,266 @@
+import json
+import os
+
+import numpy as np
+
+import mayaFinalCodeNov28 as scene
+
+CITA_FINAL = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# every key the original script set on the heli, car and cams (cm.setKeyframe calls, recorded from the
+# script before its motion was put in closed form), one [objname, attribute, [[frame, value], ...]] per curve
+BASELINE_KEYS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'baselineMoverKeys.json')
+# the mover simulating each of the objects in there
+BASELINE_MOVERS = {
+    'heli': (scene.Helicopter, ()),
+    'car': (scene.Car, ()),
+    'car_cam_left1': (scene.CarCam, ('car_cam_left1',)),
+    'car_cam_right1': (scene.CarCam, ('car_cam_right1',)),
+    'cam_heli_inside1': (scene.HeliInsideCam, ('cam_heli_inside1',)),
+    'cam_heli_side1': (scene.HeliSideCam, ('cam_heli_side1',)),
+}
+
+
+def test_mover_keys_match_the_original_script():
+    with open(BASELINE_KEYS) as f:
+        baseline = json.load(f)
+    simulations = dict((objname, moverClass(*args).simulate())
+                       for objname, (moverClass, args) in BASELINE_MOVERS.items())
+    keyed = sorted((objname, attribute) for objname, channels in simulations.items()
+                   for attribute, channel in channels.items() if channel.segments)
+    assert keyed == sorted((objname, attribute) for objname, attribute, keys in baseline)
+    for objname, attribute, keys in baseline:
+        frames, values = simulations[objname][attribute].keys()
+        expected_frames, expected_values = zip(*keys)
+        assert list(frames) == list(expected_frames), (objname, attribute)
+        np.testing.assert_allclose(values, expected_values, rtol=0, atol=1e-6, err_msg=objname + '.' + attribute)
+
+
+# the closed form agrees with stepping the phase frame by frame like the animation loops did
+def test_kinematic_phase_matches_stepping():
+    rng = np.random.default_rng(3)
+    for i in range(200):
+        pos, vel, accel = rng.uniform(-500, 500), rng.uniform(-20, 20), rng.uniform(-10, 10)
+        velScale = rng.choice([1.0, 0.5, 2.0])
+        phase = scene.KinematicPhase(pos, vel, accel, 24, velScale)
+        stepped_pos, stepped_vel, positions, velocities = pos, vel, [], []
+        for n in range(400):
+            positions.append(stepped_pos)
+            velocities.append(stepped_vel)
+            stepped_vel = stepped_vel + accel * 1.0 / 24
+            stepped_pos = stepped_pos + velScale * stepped_vel * 1.0 / 24
+        np.testing.assert_allclose([phase.positionAt(n) for n in range(400)], positions, rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose([phase.velocityAt(n) for n in range(400)], velocities, rtol=1e-9, atol=1e-9)
+
+        threshold = rng.uniform(-500, 500)
+        for comparison, test in scene.COMPARISONS.items():
+            for quantity, values in (('position', positions), ('velocity', velocities)):
+                start = int(rng.integers(0, 50))
+                expected = next((n for n in range(start, 400) if test(values[n], threshold)), None)
+                found = phase.firstStepWhere(comparison, threshold, start, quantity)
+                if expected is None:
+                    assert found is None or found >= 400
+                else:
+                    assert found == expected, (pos, vel, accel, velScale, comparison, threshold, quantity)
+
+
+# a channel holds its first value before its keys and its last one after them
+def test_channel_values_between_segments():
+    channel = scene.ChannelTrajectory()
+    channel.addSegment(5, 3, scene.KinematicPhase(10.0, 24.0))
+    channel.addSegment(8, 0, scene.KinematicPhase(99.0))
+    channel.addSegment(8, 2, scene.KinematicPhase(0.0, 0.0, 24.0))
+    assert channel.keys() == ([5, 6, 7, 8, 9], [10.0, 11.0, 12.0, 0.0, 1.0 / 24])
+    assert [channel.valueAt(frame) for frame in (1, 5, 7, 8, 20)] == [10.0, 10.0, 12.0, 0.0, 1.0 / 24]
+    assert channel.lastFrame() == 9
+    assert scene.ChannelTrajectory().valueAt(3) is None
+
+
+# what a worker sends back is the keys of the mover's channels
+def test_simulated_mover_keys():
+    for objname, (moverClass, args) in BASELINE_MOVERS.items():
+        channels = moverClass(*args).simulate()
+        arrays = scene.simulateMover(moverClass, args)
+        assert sorted(arrays) == sorted(channels)
+        for attribute, (frames, values) in arrays.items():
+            np.testing.assert_array_equal(frames, channels[attribute].keys()[0])
+            np.testing.assert_array_equal(values, channels[attribute].keys()[1])
+
+
+def test_pool_chunks_cover_every_item():
+    pool = scene.SimulationPool(1)
+    for workers in (1, 3, 8):
+        pool.workers = workers
+        for numItems in (0, 1, 7, 1000, 1025):
+            chunks = pool.chunks(numItems, 100)
+            assert [first for first, size in chunks] == list(np.cumsum([0] + [size for first, size in chunks])[:-1])
+            assert sum(size for first, size in chunks) == numItems
+            assert len(chunks) <= workers
+            assert all(size >= 100 for first, size in chunks[:-1])
+
+
+# a pool of one runs everything right here, its futures are already done
+def test_pool_of_one_runs_in_process():
+    with scene.SimulationPool(1) as pool:
+        assert pool.executor is None
+        future = pool.submit(scene.simulateMover, scene.Car)
+        assert future.done()
+        assert sorted(future.result()) == sorted(scene.Car().simulate())
+
+
+# by default the pool simulates right here, until a job is big enough to be worth starting workers for
+def test_default_pool_starts_workers_for_big_jobs():
+    with scene.SimulationPool() as pool:
+        pool.max_workers = 2
+        assert pool.submit(scene.simulateMover, scene.Car).done()
+        big = scene.SimulationPool.MIN_RAIN_CHUNK * scene.SimulationPool.FAN_OUT_CHUNKS
+        assert pool.chunks(big - 1, scene.SimulationPool.MIN_RAIN_CHUNK) == [(0, big - 1)]
+        assert pool.executor is None
+        assert pool.chunks(big, scene.SimulationPool.MIN_RAIN_CHUNK) == [(0, big // 2), (big // 2, big // 2)]
+        assert pool.executor is not None
+    assert pool.executor is None
+
+
+# workers send back the same keys as simulating right here
+def test_pool_workers_match_in_process():
+    with scene.SimulationPool(2) as pool:
+        assert pool.executor is not None
+        futures = [pool.submit(scene.simulateMover, scene.Helicopter), pool.submit(scene.simulateMover, scene.Car)]
+        for future, moverClass in zip(futures, (scene.Helicopter, scene.Car)):
+            for attribute, (frames, values) in scene.simulateMover(moverClass).items():
+                np.testing.assert_array_equal(future.result()[attribute][0], frames)
+                np.testing.assert_array_equal(future.result()[attribute][1], values)
+
+
+def test_simulation_cache_round_trip(tmp_path):
+    calls = []
+
+    def simulate(frames):
+        calls.append(frames)
+        return {'translateY': (np.arange(frames, dtype=np.float64), np.linspace(0, 1, frames))}
+    first = scene.SimulationCache(str(tmp_path))
+    computed = first.cached('heli', (10,), simulate, 10)
+    again = scene.SimulationCache(str(tmp_path))
+    reloaded = again.cached('heli', (10,), simulate, 10)
+    other = again.cached('heli', (12,), simulate, 12)
+    assert calls == [10, 12]
+    assert (first.computed, again.reloaded, again.computed) == (['heli'], ['heli'], ['heli'])
+    np.testing.assert_array_equal(reloaded['translateY'][1], computed['translateY'][1])
+    assert len(other['translateY'][0]) == 12
+
+
+# every kind of result comes back as it went in, from files numpy reads without unpickling
+def test_simulation_cache_keeps_results_without_pickling(tmp_path):
+    results = {
+        'city': [(-600, -2000, 50, 100, 75, 'building_material_brick'), (600, 3900, 99, 500, 50, 'glass')],
+        'rain': (np.arange(12, dtype=np.float64).reshape(4, 3), np.array([3, 0, 1], dtype=np.int64)),
+        'heli': {'translateY': (np.arange(3.0), np.array([1.5, np.nan, -2.0])), 'visibility': (np.ones(1), np.ones(1))},
+        'flags': {'tolerance': None, 'window': [1, 2.5], 'particles': True, 'seed': np.int64(5)},
+    }
+    cache = scene.SimulationCache(str(tmp_path))
+    for stage, result in results.items():
+        cache.cached(stage, (), lambda: result)
+    assert sorted(path.suffix for path in tmp_path.iterdir()) == ['.npz'] * 4
+    cache = scene.SimulationCache(str(tmp_path))
+    reloaded = dict((stage, cache.cached(stage, (), lambda: None)) for stage in results)
+    assert cache.reloaded == list(results)
+    assert reloaded['city'] == results['city']
+    assert reloaded['flags'] == {'tolerance': None, 'window': [1, 2.5], 'particles': True, 'seed': 5}
+    for stage in ('rain', 'heli'):
+        np.testing.assert_equal(reloaded[stage], results[stage])
+    assert reloaded['rain'][1].dtype == np.int64
+    try:
+        cache.cached('objects', (), lambda: np.array([object()]))
+    except TypeError:
+        pass
+    else:
+        raise AssertionError('arrays of python objects should not be cached')
+
+
+# the helpers every mover goes through are part of every key, so changing one recomputes everything
+def test_cache_keys_follow_the_shared_helpers(monkeypatch):
+    key = scene.SimulationCache().key('Car', scene.moverParams(scene.Car))
+    monkeypatch.setattr(scene, 'runPhases', lambda *args: scene.runPhases(*args))
+    assert scene.SimulationCache().key('Car', scene.moverParams(scene.Car)) != key
+    monkeypatch.undo()
+
+    class SlowerPhase(scene.KinematicPhase):
+        def positionAt(self, n):
+            return scene.KinematicPhase.positionAt(self, n) / 2
+    monkeypatch.setattr(scene, 'KinematicPhase', SlowerPhase)
+    assert scene.SimulationCache().key('Car', scene.moverParams(scene.Car)) != key
+
+
+# with no directory nothing is kept, every stage is computed
+def test_simulation_cache_without_a_directory():
+    cache = scene.SimulationCache()
+    assert cache.cached('car', (), scene.simulateMover, scene.Car) is not None
+    assert cache.cached('car', (), scene.simulateMover, scene.Car) is not None
+    assert (cache.reloaded, cache.computed) == ([], ['car', 'car'])
+
+
+# a change to a mover's code or parameters is a different cache key
+def test_mover_cache_keys_follow_the_mover():
+    class FasterCar(scene.Car):
+        def __init__(self, backend=None):
+            scene.Car.__init__(self, backend)
+            self.carvelz = self.carvelz * 2
+    cache = scene.SimulationCache()
+    assert cache.key('Car', scene.moverParams(scene.Car)) == cache.key('Car', scene.moverParams(scene.Car))
+    assert cache.key('Car', scene.moverParams(scene.Car)) != cache.key('Car', scene.moverParams(FasterCar))
+    assert cache.key('CarCam', scene.moverParams(scene.CarCam, 'left')) != \
+        cache.key('CarCam', scene.moverParams(scene.CarCam, 'right'))
+
+
+# a rerun with the same seed reloads every simulation and builds the same scene
+def test_cached_scene_is_the_computed_scene(tmp_path):
+    backends = []
+    for run in range(2):
+        backends.append(scene.MemorySceneBackend())
+        scene.main(CITA_FINAL, backend=backends[-1], seed=5, workers=1, cacheDirectory=str(tmp_path))
+    assert backends[0].curves == backends[1].curves
+    assert backends[0].nodes == backends[1].nodes
+
+
+# a window keeps the keys inside it, plus one at its first frame holding the value there
+def test_windowed_keys_are_the_keys_in_the_window():
+    for moverClass, args in ((scene.Helicopter, ()), (scene.Car, ()), (scene.HeliSideCam, ('cam',))):
+        full = scene.simulateMover(moverClass, args)
+        windowed = scene.simulateMover(moverClass, args, (40, 90))
+        for attribute, (frames, values) in full.items():
+            window_frames, window_values = windowed[attribute]
+            inside = (frames >= 40) & (frames <= 90)
+            np.testing.assert_array_equal(window_frames[window_frames != 40], frames[inside & (frames != 40)])
+            np.testing.assert_array_equal(window_values[window_frames != 40], values[inside & (frames != 40)])
+            if len(frames):
+                # the value keyed last at or before frame 40 (the first one, if it's keyed later)
+                held = max(np.searchsorted(frames, 40, side='right') - 1, 0)
+                assert (window_frames[0], window_values[0]) == (40, values[held])
+
+
+# picking a simulation up from any saved checkpoint keys the same as simulating it from frame 1
+def test_resuming_from_saved_checkpoints(tmp_path):
+    for moverClass in (scene.Helicopter, scene.Car):
+        checkpoints = []
+        full = scene.channelKeys(moverClass().simulate(checkpoints=checkpoints))
+        assert [checkpoint['phase'] for checkpoint in checkpoints][-1] == 'done'
+        path = str(tmp_path / (moverClass.__name__ + '.json'))
+        scene.saveCheckpoints(path, checkpoints)
+        loaded = scene.loadCheckpoints(path)
+        assert len(loaded) == len(checkpoints)
+        for checkpoint in loaded:
+            resumed = scene.channelKeys(moverClass().simulate(resume=checkpoint))
+            assert sorted(resumed) == sorted(full)
+            for attribute, (frames, values) in full.items():
+                np.testing.assert_array_equal(resumed[attribute][0], frames)
+                np.testing.assert_allclose(resumed[attribute][1], values, rtol=0, atol=1e-9)
+
+
+def test_checkpoint_of_another_mover_is_rejected():
+    checkpoints = []
+    scene.Car().simulate(checkpoints=checkpoints)
+    try:
+        scene.Helicopter().simulate(resume=checkpoints[1])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('a car checkpoint should not restore a helicopter')
@@ -0,0 +1,129 @@
+import numpy as np
+
+import mayaFinalCodeNov28 as scene
+
+
+# boxes of every size, from ones inside a cell to ones over many, some of them overlapping
+def randomBoxes(rng, count):
+    mins = rng.uniform([-1000, 0, -3000], [1000, 300, 3000], size=(count, 3))
+    sizes = rng.exponential([60, 200, 60], size=(count, 3))
+    return mins, mins + sizes
+
+
+def filledIndex(rng, count=600, cellSize=200):
+    index = scene.SpatialIndex(cellSize)
+    mins, maxs = randomBoxes(rng, count)
+    kinds = np.array(['building', 'streetlight', 'raindrop'])[rng.integers(0, 3, count)]
+    names = ['box%d' % i for i in range(count)]
+    for kind in ('building', 'streetlight', 'raindrop'):
+        boxes = np.flatnonzero(kinds == kind)
+        # some a box at a time, the rest all at once
+        for i in boxes[:5]:
+            index.add(names[i], mins[i], maxs[i], kind)
+        index.addBoxes([names[i] for i in boxes[5:]], mins[boxes[5:]], maxs[boxes[5:]], kind)
+    order = [int(name[3:]) for name in index.names]
+    return index, mins[order], maxs[order], kinds[order]
+
+
+def distances(point, mins, maxs):
+    gaps = np.maximum(mins - point, 0) + np.maximum(point - maxs, 0)
+    return np.sqrt((gaps * gaps).sum(axis=1))
+
+
+def test_within_radius_matches_brute_force():
+    rng = np.random.default_rng(1)
+    for cellSize in (50, 200, 5000):
+        index, mins, maxs, kinds = filledIndex(rng, cellSize=cellSize)
+        for i in range(50):
+            point = rng.uniform([-1200, -50, -3200], [1200, 400, 3200])
+            radius = rng.uniform(0, 800)
+            kind = [None, 'building', ['streetlight', 'raindrop']][i % 3]
+            wanted = np.ones(len(mins), dtype=bool) if kind is None else np.isin(kinds, kind)
+            gap = distances(point, mins, maxs)
+            boxes = np.flatnonzero(wanted & (gap <= radius))
+            expected = [index.names[box] for box in boxes[np.argsort(gap[boxes], kind='stable')]]
+            assert index.withinRadius(point, radius, kind) == expected
+
+
+# planes (inside >= 0) and corners of a frustum at position looking along forward
+def frustum(position, forward, up, tangents, clipping):
+    forward = forward / np.linalg.norm(forward)
+    right = np.cross(forward, up)
+    right /= np.linalg.norm(right)
+    up = np.cross(right, forward)
+    normals = np.array([forward, -forward, tangents[0] * forward - right, tangents[0] * forward + right,
+                        tangents[1] * forward - up, tangents[1] * forward + up])
+    offsets = -normals.dot(position)
+    offsets[:2] += [-clipping[0], clipping[1]]
+    corners = [position + depth * (forward + x * tangents[0] * right + y * tangents[1] * up)
+               for depth in clipping for x in (-1, 1) for y in (-1, 1)]
+    return np.column_stack([normals, offsets]), np.array(corners)
+
+
+def test_in_frustum_matches_brute_force():
+    rng = np.random.default_rng(2)
+    index, mins, maxs, kinds = filledIndex(rng)
+    # every corner of every box, to test against each plane
+    corners = np.stack([np.where(np.array([(i >> axis) & 1 for axis in range(3)], dtype=bool), maxs, mins)
+                        for i in range(8)], axis=1)
+    for i in range(40):
+        position = rng.uniform([-500, 0, -3000], [500, 400, 3000])
+        planes, frustum_corners = frustum(position, rng.normal(size=3), (0, 1, 0), rng.uniform(0.1, 1.5, 2),
+                                          (0.1, rng.uniform(100, 4000)))
+        # a box is outside when all its corners are behind one of the planes
+        inside = ((corners.dot(planes[:, :3].T) + planes[:, 3]).max(axis=1) >= 0).all(axis=1)
+        names = np.array(index.names)
+        assert sorted(index.inFrustum(planes)) == sorted(names[inside].tolist())
+        # the corners only rule out cells: what's left is every box inside that overlaps their bounds, and
+        # may be some of the others the planes alone can't rule out
+        overlaps = ((mins <= frustum_corners.max(axis=0)) & (maxs >= frustum_corners.min(axis=0))).all(axis=1)
+        for kind in (None, 'raindrop'):
+            wanted = inside if kind is None else inside & (kinds == kind)
+            found = set(index.inFrustum(planes, frustum_corners, kind))
+            assert set(names[wanted & overlaps]) <= found <= set(names[wanted])
+
+
+def test_raycast_matches_brute_force():
+    rng = np.random.default_rng(3)
+    for cellSize in (50, 200, 5000):
+        index, mins, maxs, kinds = filledIndex(rng, cellSize=cellSize)
+        for i in range(100):
+            origin = rng.uniform([-1500, 0, -3500], [1500, 400, 3500])
+            direction = rng.normal(size=3)
+            if i % 10 == 0:
+                direction[[0, 1, 2][i % 3]] = 0  # along a grid axis
+            maxDistance = [np.inf, rng.uniform(0, 2000)][i % 2]
+            kind = [None, 'building'][i % 2]
+            wanted = np.ones(len(mins), dtype=bool) if kind is None else kinds == kind
+            unit = direction / np.linalg.norm(direction)
+            enter, leave = index.slabs(origin, unit, mins, maxs)
+            enter = np.maximum(enter, 0)
+            hit = wanted & (enter <= leave) & (enter <= maxDistance)
+            found = index.raycast(origin, direction, maxDistance, kind)
+            if not hit.any():
+                assert found is None
+                continue
+            nearest = enter[hit].min()
+            name, distance = found
+            assert abs(distance - nearest) < 1e-9
+            # boxes the origin is inside of are all hit at 0
+            assert name in [index.names[box] for box in np.flatnonzero(hit & (enter <= nearest + 1e-9))]
+
+
+# boxes added after a query are in the next one
+def test_boxes_added_between_queries():
+    index = scene.SpatialIndex(100)
+    index.add('a', (0, 0, 0), (10, 10, 10), 'building')
+    assert index.withinRadius((0, 0, 0), 50) == ['a']
+    index.add('b', (20, 0, 0), (30, 10, 10), 'raindrop')
+    assert index.withinRadius((0, 0, 0), 50) == ['a', 'b']
+    assert index.withinRadius((0, 0, 0), 50, 'raindrop') == ['b']
+    assert index.raycast((-100, 5, 5), (1, 0, 0)) == ('a', 100.0)
+    assert index.raycast((-100, 5, 5), (1, 0, 0), kinds='raindrop') == ('b', 120.0)
+    assert index.raycast((-100, 50, 5), (1, 0, 0)) is None
+    try:
+        index.raycast((0, 0, 0), (0, 0, 0))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('a ray without a direction should be rejected')
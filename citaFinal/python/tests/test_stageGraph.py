@@ -0,0 +1,110 @@
+import concurrent.futures
+import threading
+import time
+
+import mayaFinalCodeNov28 as scene
+
+
+# builds run on the calling thread in the order the stages were added, whichever prepare finishes first
+def test_builds_in_order_on_the_main_thread():
+    graph = scene.StageGraph(threads=4)
+    built = []
+    main = threading.get_ident()
+    graph.add('slow', lambda prepared: built.append((prepared, threading.get_ident())),
+              prepare=lambda: time.sleep(0.05) or 'slow')
+    graph.add('fast', lambda prepared: built.append((prepared, threading.get_ident())), prepare=lambda: 'fast')
+    graph.add('plain', lambda: built.append(('plain', threading.get_ident())))
+    graph.run()
+    assert built == [('slow', main), ('fast', main), ('plain', main)]
+
+
+def test_prepare_waits_for_the_stages_it_comes_after():
+    graph = scene.StageGraph()
+    graph.add('paths', prepare=lambda: [1, 2, 3])
+    graph.add('sum', lambda total: total, after=['paths'], prepare=lambda: sum(graph.result('paths')))
+    graph.run()
+    assert graph.result('sum') == 6
+
+
+def test_stage_has_to_come_after_stages_already_added():
+    graph = scene.StageGraph()
+    try:
+        graph.add('city', after=['cameraPaths'])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('adding a stage after a missing one should fail')
+
+
+def test_prepare_errors_reach_run():
+    graph = scene.StageGraph()
+    graph.add('broken', prepare=lambda: 1 / 0)
+    graph.add('after', lambda prepared: prepared, after=['broken'], prepare=lambda: 2)
+    try:
+        graph.run()
+    except ZeroDivisionError:
+        pass
+    else:
+        raise AssertionError('the prepare error should be raised by run')
+
+
+def test_critical_path_follows_the_slowest_chain():
+    graph = scene.StageGraph(threads=4)
+    graph.add('quick', prepare=lambda: None)
+    graph.add('slow', prepare=lambda: time.sleep(0.1))
+    graph.add('after slow', lambda prepared: None, after=['slow'], prepare=lambda: time.sleep(0.05))
+    graph.add('last', lambda: None)
+    graph.run()
+    assert graph.criticalPath() == ['slow', 'after slow', 'last']
+    assert 'critical path (*): slow -> after slow -> last' in graph.report()
+
+
+def test_prepares_are_profiled_on_their_own_track():
+    profiler = scene.StageProfiler(scene.MemorySceneBackend(), traceMemory=True)
+    graph = scene.StageGraph(profiler)
+    graph.add('rain', lambda drops: None, prepare=lambda: [0] * 100000)
+    graph.run()
+    profiler.stop()
+    stages = dict((stage['stage'], stage) for stage in profiler.report())
+    assert set(stages) == {'rain.prepare', 'rain'}
+    assert stages['rain.prepare']['thread'] != stages['rain']['thread']
+    assert stages['rain.prepare']['peak_memory_bytes'] > 0
+
+
+# stages preparing side by side can ask for the same cam at once, it's still only simulated once
+def test_camera_simulation_submitted_once(monkeypatch):
+    team = scene.CameraTeam('', 'Mac', scene.MemorySceneBackend())
+    submitted = []
+
+    def submitMover(pool, moverClass, args=(), frameWindow=None):
+        submitted.append(moverClass)
+        time.sleep(0.01)
+        future = concurrent.futures.Future()
+        future.set_result({})
+        return future
+    monkeypatch.setattr(team.cache, 'submitMover', submitMover)
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda i: team.simulation(scene.CarCam), range(8)))
+    assert submitted == [scene.CarCam]
+
+
+def test_cache_saves_side_by_side(tmp_path):
+    cache = scene.SimulationCache(str(tmp_path))
+    key = cache.key('stage', ())
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda i: cache.save('stage', key, list(range(10000))), range(16)))
+    assert cache.load('stage', key) == list(range(10000))
+    assert [path.name for path in tmp_path.iterdir()] == ['stage-%s.npz' % key]
+
+
+# a result that can't be saved fails its future, instead of being lost in a callback
+def test_cache_save_errors_fail_the_future(tmp_path):
+    cache = scene.SimulationCache(str(tmp_path))
+    future = cache.submit(scene.SimulationPool(1), 'stage', (), lambda: threading.Lock())
+    try:
+        future.result()
+    except TypeError:
+        pass
+    else:
+        raise AssertionError('pickling a lock should fail')
+    assert list(tmp_path.iterdir()) == []
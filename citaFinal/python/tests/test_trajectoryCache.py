@@ -0,0 +1,141 @@
+import struct
+
+import numpy as np
+
+import mayaFinalCodeNov28 as scene
+
+
+# (header fields, [(objname, mask)], (frames, objects, 6) data) of a trajectory cache file, read the way
+# the layout in TrajectoryCacheWriter's comment describes it
+def readCache(path):
+    with open(path, 'rb') as f:
+        contents = f.read()
+    header = scene.TrajectoryCacheWriter.HEADER.unpack_from(contents)
+    (magic, version, numChannels, numObjects, numFrames, firstFrame, framesPerChunk, FPS, tableOffset,
+     dataOffset) = header
+    objects, offset = [], tableOffset
+    for i in range(numObjects):
+        length, = struct.unpack_from('<H', contents, offset)
+        objects.append((contents[offset + 2:offset + 2 + length].decode('utf-8'), contents[offset + 2 + length]))
+        offset += 3 + length
+    data = np.frombuffer(contents, dtype='<f4', offset=dataOffset).reshape(numFrames, numObjects, numChannels)
+    return header, objects, data
+
+
+def writeCache(path, frames, objnames, masks=None, firstFrame=1, chunkBytes=1 << 26):
+    with scene.TrajectoryCacheWriter(path, objnames, masks, firstFrame, 24, chunkBytes) as writer:
+        # a frame at a time, then the rest at once
+        writer.addFrames(frames[0])
+        writer.addFrames(frames[1:])
+
+
+# frames written in chunks of any size end up one after another in the file
+def test_frames_are_written_in_order(tmp_path):
+    rng = np.random.default_rng(5)
+    objnames = ['heli', 'car'] + ['raindrop%d' % i for i in range(1, 31)]
+    frames = rng.normal(size=(50, len(objnames), 6)).astype(np.float32)
+    masks = [63, 7] + [7] * 30
+    for chunkBytes in (1 << 26, 1000, 1):
+        path = str(tmp_path / ('%d.traj' % chunkBytes))
+        writeCache(path, frames, objnames, masks, firstFrame=10, chunkBytes=chunkBytes)
+        header, objects, data = readCache(path)
+        assert header[:6] == (b'CITATRAJ', 1, 6, len(objnames), 50, 10)
+        assert header[-1] % scene.TrajectoryCacheWriter.ALIGNMENT == 0
+        assert objects == list(zip(objnames, masks))
+        np.testing.assert_array_equal(data, frames)
+
+
+# a writer that knows how many frames are coming only buffers that many, however big its chunks may be
+def test_chunk_is_no_bigger_than_the_file(tmp_path):
+    path = str(tmp_path / 'small.traj')
+    with scene.TrajectoryCacheWriter(path, ['heli', 'car'], numFrames=30) as writer:
+        assert writer.chunk.shape == (30, 2, 6)
+        writer.addFrames(np.ones((30, 2, 6)))
+    assert readCache(path)[0][6] == 30
+    with scene.TrajectoryCacheWriter(path, ['heli', 'car'], chunkBytes=480, numFrames=30) as writer:
+        assert writer.chunk.shape == (10, 2, 6)
+
+
+# the file only shows up at path once it's complete, an error while writing leaves the old one in place
+def test_cache_is_replaced_only_when_complete(tmp_path):
+    path = str(tmp_path / 'scene.traj')
+    frames = np.arange(4 * 2 * 6, dtype=np.float32).reshape(4, 2, 6)
+    with scene.TrajectoryCacheWriter(path, ['heli', 'car']) as writer:
+        writer.addFrames(frames[:2])
+        assert [entry.name for entry in tmp_path.iterdir()] == ['scene.traj.tmp']
+        writer.addFrames(frames[2:])
+    assert [entry.name for entry in tmp_path.iterdir()] == ['scene.traj']
+    try:
+        with scene.TrajectoryCacheWriter(path, ['heli', 'car']) as writer:
+            writer.addFrames(-frames)
+            raise KeyboardInterrupt
+    except KeyboardInterrupt:
+        pass
+    assert [entry.name for entry in tmp_path.iterdir()] == ['scene.traj']
+    np.testing.assert_array_equal(readCache(path)[2], frames)
+
+
+# every drop holds its last key once it lands, every mover plays its keys
+def test_exported_scene_matches_the_simulations(tmp_path):
+    path = str(tmp_path / 'scene.traj')
+    scene_random = scene.SceneRandom(3)
+    scene.exportTrajectoryCache(path, scene_random, numRaindrops=40, chunkBytes=4096)
+    solver = scene.RainSolver(scene_random.rainStartPositions(40), scene_random.rainAcceleration())
+    trajectories, landing_frames = solver.solve()
+    heli = scene.Helicopter().simulate()
+    header, objects, data = readCache(path)
+    assert [objname for objname, mask in objects][:2] == ['heli', 'car']
+    drops = data[:, 6:, :3]
+    for i, landed in enumerate(landing_frames):
+        np.testing.assert_allclose(drops[:landed, i], trajectories[:landed, i], rtol=1e-6)
+        np.testing.assert_allclose(drops[landed:, i], np.broadcast_to(trajectories[landed - 1, i],
+                                                                      drops[landed:, i].shape), rtol=1e-6)
+    assert np.isnan(data[:, 6:, 3:]).all()
+    for c, channel in enumerate(scene.TRAJECTORY_CHANNELS):
+        if objects[0][1] & (1 << c):
+            values = [heli[channel].valueAt(frame) for frame in range(1, len(data) + 1)]
+            np.testing.assert_allclose(data[:, 0, c], values, rtol=1e-6, atol=1e-4)
+
+
+# the reader hands back what was written, whole or by window
+def test_reader_round_trip(tmp_path):
+    rng = np.random.default_rng(5)
+    objnames = ['heli', 'car'] + ['raindrop%d' % i for i in range(1, 31)]
+    frames = rng.normal(size=(50, len(objnames), 6)).astype(np.float32)
+    path = str(tmp_path / 'round.traj')
+    writeCache(path, frames, objnames, [63, 7] + [7] * 30, firstFrame=10, chunkBytes=1000)
+    with scene.TrajectoryCacheReader(path) as reader:
+        assert reader.objnames == objnames
+        assert (reader.first_frame, reader.last_frame, reader.FPS) == (10, 59, 24)
+        assert reader.animatedChannels('car') == ['translateX', 'translateY', 'translateZ']
+        np.testing.assert_array_equal(reader.window(), frames)
+        np.testing.assert_array_equal(reader.window(20, 29), frames[10:20])
+        np.testing.assert_array_equal(reader.frameNumbers(55, 100), np.arange(55, 60))
+        np.testing.assert_array_equal(reader.window(55, 100, channels=['rotateZ', 'translateX']),
+                                      frames[45:][:, :, [5, 0]])
+        assert reader.window(70, 80).shape == (0, len(objnames), 6)
+
+
+def test_object_selection(tmp_path):
+    objnames = ['heli', 'car', 'raindrop1', 'raindrop2', 'raindrop3']
+    frames = np.arange(3 * 5 * 6, dtype=np.float32).reshape(3, 5, 6)
+    path = str(tmp_path / 'objects.traj')
+    writeCache(path, frames, objnames)
+    with scene.TrajectoryCacheReader(path) as reader:
+        assert reader.objectSelection('raindrop*') == slice(2, 5, 1)
+        view = reader.window(objnames='raindrop*', channels=['translateY'])
+        assert isinstance(view, np.memmap)
+        np.testing.assert_array_equal(view, frames[:, 2:, 1:2])
+        np.testing.assert_array_equal(reader.window(objnames=['raindrop2', 'heli']), frames[:, [3, 0]])
+        assert reader.window(objnames='nothing*').shape == (3, 0, 6)
+
+
+def test_reader_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.traj'
+    path.write_bytes(b'\0' * 256)
+    try:
+        scene.TrajectoryCacheReader(str(path))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('a file without the magic should be rejected')